@@ -1,30 +1,101 @@
-from pprint import PrettyPrinter
+from collections import deque
+from itertools import islice
+from optparse import OptionParser
+from pprint import pformat
+import hashlib
+import json
+import multiprocessing
+import os.path
 import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'testbed'))
+from simulation.scenarios import ScenarioWriter, SUFFIX
 
 DOGSIZE = (1.5, 1.5)
 CATRADIUS = 0.75
 
-def gen_data(num=100, dognum=4, runs=50, ais=(1,2,3), field=(16.,16.), pct_test=0.33):
+# How many scenarios are made from each seed derived from the master seed.
+# Changing it changes the scenarios a master seed gives.
+BLOCK = 256
+
+def iter_data(num=100, dognum=4, runs=50, ais=(1,2,3), field=(16.,16.),
+              rand=random):
     global DOGSIZE, CATRADIUS
-    data = []
     dogrange = ((DOGSIZE[0]/2.0, field[0]-DOGSIZE[0]/2.0),
                 (DOGSIZE[1]/2.0, (field[1]-DOGSIZE[1])/2.0))
     catrange = (CATRADIUS, field[0]-CATRADIUS)
     caty = field[1]-CATRADIUS
 
-    for i in range(num):
+    for i in xrange(num):
         dogpos = []
         for j in range(dognum):
-            dogpos.append((round(random.uniform(dogrange[0][0],
-                                                dogrange[0][1]), 2),
-                           round(random.uniform(dogrange[1][0],
-                                                dogrange[1][1]), 2)))
+            dogpos.append((round(rand.uniform(dogrange[0][0],
+                                              dogrange[0][1]), 2),
+                           round(rand.uniform(dogrange[1][0],
+                                              dogrange[1][1]), 2)))
         cats = []
         for j in range(runs):
-            cats.append((round(random.uniform(catrange[0], catrange[1]), 2),
+            cats.append((round(rand.uniform(catrange[0], catrange[1]), 2),
                          caty))
-        data.append((dogpos, ais, cats))
-    amount_test = int(round(num*pct_test))
+        yield (dogpos, ais, cats)
+
+def block_seed(seed, block):
+    """Derive the seed of a block of scenarios from the master seed.
+    """
+    return int(hashlib.sha1("%d:%d" % (seed, block)).hexdigest(), 16)
+
+def gen_block(task):
+    """Make a block of scenarios and render them in the given formats.
+
+    Returns a list of (scenario, {format: text}). Run in the worker
+    processes of iter_parallel.
+    """
+    seed, block, count, formats, params = task
+    rand = random.Random(block_seed(seed, block))
+    rendered = []
+    for scenario in iter_data(count, rand=rand, **params):
+        texts = dict((fmt, FORMATTERS[fmt](scenario)) for fmt in formats)
+        rendered.append((scenario, texts))
+    return rendered
+
+def iter_parallel(num, seed, workers=1, formats=(), **params):
+    """Generate scenarios in worker processes, in a reproducible order.
+
+    The scenarios are made in blocks of BLOCK, each from its own seed
+    derived from the master seed, so they are the same for any number of
+    workers. They are yielded in order as (scenario, {format: text}), with
+    only a few blocks ahead of the consumer kept in memory. Keyword
+    arguments are passed on to iter_data.
+    """
+    tasks = ((seed, block, min(BLOCK, num - block*BLOCK), formats, params)
+             for block in xrange((num + BLOCK - 1)//BLOCK))
+    if workers <= 1:
+        for task in tasks:
+            for item in gen_block(task):
+                yield item
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(gen_block, (task,)))
+            if len(pending) > 2*workers:
+                for item in pending.popleft().get():
+                    yield item
+        while pending:
+            for item in pending.popleft().get():
+                yield item
+    finally:
+        pool.terminate()
+
+def test_count(num, pct_test):
+    return int(round(num*pct_test))
+
+def gen_data(num=100, dognum=4, runs=50, ais=(1,2,3), field=(16.,16.), pct_test=0.33):
+    data = list(iter_data(num, dognum, runs, ais, field))
+    amount_test = test_count(num, pct_test)
     test_data = data[:amount_test]
     train_data = data[amount_test:]
     return train_data, test_data
@@ -36,38 +107,238 @@ def make_cons(data, cons_name="cons", nil_name="nil", separator=" ", prefix=""):
     strarr.append(prefix + nil_name + (")"*len(data)))
     return separator.join(strarr)
 
-def make_sml(dataset, prefix=""):
+def sml_scenario(datapoint):
     dogsize_str = "size%s" % (DOGSIZE,)
     catradius_str = "radius(%s)" % CATRADIUS
-    text = []
-    for datapoint in dataset:
-        dogs, ais, cats = datapoint
-        dogs = ["rect(point%s, %s)" % (dogpos, dogsize_str)
-                for dogpos in dogs]
-        cats = ["circle(point%s, %s)" % (catpos, catradius_str)
-                for catpos in cats]
-        text.append("(\n\t%s,\n\t%s,\n%s\n)" %
-        (
-                make_cons(dogs, "entity_cons", "entity_nil"),
-                make_cons(ais, "cat_ai_cons", "cat_ai_nil"),
-                make_cons(cats, "entity_cons", "entity_nil", separator="\n", prefix="\t"),
-        ))
+    dogs, ais, cats = datapoint
+    dogs = ["rect(point%s, %s)" % (dogpos, dogsize_str)
+            for dogpos in dogs]
+    cats = ["circle(point%s, %s)" % (catpos, catradius_str)
+            for catpos in cats]
+    return ("(\n\t%s,\n\t%s,\n%s\n)" %
+    (
+            make_cons(dogs, "entity_cons", "entity_nil"),
+            make_cons(ais, "cat_ai_cons", "cat_ai_nil"),
+            make_cons(cats, "entity_cons", "entity_nil", separator="\n", prefix="\t"),
+    ))
+
+def make_sml(dataset, prefix=""):
+    text = [sml_scenario(datapoint) for datapoint in dataset]
     return prefix + "[\n" + ",\n".join(text) + "\n]"
 
-py_file = open("dogs.py", "w+")
-sml_file = open("dogs.sml", "w+")
-training_data, test_data = gen_data()
+# The functions giving the text of a scenario in each text format
+FORMATTERS = {"sml": sml_scenario, "py": pformat}
+
+
+class ShardWriter(object):
+    """Streams scenarios to text files of a bounded size.
+
+    The scenarios are written in sections, each bound to a name such as
+    Inputs. A section that does not fit in one file is continued in the next
+    under the name with a part number added, e.g. Inputs_1, so that every
+    file is complete by itself. Files are only split between scenarios, and
+    hold at least one. Without a size, everything goes into one file.
+    """
+
+    def __init__(self, stem, suffix, formatter, begin, separator, end,
+                 max_bytes=0):
+        """Set up the writer, without creating any file.
+
+        Arguments:
+        - `stem`: The path of the files, without the suffix.
+        - `suffix`: The file name extension, e.g. '.sml'.
+        - `formatter`: Function giving the text of a scenario.
+        - `begin`: The text starting a section, with %s for its name.
+        - `separator`: The text between the scenarios of a section.
+        - `end`: The text ending a section.
+        - `max_bytes`: The most bytes in a file, 0 for no limit.
+        """
+        self.stem = stem
+        self.suffix = suffix
+        self.formatter = formatter
+        self.begin = begin
+        self.separator = separator
+        self.end = end
+        self.max_bytes = max_bytes
+        self.shards = []
+        self._file = None
+        self._shard = None
+        self._section = None
+        self._part = None
+
+    def _open(self, ):
+        if self.max_bytes:
+            path = "%s-%03d%s" % (self.stem, len(self.shards), self.suffix)
+        else:
+            path = self.stem + self.suffix
+        self._file = open(path, "w")
+        self._shard = {"file": os.path.basename(path), "bytes": 0,
+                       "sections": []}
+        self.shards.append(self._shard)
+
+    def _write(self, text):
+        self._file.write(text)
+        self._shard["bytes"] += len(text)
+
+    def _fits(self, size):
+        return (not self.max_bytes or not self._shard["sections"] or
+                self._shard["bytes"] + size + len(self.end) <= self.max_bytes)
+
+    def _beginPart(self, ):
+        name, split, part = self._section
+        if part:
+            name = "%s_%d" % (name, part)
+        self._part = {"name": name, "split": split, "scenarios": 0}
+        self._shard["sections"].append(self._part)
+        self._write(self.begin % name)
+
+    def _nextShard(self, ):
+        self._write(self.end)
+        self._file.close()
+        self._open()
+        self._section[2] += 1
+        self._beginPart()
+
+    def startSection(self, name, split):
+        """End the current section and start a new one.
+
+        Arguments:
+        - `name`: The name of the section.
+        - `split`: Which scenarios it holds, 'training' or 'test'.
+        """
+        if self._section is not None:
+            self._write(self.end)
+        if self._file is None:
+            self._open()
+        elif not self._fits(len(self.begin % name)):
+            self._file.close()
+            self._open()
+        self._section = [name, split, 0]
+        self._beginPart()
+
+    def write(self, scenario, text=None):
+        """Write a scenario to the current section.
+
+        Arguments:
+        - `scenario`: The (dog positions, cat AI ids, cat positions).
+        - `text`: The text of the scenario, if it has already been made.
+        """
+        if text is None:
+            text = self.formatter(scenario)
+        if self._part["scenarios"]:
+            if not self._fits(len(self.separator) + len(text)):
+                self._nextShard()
+            else:
+                text = self.separator + text
+        self._write(text)
+        self._part["scenarios"] += 1
+
+    def close(self, ):
+        """End the current section and close the file.
+        """
+        if self._section is not None:
+            self._write(self.end)
+            self._section = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def open_scenarios(stem, split, scenario):
+    """Create the scenario file of a split, sized for the given scenario.
+    """
+    scn = ScenarioWriter("%s-%s%s" % (stem, split, SUFFIX),
+                         *[len(part) for part in scenario], quantize=True)
+    if split == "test":
+        scn.startTest()
+    return scn
+
+def write_dataset(stem, data, amount_test, max_bytes=0, py=False,
+                  rendered=False, seed=None):
+    """Stream scenarios to the output files and write their manifest.
+
+    The first amount_test scenarios are the test scenarios, the rest the
+    training scenarios. They go to a scenario file for each, to SML files
+    and optionally to Python files, split into files of at most max_bytes.
+    The manifest, stem + '.json', lists every file with the sections in it,
+    and the master seed if given. Returns the manifest.
 
-pp = PrettyPrinter(stream=py_file)
+    With rendered, data holds (scenario, {format: text}) as iter_parallel
+    makes, and the texts are written as they are.
+    """
+    writers = [("sml", ShardWriter(stem, ".sml", FORMATTERS["sml"],
+                                   "val %s = [\n", ",\n", "\n]\n\n",
+                                   max_bytes))]
+    if py:
+        writers.append(("py", ShardWriter(stem, ".py", FORMATTERS["py"],
+                                          "%s = [\n", ",\n", "]\n\n",
+                                          max_bytes)))
+    names = {"sml": {"test": "Test_inputs", "training": "Inputs"},
+             "py": {"test": "test_data", "training": "training_data"}}
+    counts = {}
+    shards = []
+    data = iter(data)
+    for split, count in (("test", amount_test), ("training", None)):
+        for fmt, writer in writers:
+            writer.startSection(names[fmt][split], split)
+        scn = None
+        counts[split] = 0
+        for item in islice(data, count):
+            if rendered:
+                scenario, texts = item
+            else:
+                scenario, texts = item, {}
+            if scn is None:
+                scn = open_scenarios(stem, split, scenario)
+            scn.write(scenario)
+            for fmt, writer in writers:
+                writer.write(scenario, texts.get(fmt))
+            counts[split] += 1
+        if scn is None:
+            scn = open_scenarios(stem, split, ((), (), ()))
+        shards.append({"file": os.path.basename(scn.path), "format": "scn",
+                       "sections": [{"name": split, "split": split,
+                                     "scenarios": counts[split]}]})
+        scn.close()
+    for fmt, writer in writers:
+        writer.close()
+        for shard in writer.shards:
+            shard["format"] = fmt
+            shards.append(shard)
+    manifest = {"version": 1, "max_bytes": max_bytes, "scenarios": counts,
+                "shards": shards}
+    if seed is not None:
+        manifest["seed"] = seed
+        manifest["block"] = BLOCK
+    with open(stem + ".json", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
 
-py_file.write("training_data = ")
-pp.pprint(training_data)
+def main():
+    parser = OptionParser()
+    parser.add_option("-o", "--output", default="dogs",
+                      help="path of the output files, without the suffix")
+    parser.add_option("-n", "--num", type="int", default=100,
+                      help="number of scenarios")
+    parser.add_option("--shard-size", type="int", default=0,
+                      help="most bytes in each .sml and .py file, "
+                      "0 for no limit")
+    parser.add_option("--py", action="store_true", default=False,
+                      help="also write the scenarios to .py files")
+    parser.add_option("-s", "--seed", type="int", default=None,
+                      help="master seed, random if not given")
+    parser.add_option("-j", "--workers", type="int",
+                      default=multiprocessing.cpu_count(),
+                      help="number of worker processes [default: %default]")
+    options, args = parser.parse_args()
 
-py_file.write("\ntest_data = ")
-pp.pprint(test_data)
-py_file.close()
+    pct_test = 0.33
+    seed = options.seed
+    if seed is None:
+        seed = random.randrange(2**32)
+    formats = ("sml", "py") if options.py else ("sml",)
+    data = iter_parallel(options.num, seed, options.workers, formats)
+    write_dataset(options.output, data, test_count(options.num, pct_test),
+                  options.shard_size, options.py, rendered=True, seed=seed)
 
-sml_file.write(make_sml(training_data, prefix="val Inputs = "))
-sml_file.write("\n\n")
-sml_file.write(make_sml(test_data, prefix="val Test_inputs = "))
-sml_file.close()
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,21 @@
 import pygame
-import os.path
 import math
+import time
 import pprint
 from pygame.locals import *
 
 from simulation import Simulation
 import simulation.ai as ai
+from simulation.shared import SimulationRunner
 import game.datalogger
+from game.assets import AssetCache
 
-def load_png(name):
-	""" Load image and return image object"""
-	fullname = os.path.join('img', name)
-	try:
-		image = pygame.image.load(fullname)
-		if image.get_alpha() is None:
-			image = image.convert()
-		else:
-			image = image.convert_alpha()
-	except pygame.error, message:
-        	print 'Cannot load image:', fullname
-        	raise SystemExit, message
-	return image
-
-
-class GameEntity(object):
+
+class GameEntity(pygame.sprite.Sprite):
     """An entity in the game.
 
-    Just a simple container for the entity's image, current game position and
-    movement target.
+    Just a simple sprite holding the entity's image, current game position and
+    movement target, and the outline drawn around it.
 
     Game position can differ from simulation position, as the simulation
     position is only updated every n game ticks, whereas the game position is
@@ -35,25 +23,66 @@ class GameEntity(object):
     previous and current sim positions.
     """
 
-    def __init__(self, image, position):
+    def __init__(self, image, position, outline_size=None,
+                 outline_radius=None):
         """Initialize the entity with its image
 
         Arguments:
-        - `image`:
+        - `image`: The surface of the image, shared with other entities.
         - `position`:
+        - `outline_size`: Size of a rectangle to outline the entity with.
+        - `outline_radius`: Radius of a circle to outline the entity with.
         """
-        self.image = load_png(image)
+        super(GameEntity, self).__init__()
+        self.image = image
         self.position = list(position)
         self.current_target = position
         self.old_target = position
         self.rect = self.image.get_rect()
         self.rect.center = self.position
+        self.outline_size = outline_size
+        self.outline_radius = outline_radius
+        # Where the entity was last drawn, and if it must be drawn again
+        self.drawn = None
+        self.changed = True
 
     def getRect(self, ):
         """Get the entity's rect.
         """
         return self.rect
 
+    def getBounds(self, ):
+        """Get the rect covering the entity and its outline.
+        """
+        bounds = self.rect.copy()
+        if self.outline_size is not None:
+            bounds.union_ip(self._outlineRect())
+        if self.outline_radius is not None:
+            radius = self.outline_radius
+            bounds.union_ip(pygame.Rect(self.rect.centerx - radius,
+                                        self.rect.centery - radius,
+                                        2*radius, 2*radius))
+        # Leave room for the outlines' pixels on the edges
+        return bounds.inflate(2, 2)
+
+    def _outlineRect(self, ):
+        rect = pygame.Rect((0, 0), self.outline_size)
+        rect.center = self.position
+        return rect
+
+    def draw(self, surface):
+        """Draw the entity and its outline.
+
+        Arguments:
+        - `surface`: The surface to draw on.
+        """
+        surface.blit(self.image, self.rect)
+        if self.outline_size is not None:
+            pygame.draw.rect(surface, (255,0,0), self._outlineRect(), 1)
+        if self.outline_radius is not None:
+            pygame.draw.circle(surface, (255,0,0), self.rect.center,
+                               self.outline_radius, 1)
+
     def updateTarget(self, new_target):
         """Update the entity's movement target
 
@@ -74,6 +103,65 @@ class GameEntity(object):
         self.rect.center = self.position
 
 
+class Hud(object):
+    """The statistics shown in the corner of the screen.
+
+    The lines of text are only rendered when the statistics change.
+    """
+
+    def __init__(self, font, position):
+        """Set up the HUD without any text.
+
+        Arguments:
+        - `font`: The font to render the text in.
+        - `position`: The top left corner of the text.
+        """
+        self.font = font
+        self.position = position
+        self.values = None
+        self.lines = []
+        self.drawn = None
+        self.changed = True
+
+    def update(self, wins, losses, interest):
+        """Render the text for the statistics, if they changed.
+
+        Arguments:
+        - `wins`:
+        - `losses`:
+        - `interest`:
+        """
+        values = (wins, losses, interest)
+        if values == self.values:
+            return
+        self.values = values
+        self.lines = []
+        x, y = self.position
+        for text in ("Wins: %d" % wins, "Losses: %d" % losses,
+                     "Interest: %.8f" % interest):
+            text_s = self.font.render(text, True, (255,255,255))
+            text_r = text_s.get_rect()
+            text_r.x = x
+            text_r.y = y
+            self.lines.append((text_s, text_r))
+            y = text_r.bottom
+        self.changed = True
+
+    def getBounds(self, ):
+        """Get the rect covering the text.
+        """
+        return self.lines[0][1].unionall([r for s, r in self.lines[1:]])
+
+    def draw(self, surface):
+        """Draw the text.
+
+        Arguments:
+        - `surface`: The surface to draw on.
+        """
+        for text_s, text_r in self.lines:
+            surface.blit(text_s, text_r)
+
+
 DIR_MAP = {
     K_UP: 'up',
     K_DOWN: 'down',
@@ -135,34 +223,70 @@ class Game(object):
     PPU = 30.0
     # Game ticks per sim tick
     TICKFACTOR = 1.0
+    # Game ticks per second
+    FPS = 60
+    NUM_DOGS = 4
 
     CAT_IMG = 'nyan.png'
     DOG_IMG = 'dog.png'
     GOAL_IMG = 'bow.png'
 
+    # Whether to pack the images into atlases
+    ATLAS = True
+
     DEBUG = True
 
-    def __init__(self):
-        """
+    def __init__(self, dog_ai=None, background=None, turbo=False,
+                 headless=False, max_games=None):
+        """Set up the game.
+
+        Arguments:
+        - `dog_ai`: The AI used for the dogs, ai.f if not given.
+        - `background`: Run the simulation in the background, in a 'thread'
+          or a 'process', so that slow AIs do not drop frames. If not given,
+          the simulation is ticked between frames.
+        - `turbo`: Tick the simulation as often as fits in each frame, rather
+          than once per frame, and only show the last tick.
+        - `headless`: Play in turbo mode without drawing anything, e.g. with
+          the SDL dummy video driver.
+        - `max_games`: Quit after playing this many games.
         """
+        if (turbo or headless) and background is not None:
+            raise ValueError("Turbo mode ticks the simulation itself")
+        self.dog_ai = dog_ai if dog_ai is not None else ai.f
+        self.turbo = turbo or headless
+        self.headless = headless
+        self.max_games = max_games
         self.input = InputState()
         self.logger = game.datalogger.GameDataLogger()
 
         self.cat_ais = [ai.random_ai, ai.exit_achiever, ai.potential_field_cat]
         self.current_ai = 0
 
-        self.simulationInit()
+        self.runner = None
+        self.run = True
+        if background is None:
+            self.simulationInit()
+        else:
+            self.runnerInit(background == 'process')
 
         self.screen = pygame.display.set_mode((int(math.ceil(self.field[0]*self.PPU)),
                                                int(math.ceil(self.field[1]*self.PPU))))
         pygame.display.set_caption('Dead End')
 
+        # Load all the images up front, so new games need no disk access
+        self.assets = AssetCache()
+        self.assets.load([self.CAT_IMG, self.DOG_IMG, self.GOAL_IMG])
+        if self.ATLAS:
+            self.assets.pack()
+
         bg = pygame.Surface(self.screen.get_size())
         self.background = bg.convert()
         self.background.fill((200,200,200))
 
         self.font = pygame.font.Font(None, 35)
         self.subfont = pygame.font.Font(None, 20)
+        self.hud = Hud(self.subfont, (5, 5))
 
         self.clock = pygame.time.Clock()
         self.wins = 0
@@ -172,25 +296,59 @@ class Game(object):
 
 
 
-    def simulationInit(self):
+    def newSimulation(self):
+        """Set up the simulation of the next game, with the next cat AI.
+        """
         cat_ai = self.cat_ais[self.current_ai]
         self.current_ai = (self.current_ai + 1) % len(self.cat_ais)
-        self.simulation = Simulation(cat_ai, ai.f, num_dogs=4)
+        return Simulation(cat_ai, self.dog_ai, num_dogs=self.NUM_DOGS)
+
+    def simulationInit(self):
+        self.simulation = self.newSimulation()
         self.simstate = self.simulation.getState()
         self.field = self.simulation.getFieldSize()
         self.tickcount = 0
-        self.run = True
         self.gameover = False
         self.logger.gameStarted(self.field)
 
+    def runnerInit(self, process):
+        """Start playing the games in the background.
+
+        Arguments:
+        - `process`: Whether to use a process rather than a thread.
+        """
+        self.simulation = None
+        self.runner = SimulationRunner(self.newSimulation, self.NUM_DOGS,
+                                       self.TICKFACTOR/self.FPS,
+                                       self.logger, process)
+        self.runner.start()
+        self.simstate = self.runner.getState()
+        self.field = self.simstate["field"]
+        self.gameover = False
+
     def entityInit(self):
-        self.cat = GameEntity(self.CAT_IMG,
-                              self._simToGamePosition(self.simstate["cat"]))
+        dog_outline = goal_outline = None
+        if self.DEBUG:
+            dog_outline = (Simulation.DOG_SIZE[0]*self.PPU,
+                           Simulation.DOG_SIZE[1]*self.PPU)
+            goal_outline = (Simulation.GOAL_SIZE[0]*self.PPU,
+                            Simulation.GOAL_SIZE[1]*self.PPU)
+        self.cat = GameEntity(self.assets.get(self.CAT_IMG),
+                              self._simToGamePosition(self.simstate["cat"]),
+                              outline_radius=int(round(Simulation.CAT_RADIUS*
+                                                       self.PPU)))
         self.dogs = []
         for dog in self.simstate["dogs"]:
-            self.dogs.append(GameEntity(self.DOG_IMG, self._simToGamePosition(dog)))
-        self.goal = GameEntity(self.GOAL_IMG,
-                               self._simToGamePosition(self.simstate["goal"]))
+            self.dogs.append(GameEntity(self.assets.get(self.DOG_IMG),
+                                        self._simToGamePosition(dog),
+                                        dog_outline))
+        self.goal = GameEntity(self.assets.get(self.GOAL_IMG),
+                               self._simToGamePosition(self.simstate["goal"]),
+                               goal_outline)
+        # Drawn in this order, so the cat is on top
+        self.sprites = pygame.sprite.OrderedUpdates(self.goal, self.dogs,
+                                                    self.cat)
+        self.full_redraw = True
 
 
     def _simToGamePosition(self, position):
@@ -207,44 +365,59 @@ class Game(object):
         """
         while self.run:
             self.handleEvents()
-            self.updateGameState()
-            self.clock.tick(60)
+            if self.turbo:
+                self.updateTurbo()
+            elif self.runner is None:
+                self.updateGameState()
+            else:
+                self.updateFromRunner()
+            if self.headless:
+                continue
+            self.clock.tick(self.FPS)
             self.draw()
-
-    def draw_text(self, text, x, y):
-        text_s = self.subfont.render(text, True, (255,255,255))
-        text_r = text_s.get_rect()
-        text_r.x = x
-        text_r.y = y
-        self.screen.blit(text_s, text_r)
-        return text_r.bottom
+        if self.runner is not None:
+            self.runner.stop()
 
     def draw(self):
+        """Draw the parts of the screen that changed since the last frame.
+
+        Only the areas the entities moved out of and into, and the HUD if its
+        text changed, are redrawn and sent to the display, so the cost of a
+        frame depends on what moved rather than the size of the window.
         """
-        """
-        self.screen.blit(self.background, (0,0))
-        self.screen.blit(self.goal.image, self.goal.getRect())
-        if self.DEBUG:
-            rect2 = pygame.Rect(0,0, 5*self.PPU, 2*self.PPU)
-            rect2.center = self.goal.position
-            pygame.draw.rect(self.screen, (255,0,0), rect2, 1)
-        for entity in self.dogs:
-            rect = entity.getRect()
-            self.screen.blit(entity.image, rect)
-            if self.DEBUG:
-                dogsize = self.simulation.DOG_SIZE
-                rect2 = pygame.Rect(0,0, dogsize[0]*self.PPU, dogsize[1]*self.PPU)
-                rect2.center = entity.position
-                pygame.draw.rect(self.screen, (255,0,0), rect2, 1)
-        catrect = self.cat.getRect()
-        self.screen.blit(self.cat.image, catrect)
-        pygame.draw.circle(self.screen, (255,0,0), catrect.center,
-                           int(round(self.simulation.CAT_RADIUS*self.PPU)), 1)
-
-        next_y = self.draw_text("Wins: %d" % self.wins, 5, 5)
-        next_y = self.draw_text("Losses: %d" % self.losses, 5, next_y)
-        self.draw_text("Interest: %.8f" % self.interest, 5, next_y)
-        pygame.display.flip()
+        self.hud.update(self.wins, self.losses, self.interest)
+        layers = self.sprites.sprites() + [self.hud]
+        if self.full_redraw:
+            self.screen.blit(self.background, (0,0))
+            for layer in layers:
+                layer.draw(self.screen)
+                layer.drawn = layer.getBounds()
+                layer.changed = False
+            pygame.display.flip()
+            self.full_redraw = False
+            return
+
+        dirty = []
+        for layer in layers:
+            bounds = layer.getBounds()
+            if not layer.changed and bounds == layer.drawn:
+                continue
+            if bounds.colliderect(layer.drawn):
+                dirty.append(bounds.union(layer.drawn))
+            else:
+                dirty.extend((layer.drawn, bounds))
+            layer.drawn = bounds
+            layer.changed = False
+        # Redraw each dirty area from the background up, clipped so that the
+        # layers keep their order where they overlap
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            for layer in layers:
+                if layer.drawn.colliderect(rect):
+                    layer.draw(self.screen)
+        self.screen.set_clip(None)
+        pygame.display.update(dirty)
 
 
     def handleEvents(self):
@@ -261,7 +434,10 @@ class Game(object):
             elif event.type == KEYUP:
                 if event.key in DIR_MAP:
                     self.input.keyup(DIR_MAP[event.key])
-        self.simulation.setCatMove(self.input.getDirection())
+        if self.runner is None:
+            self.simulation.setCatMove(self.input.getDirection())
+        else:
+            self.runner.setDirection(self.input.getDirection())
 
 
     def updateGameState(self):
@@ -294,11 +470,69 @@ class Game(object):
 
             self.tickcount += 1
         else:
-            self.logger.gameEnded(self.simstate["win"])
-            N, wins, interest = self.logger.getStats(1.0, 1.0, 1.0)
+            self.endGame()
+            self.entityInit()
 
-            self.wins = wins
-            self.losses = N-wins
-            self.interest = interest
-            self.simulationInit()
+    def endGame(self):
+        """Log the end of the game and start the next one.
+        """
+        self.logger.gameEnded(self.simstate["win"])
+        N, wins, interest = self.logger.getStats(1.0, 1.0, 1.0)
+
+        self.wins = wins
+        self.losses = N-wins
+        self.interest = interest
+        if self.max_games is not None and N >= self.max_games:
+            self.run = False
+        self.simulationInit()
+
+    def updateTurbo(self):
+        """Tick the simulation for as long as a frame lasts.
+
+        Every tick is logged, but the entities are only moved to where the
+        last one left them, so the frames in between are skipped.
+        """
+        deadline = time.time() + 1.0/self.FPS
+        game_count = self.logger.games
+        while self.run and time.time() < deadline:
+            if not self.simstate["gameover"]:
+                self.simstate = self.simulation.simtick()
+                self.logger.gameTicked(self.simstate)
+            else:
+                self.endGame()
+
+        if self.headless:
+            return
+        if self.logger.games != game_count:
+            self.entityInit()
+            return
+        self.cat.updateTarget(self._simToGamePosition(self.simstate["cat"]))
+        self.cat.updatePosition(1.0)
+        for simdog, gamedog in zip(self.simstate["dogs"], self.dogs):
+            gamedog.updateTarget(self._simToGamePosition(simdog))
+            gamedog.updatePosition(1.0)
+
+    def updateFromRunner(self):
+        """Show the newest tick published by the background simulation.
+
+        The entities move towards the newest tick over the time a tick takes,
+        however long the AIs take to get to the next one.
+        """
+        state = self.runner.getState()
+        if state["game"] != self.simstate["game"]:
+            self.simstate = state
             self.entityInit()
+            self.wins = state["stats"][1]
+            self.losses = state["stats"][0] - state["stats"][1]
+            self.interest = state["stats"][2]
+        elif state["tick"] != self.simstate["tick"]:
+            self.simstate = state
+            self.cat.updateTarget(self._simToGamePosition(state["cat"]))
+            for simdog, gamedog in zip(state["dogs"], self.dogs):
+                gamedog.updateTarget(self._simToGamePosition(simdog))
+
+        percentage = (time.time() - state["time"])/self.runner.getInterval()
+        percentage = min(max(percentage, 0.0), 1.0)
+        self.cat.updatePosition(percentage)
+        for dog in self.dogs:
+            dog.updatePosition(percentage)
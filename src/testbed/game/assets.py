@@ -0,0 +1,99 @@
+import os.path
+
+import pygame
+from pygame.locals import SRCALPHA, BLEND_RGBA_MAX
+
+
+def load_png(name, directory='img'):
+    """ Load image and return image object"""
+    fullname = os.path.join(directory, name)
+    try:
+        image = pygame.image.load(fullname)
+        if image.get_alpha() is None:
+            image = image.convert()
+        else:
+            image = image.convert_alpha()
+    except pygame.error, message:
+        print 'Cannot load image:', fullname
+        raise SystemExit, message
+    return image
+
+
+class AssetCache(object):
+    """Loads the images of the game once and shares them.
+
+    Every image is decoded and converted the first time it is asked for, and
+    the same surface is handed out after that, so entities can be created
+    without touching the disk. The images can be packed into atlases, one for
+    opaque images and one for images with alpha, after which the entities
+    get subsurfaces of those.
+    """
+
+    def __init__(self, directory='img'):
+        """Set up an empty cache.
+
+        Arguments:
+        - `directory`: The directory the images are in.
+        """
+        self.directory = directory
+        self.images = {}
+        self.atlases = []
+
+    def load(self, names):
+        """Load all the given images that are not loaded yet.
+
+        Arguments:
+        - `names`: The file names of the images.
+        """
+        for name in names:
+            if name not in self.images:
+                self.images[name] = load_png(name, self.directory)
+
+    def get(self, name):
+        """Get the surface of an image, loading it if needed.
+
+        The surface is shared, and must not be drawn on.
+
+        Arguments:
+        - `name`: The file name of the image.
+        """
+        image = self.images.get(name)
+        if image is None:
+            self.load([name])
+            image = self.images[name]
+        return image
+
+    def pack(self, ):
+        """Pack the loaded images into atlases.
+
+        The images are laid out side by side, and replaced in the cache by
+        subsurfaces of the atlas, which keeps every image in one surface.
+        """
+        opaque = [name for name, image in self.images.items()
+                  if image.get_alpha() is None]
+        alpha = [name for name, image in self.images.items()
+                 if image.get_alpha() is not None]
+        self.atlases = []
+        for names, flags in ((opaque, 0), (alpha, SRCALPHA)):
+            if not names:
+                continue
+            names.sort()
+            width = sum(self.images[name].get_width() for name in names)
+            height = max(self.images[name].get_height() for name in names)
+            atlas = pygame.Surface((width, height), flags)
+            if flags:
+                atlas = atlas.convert_alpha()
+                atlas.fill((0, 0, 0, 0))
+            else:
+                atlas = atlas.convert()
+            x = 0
+            for name in names:
+                image = self.images[name]
+                # Onto the cleared atlas, the max blend copies the pixels
+                # and their alpha as they are
+                atlas.blit(image, (x, 0),
+                           special_flags=BLEND_RGBA_MAX if flags else 0)
+                rect = pygame.Rect((x, 0), image.get_size())
+                self.images[name] = atlas.subsurface(rect)
+                x += rect.width
+            self.atlases.append(atlas)
@@ -0,0 +1,157 @@
+from math import floor, log, sqrt
+
+from simulation import Simulation
+from simulation.interest import P1, P2, P3, T_MAX, T_MIN
+
+
+class DogVisits(object):
+    """Counts the cell visits of one dog, keeping their entropy up to date.
+
+    The entropy of the visits is sum(p*log(p)) over the cells, with p being
+    count/visits. This equals sum(count*log(count))/visits - log(visits), so
+    only the sum of count*log(count) has to be kept, and it can be updated in
+    constant time when a single count changes.
+    """
+
+    def __init__(self, num_cells):
+        """Start with no visits.
+
+        Arguments:
+        - `num_cells`: The number of cells in the field.
+        """
+        self.counts = [0]*num_cells
+        self.visits = 0
+        self._count_log_sum = 0.0
+
+    def visit(self, cell):
+        """Count a visit to a cell.
+
+        Arguments:
+        - `cell`: The index of the cell.
+        """
+        count = self.counts[cell]
+        if count > 0:
+            self._count_log_sum -= count*log(count)
+        count += 1
+        self._count_log_sum += count*log(count)
+        self.counts[cell] = count
+        self.visits += 1
+
+    def entropy(self, weight):
+        """Get the normalized entropy of the visits, raised to the weight.
+
+        This is Hn from npc.sml, which is 0 for dogs with less than two
+        visits.
+
+        Arguments:
+        - `weight`: The weight the entropy is raised to.
+        """
+        if self.visits < 2:
+            return 0.0
+        plogp = self._count_log_sum/self.visits - log(self.visits)
+        return max((-1.0/log(self.visits))*plogp, 0.0)**weight
+
+
+class GameDataLogger(object):
+    """Logs the games played and keeps statistics for their interest.
+
+    The statistics needed for the interest metric are updated as each tick and
+    game end arrives: a running mean and variance of the game lengths using
+    Welford's algorithm, the longest game, and the sum of the average dog
+    visit entropies. Only the visits of the current game are stored, so the
+    logger uses constant memory and getStats is constant time, no matter how
+    many games have been played.
+    """
+
+    def __init__(self, ):
+        """Start without any games.
+        """
+        self.games = 0
+        self.wins = 0
+        self._tick_mean = 0.0
+        self._tick_m2 = 0.0
+        self._tick_max = 0.0
+        self._entropy_sum = 0.0
+
+        self._field = None
+        self._ticks = 0
+        self._dogs = None
+
+    def gameStarted(self, field):
+        """Start logging a new game.
+
+        Arguments:
+        - `field`: The size of the game's field.
+        """
+        self._field = field
+        self._ticks = 0
+        self._dogs = None
+
+    def gameTicked(self, state):
+        """Log a tick of the current game.
+
+        Arguments:
+        - `state`: The simulation state after the tick.
+        """
+        # The tick that ends a game by running out of time does not move
+        # anything, so only the first MAX_TICKS ticks are counted.
+        if self._ticks >= Simulation.MAX_TICKS:
+            return
+        self._ticks += 1
+
+        width = int(self._field[0])
+        if self._dogs is None:
+            num_cells = width*int(self._field[1])
+            self._dogs = [DogVisits(num_cells) for dog in state["dogs"]]
+        for visits, (x, y) in zip(self._dogs, state["dogs"]):
+            visits.visit(int(floor(x) + floor(y)*width))
+
+    def gameEnded(self, win):
+        """Log the end of the current game.
+
+        Arguments:
+        - `win`: Whether the cat won the game.
+        """
+        self.games += 1
+        if win:
+            self.wins += 1
+
+        ticks = float(self._ticks)
+        delta = ticks - self._tick_mean
+        self._tick_mean += delta/self.games
+        self._tick_m2 += delta*(ticks - self._tick_mean)
+        self._tick_max = max(self._tick_max, ticks)
+
+        if self._dogs:
+            self._entropy_sum += (sum(d.entropy(P3) for d in self._dogs) /
+                                  len(self._dogs))
+        self._dogs = None
+
+    def getStats(self, gamma, delta, epsilon):
+        """Get the number of games, the number of wins and the interest.
+
+        The interest is computed as in npc.sml, from all the games logged so
+        far.
+
+        Arguments:
+        - `gamma`: The weight of the challenge metric (T).
+        - `delta`: The weight of the variation metric (S).
+        - `epsilon`: The weight of the diversity metric (H).
+        """
+        n = float(self.games)
+        if n == 0:
+            return self.games, self.wins, 0.0
+
+        if self._tick_max > 0.0:
+            T = max(1.0 - self._tick_mean/self._tick_max, 0.0)**P1
+        else:
+            T = 0.0
+        if n > 1:
+            std = sqrt(self._tick_m2/n)
+            S = (std/((0.5*sqrt(n/(n - 1.0)))*(T_MAX - T_MIN)))**P2
+        else:
+            S = 0.0
+        H = self._entropy_sum/n
+
+        interest = (gamma*T + delta*S + epsilon*H)/(gamma + delta + epsilon)
+        return self.games, self.wins, interest
@@ -25,15 +25,45 @@
 #
 ###
 
+import os
+from optparse import OptionParser
+
 import pygame
 from game import Game
+from simulation.adate import load_ai
 
 def main():
     """Little main function stub
+
+    An ADATE program for the dogs may be given as the first argument.
     """
+    parser = OptionParser(usage="%prog [options] [program.sml]")
+    parser.add_option("-b", "--background", choices=["thread", "process"],
+                      help="run the simulation in a thread or process of "
+                      "its own, so slow AIs do not drop frames")
+    parser.add_option("-t", "--turbo", action="store_true",
+                      help="play the games as fast as possible, showing "
+                      "only the last tick of each frame")
+    parser.add_option("--headless", action="store_true",
+                      help="play the games as fast as possible without a "
+                      "window, using the SDL dummy video driver")
+    parser.add_option("-n", "--games", type="int",
+                      help="quit after playing this many games")
+    options, args = parser.parse_args()
+    if (options.turbo or options.headless) and options.background:
+        parser.error("--background can not be used with turbo mode")
+    dog_ai = None
+    if args:
+        dog_ai = load_ai(args[0])
+    if options.headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
     pygame.init()
-    g = Game()
+    g = Game(dog_ai, options.background, options.turbo, options.headless,
+             options.games)
     g.mainLoop()
+    if options.headless:
+        print "Games: %d, wins: %d, interest: %.8f" % (g.wins + g.losses,
+                                                       g.wins, g.interest)
     pygame.quit()
 
 if __name__ == '__main__':
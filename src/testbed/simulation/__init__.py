@@ -1,9 +1,24 @@
 import random
+from array import array
 from datetime import datetime
 
+import numpy as np
+
 from util import *
 import ai
 from chars import Entity, Rect, Circle
+from spatial import SpatialHash
+from neighbours import Neighbours
+from stats import SimulationStats
+
+# The moves of batched AIs by direction index, where -1 is staying put
+_MOVES = DIRECTIONS + ("",)
+
+# The methods doing the work of each phase of a tick, timed by enableStats
+_PHASE_METHODS = (('tick', '_tick'),
+                  ('ai', '_aiStep'),
+                  ('update', '_updateState'),
+                  ('collisions', '_checkCollisions'))
 
 class Simulation(object):
     """Represents the simulation part of the test bed.
@@ -17,21 +32,42 @@ class Simulation(object):
     GOAL_SIZE = (5, 2)
     CAT_SPEED = 2.0
     DOG_SPEED = CAT_SPEED*3.0/4.0
+    # The cat wins if it survives this many ticks
+    MAX_TICKS = 50
 
 
-    def __init__(self, cat_ai, dog_ai, field_size=(16,16), num_dogs=5):
+    def __init__(self, cat_ai, dog_ai, field_size=(16,16), num_dogs=5,
+                 cat_position=None, dog_positions=None, seed=None,
+                 spatial_hash=None):
         """Initialize the simulation.
 
         Sets up the entities in the simulation (cat and dogs) with the passed in
         AIs. Refer to simulation.ai for predefined AIs as well as the signature
         used for the AI functions.
 
+        The cat and dogs are placed randomly unless their positions are given.
+
         Arguments:
         - `cat_ai`: The AI used for the cat.
         - `dog_ai`: The AI used for the dog.
         - `field_size`: The size of the field.
         - `num_dogs`: The amount of dogs to put on the board.
+        - `cat_position`: The cat's start position.
+        - `dog_positions`: The dogs' start positions, overrides `num_dogs`.
+        - `seed`: Seed for the simulation's random number generator. If not
+          given, one is drawn from the random module.
+        - `spatial_hash`: Cell size of a spatial hash used to find the dogs
+          near the cat when checking for collisions. If not given, the cat is
+          checked against every dog.
         """
+        # Each simulation has its own random number generator, used to place
+        # the entities and by the AIs, so that simulations do not affect each
+        # other and a seed always gives the same game.
+        if seed is None:
+            seed = random.getrandbits(64)
+        self._seed = seed
+        self._random = random.Random(seed)
+
         self._last_tick = datetime.now()
         self._gameover = False
         self._win = False
@@ -42,10 +78,11 @@ class Simulation(object):
         height = field_size[1]
         width = field_size[0]
         # We want the cat to start flush with the bottom, in the center
-        self._cat = Entity(Circle((random.uniform(self.CAT_RADIUS,
-                                                  width-self.CAT_RADIUS),
-                                   height-self.CAT_RADIUS),
-                                  self.CAT_RADIUS),
+        if cat_position is None:
+            cat_position = (self._random.uniform(self.CAT_RADIUS,
+                                                 width-self.CAT_RADIUS),
+                            height-self.CAT_RADIUS)
+        self._cat = Entity(Circle(cat_position, self.CAT_RADIUS),
                            self.CAT_SPEED)
 
         # The goal is flush with the top, also centered
@@ -58,15 +95,33 @@ class Simulation(object):
         dog_padding = (self.DOG_SIZE[0]/2.0,self.DOG_SIZE[1]/2.0)
         x_range = (dog_padding[0], width-dog_padding[0])
         y_range = (dog_padding[1], (height/2.0)-dog_padding[1])
-        for i in range(num_dogs):
-            dogx = random.uniform(x_range[0], x_range[1])
-            dogy = random.uniform(y_range[0], y_range[1])
+        if dog_positions is None:
+            dog_positions = [(self._random.uniform(x_range[0], x_range[1]),
+                              self._random.uniform(y_range[0], y_range[1]))
+                             for i in range(num_dogs)]
+        for (dogx, dogy) in dog_positions:
             dog = Entity(Rect((dogx, dogy), self.DOG_SIZE),
                          self.DOG_SPEED)
             self._dogs.append(dog)
-
-        self._cat_ai = cat_ai
-        self._dog_ai = dog_ai
+        # All the entities that move, in the order they are snapshotted
+        self._movers = [self._cat] + self._dogs
+
+        self._spatial_hash = None
+        if spatial_hash is not None:
+            self._spatial_hash = SpatialHash(spatial_hash)
+            for dog in self._dogs:
+                self._spatial_hash.insert(dog)
+
+        # The neighbours of the dogs, worked out when first needed in a tick
+        self._neighbours = None
+        # The moves made in the last tick
+        self._moves = None
+        # The statistics gathered, see enableStats
+        self._stats = None
+
+        self._cat_ai = ai.bind_ai(cat_ai, self._random, self.MAX_TICKS)
+        self._dog_ai = ai.bind_ai(dog_ai, self._random,
+                                  self.MAX_TICKS*len(self._dogs))
 
     def setCatMove(self, direction):
         """Set the cat's move if using ai.ControlAI.
@@ -93,21 +148,143 @@ class Simulation(object):
         return state
 
 
+    def snapshot(self, ):
+        """Take a snapshot of the simulation's state.
+
+        The snapshot is a flat array of doubles: the position of the cat, the
+        positions of the dogs, the tick count and the gameover and win flags.
+        Passing it to restore puts the simulation back in that state, which
+        allows branching a game many times, e.g. for lookahead.
+        """
+        values = []
+        for entity in self._movers:
+            values.append(entity.x)
+            values.append(entity.y)
+        values.append(self._ticks)
+        values.append(self._gameover)
+        values.append(self._win)
+        return array('d', values)
+
+    def restore(self, snap):
+        """Restore the simulation to the state in a snapshot.
+
+        The entities are updated in place, nothing is reallocated.
+
+        Arguments:
+        - `snap`: A snapshot taken from this or a similar simulation.
+        """
+        i = 2*len(self._movers)
+        if len(snap) != i + 3:
+            raise ValueError("Snapshot is for a simulation with %d dogs" %
+                             ((len(snap) - 5)//2))
+        self._ticks = int(snap[i])
+        self._gameover = bool(snap[i+1])
+        self._win = bool(snap[i+2])
+        i = 0
+        for entity in self._movers:
+            entity.setCoordinates(snap[i], snap[i+1])
+            i += 2
+        self._neighbours = None
+        self._moves = None
+        self.rehash()
+
+    def getNeighbours(self, ):
+        """Get the neighbours of the dogs at their current positions.
+
+        They are worked out once per tick, from one matrix of the distances
+        between the dogs, and shared by every dog.
+        """
+        if self._neighbours is None:
+            self._neighbours = Neighbours([d.getPosition()
+                                           for d in self._dogs])
+        return self._neighbours
+
+    def rehash(self, ):
+        """Bring the spatial hash up to date with the dogs' positions.
+
+        Needed after moving dogs other than through simtick.
+        """
+        if self._spatial_hash is not None:
+            for dog in self._dogs:
+                self._spatial_hash.update(dog)
+
+    def getMoves(self, ):
+        """Get the moves made in the last tick.
+
+        The first move is the cat's, the rest are the dogs'. None if nothing
+        moved in the last tick, because the game was over.
+        """
+        return self._moves
+
+    def enableStats(self, stats=None):
+        """Record the time taken by every phase of every tick from now on.
+
+        Until this is called, simtick is not timed at all, so there is no
+        cost to the statistics when they are not used.
+
+        Arguments:
+        - `stats`: The SimulationStats to add to, which may be shared with
+          other simulations. A new one is made if not given.
+        """
+        if self._stats is None:
+            self._untimed_ais = (self._cat_ai, self._dog_ai)
+        self._stats = stats if stats is not None else SimulationStats()
+        self._cat_ai = self._stats.timed('cat', self._untimed_ais[0])
+        self._dog_ai = self._stats.timed('dog', self._untimed_ais[1])
+        # The timed methods shadow the plain ones on this instance only
+        for phase, name in _PHASE_METHODS:
+            method = getattr(type(self), name).__get__(self)
+            setattr(self, name, self._stats.timedPhase(phase, method))
+        return self._stats
+
+    def disableStats(self, ):
+        """Stop recording the time taken by the ticks.
+        """
+        if self._stats is not None:
+            self._cat_ai, self._dog_ai = self._untimed_ais
+            for phase, name in _PHASE_METHODS:
+                delattr(self, name)
+            self._stats = None
+
+    def getStats(self, ):
+        """Get the SimulationStats being recorded to, None if disabled.
+        """
+        return self._stats
+
+    def getSeed(self, ):
+        """Get the seed of the simulation's random number generator.
+        """
+        return self._seed
+
     def getFieldSize(self, ):
         """Get the size of the game field.
         """
         return self._field_size
 
 
-    def simtick(self, ):
+    def simtick(self, moves=None):
         """Do one tick of the simulation.
+
+        Arguments:
+        - `moves`: The moves of the cat and the dogs, as from getMoves. If
+          given, the AIs are not called and the entities make these moves
+          instead, which replays a recorded tick.
+        """
+        self._tick(moves)
+        return self.getState()
+
+    def _tick(self, moves):
+        """Do the work of a tick, without getting the state.
         """
-        if self._ticks >= 50:
+        self._moves = None
+        if self._ticks >= self.MAX_TICKS and not self._gameover:
             self._gameover = True
             self._win = True
         if not self._gameover:
             self._last_tick = datetime.now()
-            moves = self._aiStep()
+            if moves is None:
+                moves = self._aiStep()
+            self._moves = moves
             self._updateState(moves)
             collisions = self._checkCollisions()
             if collisions:
@@ -117,23 +294,48 @@ class Simulation(object):
                 elif "dog" in collisions:
                     self._win = False
         self._ticks += 1
-        return self.getState()
-
 
     def _aiStep(self, ):
         """Do one AI step.
 
         Call the AI functions for all the entities and gather up their movement
-        decisions, then return them.
+        decisions, then return them. AIs marked with ai.batched are called once
+        with the positions of all the entities as arrays, other AIs once per
+        entity.
         """
+        cat_batched = getattr(self._cat_ai, 'batched', False)
+        dog_batched = getattr(self._dog_ai, 'batched', False)
+        if cat_batched or dog_batched:
+            cat = np.array(self._cat.getPosition())
+            dogs = np.array([d.getPosition() for d in self._dogs],
+                            dtype=np.float64).reshape(-1, 2)
+            goal = np.array(self._goal.getPosition())
+
         moves = []
-        moves.append(self._cat_ai(self._cat, self._cat,
-                                  self._dogs, self._goal,
-                                  self._field_size))
-        for dog in self._dogs:
-            moves.append(self._dog_ai(dog, self._cat,
+        if cat_batched:
+            move = self._cat_ai(cat, cat, dogs, goal, self._field_size)
+            moves.append(_MOVES[int(move)])
+        else:
+            moves.append(self._cat_ai(self._cat, self._cat,
                                       self._dogs, self._goal,
                                       self._field_size))
+        if dog_batched:
+            dog_moves = self._dog_ai(dogs, cat, dogs, goal, self._field_size)
+            moves.extend(_MOVES[move] for move in dog_moves.tolist())
+        elif getattr(self._dog_ai, 'neighbours', False):
+            neighbours = self.getNeighbours()
+            for i, dog in enumerate(self._dogs):
+                nearest = [self._dogs[j] for j in neighbours.nearest(i)]
+                moves.append(self._dog_ai(dog, self._cat,
+                                          self._dogs, self._goal,
+                                          self._field_size,
+                                          dog_id=neighbours.dogId(i),
+                                          nearest=nearest))
+        else:
+            for dog in self._dogs:
+                moves.append(self._dog_ai(dog, self._cat,
+                                          self._dogs, self._goal,
+                                          self._field_size))
         return moves
 
     def _updateState(self, moves):
@@ -145,9 +347,13 @@ class Simulation(object):
         """
         self._cat.move(moves[0])
         self._ensureInside(self._cat)
+        spatial_hash = self._spatial_hash
         for i, dog in enumerate(self._dogs):
             dog.move(moves[i+1])
             self._ensureInside(dog)
+            if spatial_hash is not None:
+                spatial_hash.update(dog)
+        self._neighbours = None
 
 
     def _ensureInside(self, entity):
@@ -157,35 +363,47 @@ class Simulation(object):
         - `entity`: The given entity
         - `size`: The bounding box of the entity
         """
-        pos = entity.getPosition()
         shape = entity.getShape()
-        new_pos = list(pos)
+        left = shape.getLeft()
+        right = shape.getRight()
+        top = shape.getTop()
+        bottom = shape.getBottom()
+        x = old_x = entity.x
+        y = old_y = entity.y
 
-        width = shape.getRight() - shape.getLeft()
-        height = shape.getBottom() - shape.getTop()
+        width = right - left
+        height = bottom - top
 
-        if shape.getLeft() < 0:
-            new_pos[0] = width*0.5
-        elif shape.getRight() > self._field_size[0]:
-            new_pos[0] = self._field_size[0]-width*0.5
-        else:
-            new_pos[0] = pos[0]
+        if left < 0:
+            x = width*0.5
+        elif right > self._field_size[0]:
+            x = self._field_size[0]-width*0.5
 
-        if shape.getTop() < 0:
-            new_pos[1] = height*0.5
-        elif shape.getBottom() > self._field_size[1]:
-            new_pos[1] = self._field_size[1]-height*0.5
-        else:
-            new_pos[1] = pos[1]
+        if top < 0:
+            y = height*0.5
+        elif bottom > self._field_size[1]:
+            y = self._field_size[1]-height*0.5
 
-        entity.setPosition(new_pos)
+        # Only touch the entity if it actually was outside
+        if x != old_x or y != old_y:
+            entity.setPosition((x, y))
 
 
     def _checkCollisions(self, ):
         """Check for collisions between cat and other entities.
+
+        With a spatial hash only the dogs near the cat are checked, which
+        gives the same result as checking every dog.
         """
         collisions = []
-        for dog in self._dogs:
+        if self._spatial_hash is None:
+            dogs = self._dogs
+        else:
+            shape = self._cat.getShape()
+            dogs = self._spatial_hash.query(shape.getLeft(), shape.getTop(),
+                                            shape.getRight(),
+                                            shape.getBottom())
+        for dog in dogs:
             if collide(self._cat, dog):
                 collisions.append("dog")
         if collide(self._cat, self._goal):
@@ -0,0 +1,726 @@
+###
+# ADATE program compiler
+#--
+# Compiles dog programs evolved by ADATE into Python AIs, so they can be
+# played in Simulation and Game without porting them by hand. A program is the
+# ML definition of `f` from npc.sml,
+#
+#   fun f( Self, DogId, Cat, Dogs, Goal, Field ) = ...
+#
+# written in the subset ADATE prints: nested `case ... of` expressions, calls
+# of the primitives in Funs_to_use, constructors and real constants.
+#
+# The program is parsed and compiled to the source of a Python function, which
+# folds constant subexpressions, reuses the value of a call already made on
+# the way to the current branch instead of repeating it, and turns pattern
+# matching into plain tests and indexing. The primitives follow their npc.sml
+# definitions, so a compiled program decides exactly as it does under ADATE.
+# Compiled programs are cached by a hash of their tokens.
+#
+# Values are represented as follows:
+# - reals are floats and bools are bools
+# - directions and dog ids are their names, e.g. 'left' and 'dog_1'
+# - point(X, Y) and size(W, H) are tuples (X, Y) and (W, H)
+# - radius(R) is the float R
+# - rect(P, S) is (RECT, P, S) and circle(P, R) is (CIRCLE, P, R)
+# - entity and direction lists are tuples
+# - rconst(Compl, StepSize, Current) is the tuple of its reals
+###
+
+import hashlib
+import operator
+import re
+from math import copysign, isinf, isnan, sqrt, tanh
+
+from simulation.ai import with_neighbours
+from simulation.chars import RECT, CIRCLE
+from simulation.neighbours import DOG_IDS, Neighbours
+from simulation.util import DIRECTIONS
+
+# The parameters of f, in order
+PARAMETERS = ('Self', 'DogId', 'Cat', 'Dogs', 'Goal', 'Field')
+
+
+###
+# Primitives, with the semantics of npc.sml
+###
+
+def _realDivide(x, y):
+    try:
+        return x/y
+    except ZeroDivisionError:
+        if x == 0.0 or isnan(x):
+            return float('nan')
+        return copysign(float('inf'), x)*copysign(1.0, y)
+
+def _sqrt(x):
+    if x < 0.0:
+        return float('nan')
+    return sqrt(x)
+
+def _getDistance(entity1, entity2):
+    (x1, y1) = entity1[1]
+    (x2, y2) = entity2[1]
+    return (x2-x1, y2-y1)
+
+def _getQuadDistance(entity1, entity2):
+    (xd, yd) = _getDistance(entity1, entity2)
+    return _sqrt(xd*xd + yd*yd)
+
+def _clamp(value, lower, upper):
+    if upper < lower:
+        return _clamp(value, upper, lower)
+    if value < lower:
+        return lower
+    if value > upper:
+        return upper
+    return value
+
+def _ensureInside(entity, field):
+    (tag, (x, y), extent) = entity
+    (field_width, field_height) = field
+    if tag == RECT:
+        (width, height) = extent
+        return (RECT,
+                (_clamp(x, width*0.5, field_width-(width*0.5)),
+                 _clamp(y, height*0.5, field_height-(height*0.5))),
+                extent)
+    return (CIRCLE,
+            (_clamp(x, extent, field_width-extent),
+             _clamp(y, extent, field_height-extent)),
+            extent)
+
+def _collide(entity1, entity2):
+    (tag1, (x1, y1), extent1) = entity1
+    (tag2, (x2, y2), extent2) = entity2
+    if tag1 == RECT:
+        (w1, h1) = extent1
+        if tag2 == RECT:
+            (w2, h2) = extent2
+            return not ((y1+(h1*0.5)) < (y2-(h2*0.5)) or
+                        (y1-(h1*0.5)) > (y2+(h2*0.5)) or
+                        (x1+(w1*0.5)) < (x2-(w2*0.5)) or
+                        (x1-(w1*0.5)) > (x2+(w2*0.5)))
+        dist_x = abs(x2 - x1)
+        dist_y = abs(y2 - y1)
+        coll_width = w1/2.0
+        coll_height = h1/2.0
+        if dist_x > coll_width + extent2 or dist_y > coll_height + extent2:
+            return False
+        if dist_x < coll_width or dist_y < coll_height:
+            return True
+        return ((dist_x - coll_width)**2 + (dist_y - coll_height)**2 <=
+                extent2**2)
+    if tag2 == RECT:
+        return _collide(entity2, entity1)
+    return (x1-x2)**2 + (y1-y2)**2 <= (extent1+extent2)**2
+
+# The primitives by name: their number of arguments, the Python expression
+# they compile to and the function used to fold them
+_PRIMITIVES = {
+    'realLess': (2, '(%s < %s)', operator.lt),
+    'realAdd': (2, '%s + %s', operator.add),
+    'realSubtract': (2, '%s - %s', operator.sub),
+    'realMultiply': (2, '%s * %s', operator.mul),
+    'realDivide': (2, '_realDivide(%s, %s)', _realDivide),
+    'tanh': (1, 'tanh(%s)', tanh),
+    'sqrt': (1, '_sqrt(%s)', _sqrt),
+    'tor': (1, '%s[2]', lambda c: c[2]),
+    'rconstLess': (2, '(%s < %s[2])', lambda x, c: x < c[2]),
+    'getDistance': (2, '_getDistance(%s, %s)', _getDistance),
+    'getQuadDistance': (2, '_getQuadDistance(%s, %s)', _getQuadDistance),
+    'clamp': (3, '_clamp(%s, %s, %s)', _clamp),
+    'collide': (2, '_collide(%s, %s)', _collide),
+    'ensureInside': (2, '_ensureInside(%s, %s)', _ensureInside),
+}
+
+# Constructors with arguments: their number of arguments, the Python
+# expression building their value and the function used to fold them
+_CONSTRUCTORS = {
+    'point': (2, '(%s, %s)', lambda x, y: (x, y)),
+    'size': (2, '(%s, %s)', lambda w, h: (w, h)),
+    'radius': (1, '%s', lambda r: r),
+    'rect': (2, '(' + repr(RECT) + ', %s, %s)', lambda p, s: (RECT, p, s)),
+    'circle': (2, '(' + repr(CIRCLE) + ', %s, %s)',
+               lambda p, r: (CIRCLE, p, r)),
+    'entity_cons': (2, '((%s,) + %s)', lambda e, rest: (e,) + rest),
+    'dir_cons': (2, '((%s,) + %s)', lambda d, rest: (d,) + rest),
+    'rconst': (3, '(%s, %s, %s)', lambda a, b, c: (a, b, c)),
+}
+
+# Constructors without arguments and their values
+_CONSTANTS = dict([('true', True), ('false', False),
+                   ('entity_nil', ()), ('dir_nil', ())] +
+                  [(d, d) for d in DIRECTIONS] +
+                  [(d, d) for d in DOG_IDS])
+
+# The constructors of each datatype with more than one
+_FAMILIES = [frozenset(('true', 'false')),
+             frozenset(DIRECTIONS),
+             frozenset(DOG_IDS),
+             frozenset(('entity_nil', 'entity_cons')),
+             frozenset(('dir_nil', 'dir_cons')),
+             frozenset(('rect', 'circle'))]
+
+# The names the compiled functions are executed with
+_NAMESPACE = {
+    'tanh': tanh,
+    '_realDivide': _realDivide,
+    '_sqrt': _sqrt,
+    '_getDistance': _getDistance,
+    '_getQuadDistance': _getQuadDistance,
+    '_clamp': _clamp,
+    '_collide': _collide,
+    '_ensureInside': _ensureInside,
+}
+
+
+###
+# Parsing
+###
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<real>~?\d+\.\d+(?:[eE]~?\d+)?|~?\d+[eE]~?\d+) |
+    (?P<int>~?\d+) |
+    (?P<name>[A-Za-z_][A-Za-z0-9_']*) |
+    (?P<punct>=>|[(),|=:*])
+    )""", re.VERBOSE)
+
+def _stripComments(source):
+    """Remove the (possibly nested) ML comments from the source.
+    """
+    parts = []
+    depth = 0
+    i = 0
+    while i < len(source):
+        pair = source[i:i+2]
+        if pair == '(*':
+            depth += 1
+            i += 2
+        elif pair == '*)' and depth > 0:
+            depth -= 1
+            i += 2
+        else:
+            if depth == 0:
+                parts.append(source[i])
+            i += 1
+    if depth > 0:
+        raise ValueError("Unterminated comment")
+    return ''.join(parts)
+
+def _tokenize(source):
+    """Split an ML program into (kind, text) tokens.
+    """
+    source = _stripComments(source).rstrip()
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if match is None or match.end() == position:
+            raise ValueError("Unexpected character %r in program" %
+                             source[position:].lstrip()[:1])
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+def _real(text):
+    return float(text.replace('~', '-'))
+
+
+class _Parser(object):
+    """Parses the tokens of a program into its parameters and body.
+
+    Expressions are tuples: ('const', value), ('var', name),
+    ('call', name, args), ('con', name, args) and ('case', expr, rules), with
+    each rule a (pattern, expr) pair. Patterns are ('pvar', name),
+    ('pwild',), ('pconst', value, name), ('pcon', name, patterns) and
+    ('pas', name, pattern).
+    """
+
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._position = 0
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position][1]
+        return None
+
+    def _next(self):
+        if self._position >= len(self._tokens):
+            raise ValueError("Unexpected end of program")
+        token = self._tokens[self._position]
+        self._position += 1
+        return token
+
+    def _expect(self, text):
+        kind, found = self._next()
+        if found != text:
+            raise ValueError("Expected %r, found %r" % (text, found))
+
+    def program(self):
+        """Parse `fun f(...) = body`, returning the parameters and body.
+        """
+        self._expect('fun')
+        self._next()
+        # The parameters are the names up to the first type annotation
+        parameters = []
+        annotated = False
+        while self._peek() != '=':
+            kind, text = self._next()
+            if text == ':':
+                annotated = True
+            elif kind == 'name' and not annotated:
+                parameters.append(text)
+        self._expect('=')
+        if len(parameters) != len(PARAMETERS):
+            raise ValueError("f must take %d parameters, not %d" %
+                             (len(PARAMETERS), len(parameters)))
+        body = self.expression()
+        if self._peek() is not None:
+            raise ValueError("Unexpected %r after the program" % self._peek())
+        return parameters, body
+
+    def expression(self):
+        if self._peek() == 'case':
+            self._next()
+            scrutinee = self.expression()
+            self._expect('of')
+            rules = [self._rule()]
+            while self._peek() == '|':
+                self._next()
+                rules.append(self._rule())
+            return ('case', scrutinee, rules)
+        return self._application()
+
+    def _rule(self):
+        pattern = self._pattern()
+        self._expect('=>')
+        return (pattern, self.expression())
+
+    def _application(self):
+        kind, text = self._next()
+        if kind == 'real' or kind == 'int':
+            return ('const', _real(text))
+        if text == '(':
+            expression = self.expression()
+            self._expect(')')
+            return expression
+        if kind != 'name':
+            raise ValueError("Unexpected %r in expression" % text)
+        if text in _CONSTANTS:
+            return ('const', _CONSTANTS[text])
+        if text in _PRIMITIVES or text in _CONSTRUCTORS:
+            args = self._arguments()
+            arity = (_PRIMITIVES.get(text) or _CONSTRUCTORS.get(text))[0]
+            if len(args) != arity:
+                raise ValueError("%s takes %d arguments, not %d" %
+                                 (text, arity, len(args)))
+            return ('call' if text in _PRIMITIVES else 'con', text, args)
+        if self._peek() == '(':
+            raise ValueError("Unsupported function %r" % text)
+        if text in ('let', 'raise', 'fn', 'if'):
+            raise ValueError("Unsupported construct %r" % text)
+        return ('var', text)
+
+    def _arguments(self):
+        if self._peek() != '(':
+            # A single argument may be given without parentheses
+            return [self._application()]
+        self._expect('(')
+        args = [self.expression()]
+        while self._peek() == ',':
+            self._next()
+            args.append(self.expression())
+        self._expect(')')
+        return args
+
+    def _pattern(self):
+        kind, text = self._next()
+        if text == '(':
+            pattern = self._pattern()
+            self._expect(')')
+            return pattern
+        if kind != 'name':
+            raise ValueError("Unexpected %r in pattern" % text)
+        if text == '_':
+            return ('pwild',)
+        if text in _CONSTANTS:
+            return ('pconst', _CONSTANTS[text], text)
+        if text in _CONSTRUCTORS:
+            if self._peek() != '(':
+                # A single argument may be given without parentheses
+                patterns = [self._pattern()]
+            else:
+                self._expect('(')
+                patterns = [self._pattern()]
+                while self._peek() == ',':
+                    self._next()
+                    patterns.append(self._pattern())
+                self._expect(')')
+            if len(patterns) != _CONSTRUCTORS[text][0]:
+                raise ValueError("Pattern %s takes %d arguments" %
+                                 (text, _CONSTRUCTORS[text][0]))
+            return ('pcon', text, patterns)
+        if self._peek() == 'as':
+            self._next()
+            return ('pas', text, self._pattern())
+        return ('pvar', text)
+
+
+###
+# Code generation
+###
+
+def _finite(value):
+    """Check that a folded value only holds finite reals, so its repr is
+    valid Python.
+    """
+    if isinstance(value, tuple):
+        return all(_finite(v) for v in value)
+    if isinstance(value, float):
+        return not (isinf(value) or isnan(value))
+    return True
+
+def _matchConstant(pattern, value, bindings):
+    """Match a pattern against a known value at compile time.
+
+    Returns whether it matched, adding the variables bound to `bindings`.
+    """
+    kind = pattern[0]
+    if kind == 'pwild':
+        return True
+    if kind == 'pvar':
+        bindings[pattern[1]] = ('const', value)
+        return True
+    if kind == 'pas':
+        bindings[pattern[1]] = ('const', value)
+        return _matchConstant(pattern[2], value, bindings)
+    if kind == 'pconst':
+        return value == pattern[1] and type(value) == type(pattern[1])
+    name, patterns = pattern[1], pattern[2]
+    if name in ('rect', 'circle'):
+        if value[0] != (RECT if name == 'rect' else CIRCLE):
+            return False
+        parts = value[1:]
+    elif name in ('entity_cons', 'dir_cons'):
+        if not value:
+            return False
+        parts = (value[0], value[1:])
+    elif name == 'radius':
+        parts = (value,)
+    else:
+        parts = value
+    return all(_matchConstant(p, v, bindings)
+               for p, v in zip(patterns, parts))
+
+
+def _variables(node, found):
+    """Collect the names of the variables used in an expression.
+    """
+    kind = node[0]
+    if kind == 'var':
+        found.add(node[1])
+    elif kind in ('call', 'con'):
+        for arg in node[2]:
+            _variables(arg, found)
+    elif kind == 'case':
+        _variables(node[1], found)
+        for pattern, body in node[2]:
+            _variables(body, found)
+    return found
+
+def _irrefutable(pattern):
+    """Check whether a pattern matches every value of its type.
+    """
+    kind = pattern[0]
+    if kind in ('pvar', 'pwild'):
+        return True
+    if kind == 'pas':
+        return _irrefutable(pattern[2])
+    if kind == 'pcon' and pattern[1] in ('point', 'size', 'radius', 'rconst'):
+        return all(_irrefutable(p) for p in pattern[2])
+    return False
+
+def _head(pattern):
+    """Get the constructor a pattern tests for, if all it tests is that.
+    """
+    while pattern[0] == 'pas':
+        pattern = pattern[2]
+    if pattern[0] == 'pconst':
+        return pattern[2]
+    if pattern[0] == 'pcon' and all(_irrefutable(p) for p in pattern[2]):
+        return pattern[1]
+    return None
+
+
+class _Compiler(object):
+    """Compiles a parsed program to the source of a Python function.
+
+    Every call is made once, in evaluation order, into a fresh local. The
+    calls made on the way to a branch are recorded by their name and
+    arguments, and a repeated call in the branch reuses the local instead.
+    Since locals are never reassigned, equal names mean equal values.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._names = 0
+
+    def _fresh(self, name):
+        self._names += 1
+        return '%s_%d' % (name.replace("'", '_'), self._names)
+
+    def _emit(self, indent, line):
+        self._lines.append('    '*indent + line)
+
+    def function(self, parameters, body):
+        env = {}
+        names = []
+        for parameter in parameters:
+            names.append(self._fresh(parameter))
+            env[parameter] = ('name', names[-1])
+        self._emit(0, 'def f(%s):' % ', '.join(names))
+        self._expression(body, env, {}, 1, True)
+        return '\n'.join(self._lines) + '\n'
+
+    def _render(self, atom):
+        return atom[1] if atom[0] == 'name' else repr(atom[1])
+
+    def _expression(self, node, env, calls, indent, tail):
+        """Compile an expression, returning the atom holding its value.
+
+        In tail position the value is returned from the function instead,
+        and None is returned.
+        """
+        kind = node[0]
+        if kind == 'case':
+            return self._case(node, env, calls, indent, tail)
+        if kind == 'const':
+            atom = ('const', node[1])
+        elif kind == 'var':
+            if node[1] not in env:
+                raise ValueError("Unbound variable %r" % node[1])
+            atom = env[node[1]]
+        else:
+            atom = self._call(node, env, calls, indent)
+        if tail:
+            self._emit(indent, 'return %s' % self._render(atom))
+            return None
+        return atom
+
+    def _call(self, node, env, calls, indent):
+        kind, name, args = node
+        atoms = [self._expression(arg, env, calls, indent, False)
+                 for arg in args]
+        if kind == 'call':
+            template, function = _PRIMITIVES[name][1:]
+        else:
+            template, function = _CONSTRUCTORS[name][1:]
+        if all(atom[0] == 'const' for atom in atoms):
+            value = function(*[atom[1] for atom in atoms])
+            if _finite(value):
+                return ('const', value)
+        if template == '%s':
+            return atoms[0]
+        key = (name,) + tuple(atoms)
+        if key not in calls:
+            local = self._fresh('t')
+            self._emit(indent, '%s = %s' %
+                       (local, template %
+                        tuple(self._render(atom) for atom in atoms)))
+            calls[key] = ('name', local)
+        return calls[key]
+
+    def _pattern(self, pattern, access, conditions, bindings):
+        """Compile a pattern to tests and bindings on an access expression.
+        """
+        kind = pattern[0]
+        if kind == 'pvar':
+            bindings.append((pattern[1], access))
+        elif kind == 'pas':
+            bindings.append((pattern[1], access))
+            self._pattern(pattern[2], access, conditions, bindings)
+        elif kind == 'pconst':
+            value = pattern[1]
+            if value is True:
+                conditions.append(access)
+            elif value is False:
+                conditions.append('not %s' % access)
+            elif value == ():
+                conditions.append('not %s' % access)
+            else:
+                conditions.append('%s == %r' % (access, value))
+        elif kind == 'pcon':
+            name, patterns = pattern[1], pattern[2]
+            if name in ('rect', 'circle'):
+                tag = RECT if name == 'rect' else CIRCLE
+                conditions.append('%s[0] == %r' % (access, tag))
+                parts = ['%s[1]' % access, '%s[2]' % access]
+            elif name in ('entity_cons', 'dir_cons'):
+                conditions.append(access)
+                parts = ['%s[0]' % access, '%s[1:]' % access]
+            elif name == 'radius':
+                parts = [access]
+            else:
+                parts = ['%s[%d]' % (access, i) for i in range(len(patterns))]
+            for subpattern, part in zip(patterns, parts):
+                self._pattern(subpattern, part, conditions, bindings)
+
+    def _case(self, node, env, calls, indent, tail):
+        scrutinee = self._expression(node[1], env, calls, indent, False)
+        rules = node[2]
+
+        if scrutinee[0] == 'const':
+            # The rule is known at compile time
+            for pattern, body in rules:
+                bindings = {}
+                if _matchConstant(pattern, scrutinee[1], bindings):
+                    branch_env = dict(env)
+                    branch_env.update(bindings)
+                    return self._expression(body, branch_env, calls, indent,
+                                            tail)
+            raise ValueError("No rule matches a constant case")
+
+        result = None if tail else self._fresh('c')
+        access = scrutinee[1]
+        first = True
+        exhaustive = False
+        covered = set()
+        for pattern, body in rules:
+            conditions = []
+            bindings = []
+            self._pattern(pattern, access, conditions, bindings)
+            # The last constructor of a datatype needs no test
+            head = _head(pattern)
+            if head is not None:
+                covered.add(head)
+                if any(covered >= family for family in _FAMILIES
+                       if head in family):
+                    conditions = []
+            inner = indent
+            if conditions:
+                keyword = 'if' if first or tail else 'elif'
+                self._emit(indent, '%s %s:' % (keyword, ' and '.join(conditions)))
+                inner = indent + 1
+            elif not first and not tail:
+                self._emit(indent, 'else:')
+                inner = indent + 1
+            first = False
+
+            branch_env = dict(env)
+            used = _variables(body, set())
+            for name, part in bindings:
+                if name not in used:
+                    continue
+                if part == access:
+                    branch_env[name] = scrutinee
+                else:
+                    local = self._fresh(name)
+                    self._emit(inner, '%s = %s' % (local, part))
+                    branch_env[name] = ('name', local)
+            atom = self._expression(body, branch_env, dict(calls), inner, tail)
+            if not tail:
+                self._emit(inner, '%s = %s' % (result, self._render(atom)))
+            if not conditions:
+                exhaustive = True
+                break
+
+        if not exhaustive:
+            if not tail:
+                self._emit(indent, 'else:')
+                self._emit(indent + 1, 'raise ValueError("No rule matched")')
+            else:
+                self._emit(indent, 'raise ValueError("No rule matched")')
+        if tail:
+            return None
+        return ('name', result)
+
+
+###
+# Loading programs
+###
+
+# Compiled programs and AIs, by the hash of their tokens
+_programs = {}
+_ais = {}
+
+def _programHash(source):
+    tokens = _tokenize(source)
+    return hashlib.sha1(' '.join(text for kind, text in tokens)).hexdigest()
+
+def compile_program(source):
+    """Compile an ML program for f to a Python function.
+
+    The function takes the arguments of f in npc.sml, as values in the
+    representation described at the top of this module, and returns a
+    direction name. Its Python source is kept in its `source` attribute.
+
+    Arguments:
+    - `source`: The ML source of the program.
+    """
+    key = _programHash(source)
+    if key not in _programs:
+        parameters, body = _Parser(_tokenize(source)).program()
+        code = _Compiler().function(parameters, body)
+        namespace = dict(_NAMESPACE)
+        exec compile(code, '<adate %s>' % key[:12], 'exec') in namespace
+        program = namespace['f']
+        program.source = code
+        program.hash = key
+        _programs[key] = program
+    return _programs[key]
+
+def entity(entity):
+    """Get the value of an Entity as the compiled programs represent it.
+
+    Arguments:
+    - `entity`: The entity.
+    """
+    shape = entity.getShape()
+    if shape.TAG == RECT:
+        return (RECT, (shape.x, shape.y), shape.getSize())
+    return (CIRCLE, (shape.x, shape.y), shape.getRadius())
+
+def compile_ai(source):
+    """Compile an ML program for f to a dog AI for Simulation and Game.
+
+    The AI passes the dog, its id, the cat, the two nearest dogs, the goal
+    and the field to the program, as aiStep in npc.sml does. Simulations give
+    it the id and nearest dogs from their neighbours; when called without
+    them, it works them out itself.
+
+    Arguments:
+    - `source`: The ML source of the program.
+    """
+    program = compile_program(source)
+    if program.hash not in _ais:
+        @with_neighbours
+        def dog_ai(current, cat, dogs, goal, field, dog_id=None,
+                   nearest=None):
+            if nearest is None:
+                index = 0
+                while index < len(dogs) and dogs[index] is not current:
+                    index += 1
+                neighbours = Neighbours([dog.getPosition() for dog in dogs])
+                dog_id = neighbours.dogId(index)
+                if index < len(dogs):
+                    nearest = [dogs[i] for i in neighbours.nearest(index)]
+                else:
+                    nearest = []
+            return program(entity(current), dog_id, entity(cat),
+                           tuple(entity(dog) for dog in nearest),
+                           entity(goal), (float(field[0]), float(field[1])))
+        dog_ai.program = program
+        _ais[program.hash] = dog_ai
+    return _ais[program.hash]
+
+def load_ai(path):
+    """Compile the ML program for f in a file to a dog AI.
+
+    Arguments:
+    - `path`: The path of the file.
+    """
+    with open(path) as program:
+        return compile_ai(program.read())
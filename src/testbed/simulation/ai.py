@@ -1,10 +1,58 @@
 import random
 from math import *
+import numpy as np
 from simulation.chars import *
 from simulation.util import *
+from simulation.potential import CostGrid
 
 _cat_move = ""
 
+# The speed and sizes of the entities in Simulation, which batched AIs are
+# not passed
+_CAT_SPEED = 2.0
+_CAT_RADIUS = 0.75
+_DOG_SIZE = (1.5, 1.5)
+_GOAL_SIZE = (5, 2)
+
+def batched(ai):
+    """Mark an AI function as batched.
+
+    A batched AI decides for many entities in one call. Instead of entities it
+    is passed NumPy arrays of positions: `current` holds the positions of the
+    entities to decide for, `cat` has shape (..., 2), `dogs` has shape
+    (..., num_dogs, 2), `goal` has shape (2,) and `field` is the field size.
+    The leading dimensions, if any, are the games being simulated. It returns
+    an array of indices into DIRECTIONS with the shape of `current` minus its
+    last axis, where -1 means staying put.
+
+    Simulation calls a batched AI once per tick for all the entities it
+    controls, and BatchSimulation once per tick for all the games.
+    """
+    ai.batched = True
+    return ai
+
+def with_neighbours(ai):
+    """Mark a scalar dog AI as wanting the view of the dogs npc.sml gives.
+
+    Such an AI is called with two more keyword arguments: `dog_id`, the id
+    of the dog (dog_1 to dog_4), and `nearest`, a list of the dog entities
+    nearest to it, nearest first. See simulation.neighbours.
+    """
+    ai.neighbours = True
+    return ai
+
+def _axis_direction(diff):
+    """Batched version of the direction choice shared by several AIs.
+
+    Chooses the axis with the largest difference and the direction along it
+    that decreases the difference, in the same way as follower_ai.
+    """
+    diffx = diff[..., 0]
+    diffy = diff[..., 1]
+    return np.where(np.abs(diffx) > np.abs(diffy),
+                    np.where(diffx > 0, 1, 0),
+                    np.where(diffy > 0, 3, 2))
+
 def control_ai(current, cat, dogs, goal, field):
     """Control AI.
 
@@ -14,11 +62,68 @@ def control_ai(current, cat, dogs, goal, field):
     return _cat_move
 
 
-def random_ai(current, cat, dogs, goal, field):
+class RandomAI(object):
     """Randomly moving AI
 
+    Moves are drawn from a random number generator in bulk, two bits per
+    move, and handed out one per call. Simulations bind the AI to their own
+    generator, so each game gets its own reproducible stream of moves.
     """
-    return random.choice(('left','right','up','down'))
+
+    # How many moves to draw when running out
+    CHUNK = 64
+
+    def __init__(self, rng=None, moves=0):
+        """Set up the AI.
+
+        Arguments:
+        - `rng`: The random.Random to draw from, defaults to the random module.
+        - `moves`: The number of moves to draw up front.
+        """
+        self._random = rng if rng is not None else random
+        self._moves = []
+        if moves > 0:
+            self._draw(moves)
+
+    def bind(self, rng, moves):
+        """Get a copy of the AI drawing from the given generator.
+
+        Arguments:
+        - `rng`: The random.Random to draw from.
+        - `moves`: The number of moves expected to be needed.
+        """
+        return RandomAI(rng, moves)
+
+    def _draw(self, count):
+        """Draw the next `count` moves from the generator.
+        """
+        bits = self._random.getrandbits(2*count)
+        moves = [DIRECTIONS[(bits >> (2*i)) & 3] for i in range(count)]
+        # Moves are popped off the end
+        moves.reverse()
+        self._moves = moves
+
+    def __call__(self, current, cat, dogs, goal, field):
+        if not self._moves:
+            self._draw(self.CHUNK)
+        return self._moves.pop()
+
+random_ai = RandomAI()
+
+def bind_ai(ai, rng, moves):
+    """Bind an AI to a simulation's random number generator.
+
+    AIs that need randomness have a `bind` method returning a copy of the AI
+    drawing from the given generator, other AIs are returned as they are.
+
+    Arguments:
+    - `ai`: The AI to bind.
+    - `rng`: The simulation's random.Random.
+    - `moves`: The number of moves the AI is expected to make.
+    """
+    if hasattr(ai, 'bind'):
+        return ai.bind(rng, moves)
+    return ai
 
 def exit_achiever(current, cat, dogs, goal, field):
     """Exit-achieving cat
@@ -37,6 +142,12 @@ def exit_achiever(current, cat, dogs, goal, field):
         else:
             return 'up'
 
+@batched
+def exit_achiever_batch(current, cat, dogs, goal, field):
+    """Batched version of exit_achiever.
+    """
+    return _axis_direction(goal - current)
+
 def pfb_cost(x,y,dogs,goal):
         cost = 0.0
         for dog in dogs:
@@ -48,62 +159,172 @@ def pfb_cost(x,y,dogs,goal):
         cost += sqrt((4*(goal.x-x))**2 + (4*(goal.y-y))**2)
         return cost
 
-def potential_field_cat(current, cat, dogs, goal, field):
+# The directions tried by the potential field cat, in the order specified to
+# ensure match with ML-code (right, left, up, down), as indices into
+# DIRECTIONS and as unit vectors
+_FIELD_ORDER = np.array([1, 0, 2, 3])
+_FIELD_RAYS = np.array([[1.0, 0.0], [-1.0, 0.0], [0.0, -1.0], [0.0, 1.0]])
+
+def _potential_field(cat, dogs, goal, field, speed, radius, step):
+    """Choose the potential field move for any number of cats at once.
+
+    Every sample point of the four rays of every cat is laid out in one
+    array, and the costs are computed for all of them by broadcasting. The
+    points and sums are built in the same order as the scalar loop over
+    pfb_cost in npc.sml, so the choices are bit for bit the same.
+
+    Returns indices into DIRECTIONS, or -1 where no direction is cheaper
+    than the initial minimum.
+
+    Arguments:
+    - `cat`: Positions of the cats, shape (..., 2).
+    - `dogs`: Positions of the dogs, shape (..., num_dogs, 2).
+    - `goal`: Position of the goal, shape (2,).
+    - `field`: The size of the field.
+    - `speed`: The speed of the cats.
+    - `radius`: The radius of the cats.
+    - `step`: The distance between the samples along a ray.
+    """
+    cat = np.asarray(cat, dtype=np.float64)
+    dogs = np.asarray(dogs, dtype=np.float64).reshape(cat.shape[:-1] + (-1, 2))
+    field = np.asarray(field, dtype=np.float64)
+
+    # The rays, shape (..., 4, 2), with their ends kept inside the field
+    begin = cat[..., np.newaxis, :]
+    end = np.maximum(radius, np.minimum(begin + _FIELD_RAYS*speed,
+                                        field - radius))
+    dirvector = end - begin
+    normlength = np.sqrt(dirvector[..., 0]**2 + dirvector[..., 1]**2)
+    moving = normlength > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        motionvector = dirvector/(normlength*(1.0/step))[..., np.newaxis]
+    motionvector[~moving] = 0.0
+
+    # The sample points, shape (samples, ..., 4, 2). Each is the previous
+    # one plus the motion vector, and cumsum adds in that order.
+    samples = int(1.001*speed/step) + 2
+    steps = np.empty((samples,) + motionvector.shape)
+    steps[0] = begin
+    steps[1:] = motionvector
+    points = np.cumsum(steps, axis=0)
+
+    # A ray is sampled until the point after the last sample is too far
+    # along it, and rays of length zero only at their beginning
+    with np.errstate(divide='ignore', invalid='ignore'):
+        traveled = np.sqrt((points[1:, ..., 0] - begin[..., 0])**2 +
+                           (points[1:, ..., 1] - begin[..., 1])**2)/normlength
+        inside = (traveled <= 1.001) & moving
+    sampled = np.empty(points.shape[:-1], dtype=bool)
+    sampled[0] = True
+    sampled[1:] = np.logical_and.accumulate(inside, axis=0)
+
+    # pfb_cost of every sample point. The dogs and the samples are the
+    # outermost axes when summing, so NumPy adds them one at a time, in order.
+    x = points[..., 0]
+    y = points[..., 1]
+    dogs = np.moveaxis(dogs, -2, 0)[:, np.newaxis, ..., np.newaxis, :]
+    dogdist = np.abs(dogs[..., 0] - x) + np.abs(dogs[..., 1] - y)
+    hits = dogdist == 0
+    dogdist[hits] = 1.0
+    dogcost = 75/dogdist
+    dogcost[hits] = 2.0**32
+    cost = (np.add.reduce(dogcost, axis=0, initial=0.0) +
+            np.sqrt((4*(goal[0] - x))**2 + (4*(goal[1] - y))**2))
+    cost[~sampled] = 0.0
+    average = cost.sum(axis=0)/sampled.sum(axis=0)
+
+    best = np.argmin(average, axis=-1)
+    return np.where(average.min(axis=-1) < 1000000., _FIELD_ORDER[best], -1)
+
+class PotentialFieldCat(object):
     """A Potential-Field Based cat AI
 
+    The cat tries a step in each direction and picks the one with the lowest
+    average field cost along the way. In exact mode every sample of the field
+    is computed from the dogs and the goal, as in npc.sml. In grid mode the
+    field is sampled once per dog movement on a simulation.potential.CostGrid,
+    and the rays are averaged from interpolated lookups, which is much faster
+    but only approximates the exact choices.
+    """
+
+    # The distance between the samples along a ray
+    STEP = 0.25
+
+    def __init__(self, grid=False, resolution=2):
+        """Set up the AI.
+
+        Arguments:
+        - `grid`: Whether to use the cost grid instead of exact costs.
+        - `resolution`: The number of grid points per unit.
+        """
+        self._use_grid = grid
+        self._resolution = resolution
+        self._grid = None
+
+    def bind(self, rng, moves):
+        """Get a copy of the AI with its own cost grid.
+
+        Arguments:
+        - `rng`: The simulation's random.Random, unused.
+        - `moves`: The number of moves expected to be needed, unused.
+        """
+        if not self._use_grid:
+            return self
+        return PotentialFieldCat(self._use_grid, self._resolution)
+
+    def getGrid(self, field):
+        """Get the cost grid of the AI, which other AIs may query too.
+
+        Arguments:
+        - `field`: The size of the field.
+        """
+        if self._grid is None or self._grid.getField() != tuple(field):
+            self._grid = CostGrid(field, self._resolution)
+        return self._grid
+
+    def __call__(self, current, cat, dogs, goal, field):
+        if not self._use_grid:
+            move = _potential_field((cat.x, cat.y),
+                                    [(dog.x, dog.y) for dog in dogs],
+                                    (goal.x, goal.y), field,
+                                    current.getSpeed(), cat.radius, self.STEP)
+            return DIRECTIONS[move] if move >= 0 else ""
+
+        grid = self.getGrid(field)
+        grid.update(dogs, goal)
+        radius = cat.radius
+        speed = current.getSpeed()
+        DIRS = {
+            "left": (-speed, 0.0),
+            "right": (speed, 0.0),
+            "up": (0.0, -speed),
+            "down": (0.0, speed)
+        }
+        mindir = ""
+        mincost = 1000000. #Arbitrary high number
+
+        # Order specified to ensure match with ML-code
+        for direction in ("right", "left", "up", "down"):
+            (vx, vy) = DIRS[direction]
+            end = (max(radius, min(cat.x+vx, field[0]-radius)),
+                   max(radius, min(cat.y+vy, field[1]-radius)))
+            c = grid.rayCost((cat.x, cat.y), end, self.STEP)
+            if c < mincost:
+                mindir = direction
+                mincost = c
+        return mindir
+
+potential_field_cat = PotentialFieldCat()
+potential_field_cat_grid = PotentialFieldCat(grid=True)
+
+@batched
+def potential_field_cat_batch(current, cat, dogs, goal, field):
+    """Batched version of potential_field_cat in exact mode.
+
+    The cats are taken to have the speed and radius of the cat in Simulation.
     """
-    def diravgcost(dogs, goal, begin, end, step):
-        def ensureInside(pos):
-            radius = cat.radius
-            return (
-                max(radius,
-                    min(pos[0],
-                        field[0]-radius)),
-                max(radius,
-                    min(pos[1],
-                        field[1]-radius))
-            )
-
-        end = ensureInside(end)
-        if begin == end:
-            return pfb_cost(begin[0], begin[1], dogs, goal)
-
-        dirvector = (end[0]-begin[0], end[1]-begin[1])
-        normlength = sqrt(dirvector[0]**2+dirvector[1]**2)
-        motionvector = (dirvector[0]/(normlength * (1.0/step)), dirvector[1]/(normlength * (1.0/step)))
-        x,y = begin
-        steps = 0
-        costsum = 0.0
-        going = True
-        while going:
-            c = pfb_cost(x, y, dogs, goal)
-            costsum += c
-            steps += 1
-            x += motionvector[0]
-            y += motionvector[1]
-            traveled = sqrt((x-begin[0])**2 + (y-begin[1])**2)/normlength
-            if traveled > 1.001:
-                going = False
-        return costsum/steps
-
-    speed = current.getSpeed()
-    DIRS = {
-        "left": (-speed, 0.0),
-        "right": (speed, 0.0),
-        "up": (0.0, -speed),
-        "down": (0.0, speed)
-    }
-    mindir = ""
-    mincost = 1000000. #Arbitrary high number
-
-    # Order specified to ensure match with ML-code
-    for direction in ("right", "left", "up", "down"):
-        (vx, vy) = DIRS[direction]
-        c = diravgcost(dogs, goal, (cat.x, cat.y), (cat.x+vx, cat.y+vy), 0.25)
-        if c < mincost:
-            mindir = direction
-            mincost = c
-    return mindir
+    return _potential_field(current, dogs, goal, field, _CAT_SPEED,
+                            _CAT_RADIUS, PotentialFieldCat.STEP)
 
 def follower_ai(current, cat, dogs, goal, field):
     """Follower AI for Dog.
@@ -123,6 +344,35 @@ def follower_ai(current, cat, dogs, goal, field):
         else:
             return 'up'
 
+@batched
+def follower_ai_batch(current, cat, dogs, goal, field):
+    """Batched version of follower_ai.
+    """
+    return _axis_direction(cat[..., np.newaxis, :] - current)
+
+def _rect_rect_batch(x1, y1, w1, h1, x2, y2, w2, h2):
+    """Batched version of rect_rect.
+    """
+    return ~((y1 + (h1/2.0) < y2 - (h2/2.0)) |
+             (y1 - (h1/2.0) > y2 + (h2/2.0)) |
+             (x1 + (w1/2.0) < x2 - (w2/2.0)) |
+             (x1 - (w1/2.0) > x2 + (w2/2.0)))
+
+def _circle_rect_batch(cx, cy, radius, rx, ry, rw, rh):
+    """Batched version of circle_rect.
+    """
+    distance_x = np.abs(cx - rx)
+    distance_y = np.abs(cy - ry)
+    collide_width = rw/2.
+    collide_height = rh/2.
+    square_corner_dist = ((distance_x - collide_width)**2 +
+                          (distance_y - collide_height)**2)
+    return ((distance_x <= (collide_width + radius)) &
+            (distance_y <= (collide_height + radius)) &
+            ((distance_x <= collide_width) |
+             (distance_y <= collide_height) |
+             (square_corner_dist <= radius**2)))
+
 # fun f( Self, Cat, Dogs, Goal, Field ) =
 #  case
 #    collide(
@@ -139,12 +389,49 @@ def follower_ai(current, cat, dogs, goal, field):
 #        | true => left
 #      )
 def f(current, cat, dogs, goal, field):
-    if collideShapes(Circle(getDistance(current, goal), getQuadDistance(goal, cat)),
-                     current.getShape()):
+    # getDistance(A, B) is (B.x-A.x, B.x-A.x), so both the circle and the rect
+    # below are centered on the diagonal. The shapes are never built; their
+    # coordinates go straight to the float collision predicates.
+    self_goal = goal.x - current.x
+    goal_cat = cat.x - goal.x
+    radius = sqrt(goal_cat**2 + goal_cat**2)
+    shape = current.getShape()
+    if shape.TAG == RECT:
+        (width, height) = shape.getSize()
+        hit = circle_rect(self_goal, self_goal, radius,
+                          shape.x, shape.y, width, height)
+    else:
+        hit = circle_circle(self_goal, self_goal, radius,
+                            shape.x, shape.y, shape.getRadius())
+    if hit:
         return 'right'
     else:
-        if collideShapes(goal.getShape(),
-                         Rect(getDistance(goal, cat), field)):
+        (goal_width, goal_height) = goal.size
+        if rect_rect(goal.x, goal.y, goal_width, goal_height,
+                     goal_cat, goal_cat, field[0], field[1]):
             return 'up'
         else:
             return 'left'
+
+@batched
+def f_batch(current, cat, dogs, goal, field):
+    """Batched version of f.
+
+    What only depends on the cat and the goal is computed once per game and
+    shared by all the dogs deciding in it.
+    """
+    self_goal = goal[0] - current[..., 0]
+    goal_cat = cat[..., 0] - goal[0]
+    radius = np.sqrt(goal_cat**2 + goal_cat**2)
+    up = _rect_rect_batch(goal[0], goal[1], _GOAL_SIZE[0], _GOAL_SIZE[1],
+                          goal_cat, goal_cat, field[0], field[1])
+    if current.ndim > cat.ndim:
+        radius = radius[..., np.newaxis]
+        up = up[..., np.newaxis]
+        hit = _circle_rect_batch(self_goal, self_goal, radius,
+                                 current[..., 0], current[..., 1],
+                                 _DOG_SIZE[0], _DOG_SIZE[1])
+    else:
+        hit = ((self_goal - current[..., 0])**2 +
+               (self_goal - current[..., 1])**2 <= (radius + _CAT_RADIUS)**2)
+    return np.where(hit, 1, np.where(up, 2, 0))
@@ -0,0 +1,278 @@
+import random
+
+import numpy as np
+
+import simulation.ai as ai
+from simulation import Simulation
+from simulation.chars import Entity, Rect, Circle
+from simulation.neighbours import Neighbours
+from simulation.util import DIRECTIONS
+
+# Movement deltas per direction index. The extra trailing entry is "stay",
+# which is what index -1 (an unknown direction) maps to.
+_DX = np.array([-1.0, 1.0, 0.0, 0.0, 0.0])
+_DY = np.array([0.0, 0.0, -1.0, 1.0, 0.0])
+_DIRECTION_INDEX = dict((d, i) for i, d in enumerate(DIRECTIONS))
+
+
+class BatchSimulation(object):
+    """Runs many simulations of the game in lockstep.
+
+    The positions of the cats and dogs of every game are kept in NumPy arrays,
+    and every step of Simulation.simtick is applied to all the games at once.
+    Given the same starting positions and AIs, each game plays out exactly as
+    it would in a Simulation.
+
+    AIs marked with ai.batched decide for all the games in one call, other AIs
+    are called once per entity per game, as in Simulation.
+    """
+
+    CAT_RADIUS = Simulation.CAT_RADIUS
+    DOG_SIZE = Simulation.DOG_SIZE
+    GOAL_SIZE = Simulation.GOAL_SIZE
+    CAT_SPEED = Simulation.CAT_SPEED
+    DOG_SPEED = Simulation.DOG_SPEED
+    MAX_TICKS = Simulation.MAX_TICKS
+
+    def __init__(self, cat_ai, dog_ai, cats, dogs, field_size=(16,16),
+                 seed=None):
+        """Initialize the simulations.
+
+        Arguments:
+        - `cat_ai`: The AI used for the cats.
+        - `dog_ai`: The AI used for the dogs.
+        - `cats`: The start positions of the cats, shape (games, 2).
+        - `dogs`: The start positions of the dogs, shape (games, dogs, 2).
+        - `field_size`: The size of the field.
+        - `seed`: Seed for the random number generator used by the AIs. If
+          not given, one is drawn from the random module.
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        self._seed = seed
+        self._random = random.Random(seed)
+
+        self._cats = np.array(cats, dtype=np.float64).reshape(-1, 2)
+        self._dogs = np.array(dogs, dtype=np.float64)
+        if self._dogs.ndim != 3 or len(self._dogs) != len(self._cats):
+            raise ValueError("dogs must have shape (%d, num_dogs, 2)" %
+                             len(self._cats))
+        num_games = len(self._cats)
+        self._field_size = field_size
+        self._field = np.array(field_size, dtype=np.float64)
+        self._goal = np.array((field_size[0]/2.0, self.GOAL_SIZE[1]/2.0))
+        self._gameover = np.zeros(num_games, dtype=bool)
+        self._win = np.zeros(num_games, dtype=bool)
+        self._game_ticks = np.zeros(num_games, dtype=np.int64)
+        self._ticks = 0
+
+        self._cat_ai = ai.bind_ai(cat_ai, self._random,
+                                  self.MAX_TICKS*num_games)
+        self._dog_ai = ai.bind_ai(dog_ai, self._random,
+                                  self.MAX_TICKS*self._dogs[..., 0].size)
+        self._entities = None
+        if not (getattr(self._cat_ai, 'batched', False) and
+                getattr(self._dog_ai, 'batched', False)):
+            self._entities = self._makeEntities()
+
+    def _makeEntities(self):
+        """Make Entity objects mirroring each game, for use by scalar AIs.
+        """
+        goal = Entity(Rect(tuple(self._goal), self.GOAL_SIZE), 0.0)
+        entities = []
+        for cat, dogs in zip(self._cats, self._dogs):
+            entities.append((
+                Entity(Circle(tuple(cat), self.CAT_RADIUS), self.CAT_SPEED),
+                [Entity(Rect(tuple(dog), self.DOG_SIZE), self.DOG_SPEED)
+                 for dog in dogs],
+                goal))
+        return entities
+
+    def getState(self, ):
+        """Get the state of all the simulations.
+
+        Returns the positions of all the entities, whether each game is over,
+        whether it was won and how many ticks it has been played for.
+        """
+        state = {}
+        state["cats"] = self._cats.copy()
+        state["dogs"] = self._dogs.copy()
+        state["goal"] = tuple(self._goal)
+        state["gameover"] = self._gameover.copy()
+        state["win"] = self._win.copy()
+        state["ticks"] = self._game_ticks.copy()
+        return state
+
+    def getSeed(self, ):
+        """Get the seed of the random number generator used by the AIs.
+        """
+        return self._seed
+
+    def getFieldSize(self, ):
+        """Get the size of the game field.
+        """
+        return self._field_size
+
+    def isDone(self, ):
+        """Check whether all the games are over.
+        """
+        return bool(self._gameover.all())
+
+    def run(self, ):
+        """Tick the simulations until every game is over.
+        """
+        while not self.isDone():
+            self.simtick()
+        return self.getState()
+
+    def simtick(self, ):
+        """Do one tick of all the simulations.
+        """
+        if self._ticks >= self.MAX_TICKS:
+            self._win |= ~self._gameover
+            self._gameover[:] = True
+        active = ~self._gameover
+        if active.any():
+            cat_moves, dog_moves = self._aiStep(active)
+            self._updateState(cat_moves, dog_moves, active)
+            dog_hit, goal_hit = self._checkCollisions()
+            ended = active & (dog_hit | goal_hit)
+            self._gameover |= ended
+            self._win[ended] = goal_hit[ended]
+            self._game_ticks[active] += 1
+        self._ticks += 1
+        return self.getState()
+
+    def _aiStep(self, active):
+        """Do one AI step for the games that are still going.
+
+        Returns the direction indices chosen for the cats, shape (games,), and
+        for the dogs, shape (games, dogs).
+        """
+        if getattr(self._cat_ai, 'batched', False):
+            cat_moves = np.asarray(self._cat_ai(self._cats, self._cats,
+                                                self._dogs, self._goal,
+                                                self._field_size))
+        else:
+            cat_moves = np.full(len(self._cats), -1, dtype=np.int64)
+        if getattr(self._dog_ai, 'batched', False):
+            dog_moves = np.asarray(self._dog_ai(self._dogs, self._cats,
+                                                self._dogs, self._goal,
+                                                self._field_size))
+        else:
+            dog_moves = np.full(self._dogs.shape[:2], -1, dtype=np.int64)
+
+        if self._entities is not None:
+            self._scalarAiStep(active, cat_moves, dog_moves)
+        return cat_moves, dog_moves
+
+    def _scalarAiStep(self, active, cat_moves, dog_moves):
+        """Fill in the moves of the AIs that are not batched.
+
+        The mirrored entities of each active game are synchronized with the
+        arrays, then the scalar AIs are called exactly as Simulation does.
+        """
+        cat_batched = getattr(self._cat_ai, 'batched', False)
+        dog_batched = getattr(self._dog_ai, 'batched', False)
+        field = self._field_size
+        for g in np.flatnonzero(active):
+            cat, dogs, goal = self._entities[g]
+            cat.setPosition(self._cats[g].tolist())
+            for dog, pos in zip(dogs, self._dogs[g].tolist()):
+                dog.setPosition(pos)
+            if not cat_batched:
+                move = self._cat_ai(cat, cat, dogs, goal, field)
+                cat_moves[g] = _DIRECTION_INDEX.get(move, -1)
+            if dog_batched:
+                continue
+            if getattr(self._dog_ai, 'neighbours', False):
+                neighbours = Neighbours(self._dogs[g])
+                for i, dog in enumerate(dogs):
+                    nearest = [dogs[j] for j in neighbours.nearest(i)]
+                    move = self._dog_ai(dog, cat, dogs, goal, field,
+                                        dog_id=neighbours.dogId(i),
+                                        nearest=nearest)
+                    dog_moves[g, i] = _DIRECTION_INDEX.get(move, -1)
+            else:
+                for i, dog in enumerate(dogs):
+                    move = self._dog_ai(dog, cat, dogs, goal, field)
+                    dog_moves[g, i] = _DIRECTION_INDEX.get(move, -1)
+
+    def _updateState(self, cat_moves, dog_moves, active):
+        """Move the entities of the active games according to the moves.
+
+        Arguments:
+        - `cat_moves`: Direction indices for the cats.
+        - `dog_moves`: Direction indices for the dogs.
+        - `active`: Mask of the games that are still going.
+        """
+        cat_moves = np.where(active, cat_moves, -1)
+        dog_moves = np.where(active[:, np.newaxis], dog_moves, -1)
+        self._cats[:, 0] += _DX[cat_moves]*self.CAT_SPEED
+        self._cats[:, 1] += _DY[cat_moves]*self.CAT_SPEED
+        self._dogs[..., 0] += _DX[dog_moves]*self.DOG_SPEED
+        self._dogs[..., 1] += _DY[dog_moves]*self.DOG_SPEED
+        self._ensureInside(self._cats, self.CAT_RADIUS, self.CAT_RADIUS)
+        self._ensureInside(self._dogs, self.DOG_SIZE[0]/2.0,
+                           self.DOG_SIZE[1]/2.0)
+
+    def _ensureInside(self, positions, half_width, half_height):
+        """Ensure that the entities are inside the field, in place.
+
+        Mirrors Simulation._ensureInside, including how the size of the
+        entity is derived from its bounds.
+
+        Arguments:
+        - `positions`: Positions of the entities, shape (..., 2).
+        - `half_width`: Half the width of the entities.
+        - `half_height`: Half the height of the entities.
+        """
+        x = positions[..., 0]
+        y = positions[..., 1]
+        left = x - half_width
+        right = x + half_width
+        top = y - half_height
+        bottom = y + half_height
+        width = right - left
+        height = bottom - top
+        positions[..., 0] = np.where(
+            left < 0, width*0.5,
+            np.where(right > self._field[0], self._field[0]-width*0.5, x))
+        positions[..., 1] = np.where(
+            top < 0, height*0.5,
+            np.where(bottom > self._field[1], self._field[1]-height*0.5, y))
+
+    def _collideCats(self, rects, size):
+        """Check each cat for collision with rectangles.
+
+        Vectorized version of util.collideCircleWithRect.
+
+        Arguments:
+        - `rects`: Rectangle centers, broadcastable against the cats.
+        - `size`: The size of the rectangles.
+        """
+        cats = self._cats
+        if rects.ndim == 3:
+            cats = cats[:, np.newaxis, :]
+        radius = self.CAT_RADIUS
+        distance_x = np.abs(cats[..., 0] - rects[..., 0])
+        distance_y = np.abs(cats[..., 1] - rects[..., 1])
+        collide_width = size[0]/2.
+        collide_height = size[1]/2.
+        square_corner_dist = ((distance_x - collide_width)**2 +
+                              (distance_y - collide_height)**2)
+        return ((distance_x <= collide_width + radius) &
+                (distance_y <= collide_height + radius) &
+                ((distance_x <= collide_width) |
+                 (distance_y <= collide_height) |
+                 (square_corner_dist <= radius**2)))
+
+    def _checkCollisions(self, ):
+        """Check for collisions between the cats and the other entities.
+
+        Returns a mask of the games where the cat hit a dog and a mask of the
+        games where it reached the goal.
+        """
+        dog_hit = self._collideCats(self._dogs, self.DOG_SIZE).any(axis=1)
+        goal_hit = self._collideCats(self._goal, self.GOAL_SIZE)
+        return dog_hit, goal_hit
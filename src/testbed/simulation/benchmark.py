@@ -0,0 +1,396 @@
+###
+# Benchmarks
+#--
+# Times the parts of the test bed that decide how fast games are played and
+# evaluated: Simulation.simtick with different numbers of dogs, every AI in
+# simulation.ai, the collision functions, the interest metric, the evaluator
+# and the dataset generation in inputgen. Each benchmark reports the time of
+# one operation, e.g. a tick or an AI decision, as the best of a few repeats.
+#
+# Results are saved to a JSON baseline, which later runs are compared against
+# to flag the benchmarks that got slower:
+#
+#   python -m simulation.benchmark --save baseline.json
+#   python -m simulation.benchmark --compare baseline.json --threshold 0.2
+###
+
+import imp
+import json
+import os
+import platform
+import random
+import sys
+from optparse import OptionParser
+from timeit import default_timer
+
+import numpy as np
+
+import simulation.ai as ai
+import simulation.interest as interest
+from simulation import Simulation
+from simulation.chars import Entity, Rect, Circle
+from simulation.evaluator import evaluate
+from simulation.util import rect_rect, circle_rect, circle_circle, collide
+
+# Where inputgen is found, next to the test bed
+INPUTGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, os.pardir, 'inputgen.py')
+
+# The registered benchmarks as (name, setup) pairs, in the order they run.
+# The setup prepares the data and returns the function to time and the number
+# of operations it does per call.
+BENCHMARKS = []
+
+FORMAT_VERSION = 1
+
+
+def benchmark(name):
+    """Register a benchmark setup function under a name.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+###
+# Data shared by the benchmarks
+###
+
+def _positions(count, num_dogs=4, seed=0):
+    """Get start positions of games, as Simulation places the entities.
+    """
+    states = []
+    for i in range(count):
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=num_dogs,
+                         seed=seed + i)
+        state = sim.getState()
+        states.append((state["cat"], state["dogs"], state["goal"]))
+    return states
+
+def _entities(count, num_dogs=4):
+    """Get the entities of games, as the scalar AIs are passed them.
+    """
+    entities = []
+    for cat, dogs, goal in _positions(count, num_dogs):
+        entities.append((
+            Entity(Circle(cat, Simulation.CAT_RADIUS), Simulation.CAT_SPEED),
+            [Entity(Rect(dog, Simulation.DOG_SIZE), Simulation.DOG_SPEED)
+             for dog in dogs],
+            Entity(Rect(goal, Simulation.GOAL_SIZE), 0.0)))
+    return entities
+
+def _inputgen():
+    """Import inputgen, None if it is not where it is expected.
+    """
+    if not os.path.exists(INPUTGEN):
+        return None
+    return imp.load_source('inputgen', INPUTGEN)
+
+
+###
+# Simulation
+###
+
+def _simtick(num_dogs, games=20):
+    def setup():
+        sims = [Simulation(ai.potential_field_cat, ai.f, num_dogs=num_dogs,
+                           seed=seed)
+                for seed in range(games)]
+        snaps = [sim.snapshot() for sim in sims]
+        def run():
+            for sim, snap in zip(sims, snaps):
+                sim.restore(snap)
+                while not sim.simtick()["gameover"]:
+                    pass
+        # Count the ticks where something moved
+        ticks = 0
+        for sim, snap in zip(sims, snaps):
+            sim.restore(snap)
+            while not sim.simtick()["gameover"]:
+                ticks += 1
+            ticks += sim.getMoves() is not None
+        return run, ticks
+    return setup
+
+for _num_dogs in (1, 4, 8, 16):
+    benchmark('simtick/dogs=%d' % _num_dogs)(_simtick(_num_dogs))
+
+
+###
+# AIs
+###
+
+def _scalarCatAI(cat_ai, count=200):
+    def setup():
+        entities = _entities(count)
+        bound = ai.bind_ai(cat_ai, random.Random(0), count)
+        field = (16, 16)
+        def run():
+            for cat, dogs, goal in entities:
+                bound(cat, cat, dogs, goal, field)
+        return run, count
+    return setup
+
+def _scalarDogAI(dog_ai, count=50):
+    def setup():
+        entities = _entities(count)
+        bound = ai.bind_ai(dog_ai, random.Random(0), 4*count)
+        field = (16, 16)
+        def run():
+            for cat, dogs, goal in entities:
+                for dog in dogs:
+                    bound(dog, cat, dogs, goal, field)
+        return run, 4*count
+    return setup
+
+def _batchedAI(batch_ai, dog, games=1000):
+    def setup():
+        positions = _positions(games)
+        cats = np.array([p[0] for p in positions])
+        dogs = np.array([p[1] for p in positions])
+        goal = np.array(positions[0][2])
+        current = dogs if dog else cats
+        field = (16, 16)
+        def run():
+            batch_ai(current, cats, dogs, goal, field)
+        return run, current[..., 0].size
+    return setup
+
+benchmark('ai/random_ai')(_scalarCatAI(ai.random_ai))
+benchmark('ai/exit_achiever')(_scalarCatAI(ai.exit_achiever))
+benchmark('ai/potential_field_cat')(_scalarCatAI(ai.potential_field_cat))
+benchmark('ai/potential_field_cat_grid')(
+    _scalarCatAI(ai.potential_field_cat_grid))
+benchmark('ai/follower_ai')(_scalarDogAI(ai.follower_ai))
+benchmark('ai/f')(_scalarDogAI(ai.f))
+benchmark('ai/exit_achiever_batch')(
+    _batchedAI(ai.exit_achiever_batch, False))
+benchmark('ai/potential_field_cat_batch')(
+    _batchedAI(ai.potential_field_cat_batch, False))
+benchmark('ai/follower_ai_batch')(_batchedAI(ai.follower_ai_batch, True))
+benchmark('ai/f_batch')(_batchedAI(ai.f_batch, True))
+
+
+###
+# Collisions
+###
+
+def _shapes(count=1000, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(0, 16), rng.uniform(0, 16), rng.uniform(0, 16),
+             rng.uniform(0, 16)) for i in range(count)]
+
+@benchmark('util/rect_rect')
+def _rect_rect():
+    pairs = _shapes()
+    def run():
+        for x1, y1, x2, y2 in pairs:
+            rect_rect(x1, y1, 1.5, 1.5, x2, y2, 1.5, 1.5)
+    return run, len(pairs)
+
+@benchmark('util/circle_rect')
+def _circle_rect():
+    pairs = _shapes()
+    def run():
+        for x1, y1, x2, y2 in pairs:
+            circle_rect(x1, y1, 0.75, x2, y2, 1.5, 1.5)
+    return run, len(pairs)
+
+@benchmark('util/circle_circle')
+def _circle_circle():
+    pairs = _shapes()
+    def run():
+        for x1, y1, x2, y2 in pairs:
+            circle_circle(x1, y1, 0.75, x2, y2, 0.75)
+    return run, len(pairs)
+
+@benchmark('util/collide')
+def _collide():
+    pairs = [(cat, dog) for cat, dogs, goal in _entities(250)
+             for dog in dogs]
+    def run():
+        for cat, dog in pairs:
+            collide(cat, dog)
+    return run, len(pairs)
+
+
+###
+# Interest and evaluation
+###
+
+@benchmark('interest/interest')
+def _interest(evaluations=10, runs=150, dogs=4, cells=256):
+    rng = np.random.RandomState(0)
+    ticks = rng.randint(1, 51, (evaluations, runs)).astype(np.float64)
+    visits = rng.poisson(0.2, (evaluations, runs, dogs, cells))
+    visits = visits.astype(np.float64)
+    def run():
+        interest.interest(ticks, visits)
+    return run, evaluations
+
+@benchmark('evaluator/evaluate')
+def _evaluate():
+    inputgen = _inputgen()
+    if inputgen is None:
+        return None
+    random.seed(0)
+    scenarios, test = inputgen.gen_data(num=4, runs=50, pct_test=0)
+    runs = sum(len(cats)*len(ais) for dogs, ais, cats in scenarios)
+    def run():
+        evaluate(ai.f_batch, scenarios)
+    return run, runs
+
+
+###
+# Dataset generation
+###
+
+@benchmark('inputgen/gen_data')
+def _gen_data(num=100):
+    inputgen = _inputgen()
+    if inputgen is None:
+        return None
+    def run():
+        random.seed(0)
+        inputgen.gen_data(num=num)
+    return run, num
+
+@benchmark('inputgen/make_sml')
+def _make_sml(num=100):
+    inputgen = _inputgen()
+    if inputgen is None:
+        return None
+    random.seed(0)
+    training, test = inputgen.gen_data(num=num, pct_test=0)
+    def run():
+        inputgen.make_sml(training)
+    return run, num
+
+
+###
+# Running and comparing
+###
+
+def time_benchmark(setup, repeat=3, min_time=0.2):
+    """Time a benchmark, returning the seconds per operation.
+
+    The function is called often enough to take at least `min_time` seconds,
+    and the best of `repeat` such runs is used. None if the benchmark can not
+    be run here.
+
+    Arguments:
+    - `setup`: The setup function of the benchmark.
+    - `repeat`: The number of runs.
+    - `min_time`: The least time a run should take.
+    """
+    prepared = setup()
+    if prepared is None:
+        return None
+    run, ops = prepared
+    number = 1
+    while True:
+        start = default_timer()
+        for i in range(number):
+            run()
+        elapsed = default_timer() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for i in range(repeat - 1):
+        start = default_timer()
+        for i in range(number):
+            run()
+        best = min(best, default_timer() - start)
+    return best/(number*ops)
+
+def run_benchmarks(names=None, repeat=3, min_time=0.2, log=None):
+    """Run the benchmarks, returning a baseline of their results.
+
+    Arguments:
+    - `names`: Run only the benchmarks whose names contain one of these.
+    - `repeat`, `min_time`: As for time_benchmark.
+    - `log`: File to report each result to as it is timed.
+    """
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and not any(part in name for part in names):
+            continue
+        seconds = time_benchmark(setup, repeat, min_time)
+        if seconds is None:
+            if log is not None:
+                log.write("%-34s skipped\n" % name)
+            continue
+        results[name] = seconds
+        if log is not None:
+            log.write("%-34s %12.3f us\n" % (name, 1e6*seconds))
+    return {"version": FORMAT_VERSION,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results}
+
+def compare(baseline, current, threshold=0.2):
+    """Compare results against a baseline.
+
+    Returns a list of (name, baseline seconds, current seconds, ratio,
+    regressed) for the benchmarks in both, where regressed tells whether the
+    benchmark got slower by more than the threshold.
+
+    Arguments:
+    - `baseline`: The baseline, as from run_benchmarks.
+    - `current`: The new results, as from run_benchmarks.
+    - `threshold`: The fraction a benchmark may get slower by.
+    """
+    rows = []
+    for name, seconds in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = seconds/base if base > 0 else float('inf')
+        rows.append((name, base, seconds, ratio, ratio > 1.0 + threshold))
+    return rows
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] [benchmark names]")
+    parser.add_option("-s", "--save", metavar="FILE",
+                      help="save the results as a baseline")
+    parser.add_option("-c", "--compare", metavar="FILE",
+                      help="compare the results against a baseline")
+    parser.add_option("-t", "--threshold", type="float", default=0.2,
+                      help="slowdown flagged as a regression, as a fraction "
+                      "[default: %default]")
+    parser.add_option("-r", "--repeat", type="int", default=3,
+                      help="runs of each benchmark [default: %default]")
+    parser.add_option("--min-time", type="float", default=0.2,
+                      help="least seconds per run [default: %default]")
+    options, names = parser.parse_args(argv)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as stream:
+            baseline = json.load(stream)
+    current = run_benchmarks(names, options.repeat, options.min_time,
+                             sys.stdout)
+    if options.save:
+        with open(options.save, 'w') as stream:
+            json.dump(current, stream, indent=2, sort_keys=True)
+    if baseline is None:
+        return 0
+
+    rows = compare(baseline, current, options.threshold)
+    print
+    print "%-34s %12s %12s %8s" % ("", "baseline us", "current us", "ratio")
+    for name, base, seconds, ratio, regressed in rows:
+        print "%-34s %12.3f %12.3f %8.3f%s" % (name, 1e6*base, 1e6*seconds,
+                                              ratio,
+                                              "  REGRESSION" if regressed
+                                              else "")
+    regressions = sum(row[4] for row in rows)
+    print "%d of %d benchmarks regressed by more than %d%%" % (
+        regressions, len(rows), round(100*options.threshold))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
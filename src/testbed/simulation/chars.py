@@ -1,22 +1,58 @@
+# Type tags of the shapes, used to pick collision routines
+RECT = 0
+CIRCLE = 1
+
 class Shape(object):
+    """The position and bounds of an entity.
+
+    The position is kept as two float fields and the bounds are cached, and
+    only recomputed when the shape moves or changes size. Subclasses set the
+    half width and height of the shape, and their type tag.
+    """
+
+    TAG = None
+
+    __slots__ = ('_x', '_y', '_half_width', '_half_height',
+                 '_left', '_right', '_top', '_bottom')
 
     def __init__(self, position):
-        self._position = list(position)
+        self._half_width = 0.0
+        self._half_height = 0.0
+        self.setPosition(position)
+
+    def _updateBounds(self):
+        """Recompute the cached bounds after a move or resize.
+        """
+        self._left = self._x - self._half_width
+        self._right = self._x + self._half_width
+        self._top = self._y - self._half_height
+        self._bottom = self._y + self._half_height
 
     def move(self, direction, speed):
         if direction == 'left':
-            self._position[0] -= speed
+            self._x -= speed
         elif direction == 'right':
-            self._position[0] += speed
+            self._x += speed
         elif direction == 'up':
-            self._position[1] -= speed
+            self._y -= speed
         elif direction == 'down':
-            self._position[1] += speed
+            self._y += speed
+        else:
+            return
+        self._updateBounds()
 
     def getPosition(self, ):
         """Gets the entity's position
         """
-        return tuple(self._position)
+        return (self._x, self._y)
+
+    @property
+    def x(self):
+        return self._x
+
+    @property
+    def y(self):
+        return self._y
 
     def setPosition(self, new_pos):
         """Set the entity's position
@@ -24,45 +60,57 @@ class Shape(object):
         Arguments:
         - `new_pos`:
         """
-        self._position = list(new_pos)
+        self._x = float(new_pos[0])
+        self._y = float(new_pos[1])
+        self._updateBounds()
+
+    def setCoordinates(self, x, y):
+        """Set the entity's position from separate coordinates
+
+        Arguments:
+        - `x`:
+        - `y`:
+        """
+        self._x = x
+        self._y = y
+        self._updateBounds()
 
     def getLeft(self):
-        return self._position[0]
+        return self._left
 
     def getRight(self):
-        return self._position[0]
+        return self._right
 
     def getTop(self):
-        return self._position[1]
+        return self._top
 
     def getBottom(self):
-        return self._position[1]
+        return self._bottom
 
 class Rect(Shape):
 
+    TAG = RECT
+
+    __slots__ = ('_size',)
+
     def __init__(self, position, size):
         super(Rect, self).__init__(position)
         self.setSize(size)
 
     def getSize(self):
-        return tuple(self._size)
+        return self._size
 
     def setSize(self, new_size):
-        self._size = list(new_size)
-
-    def getLeft(self):
-        return self._position[0] - (self._size[0]/2.0)
-
-    def getRight(self):
-        return self._position[0] + (self._size[0]/2.0)
+        self._size = tuple(new_size)
+        self._half_width = self._size[0]/2.0
+        self._half_height = self._size[1]/2.0
+        self._updateBounds()
 
-    def getTop(self):
-        return self._position[1] - (self._size[1]/2.0)
+class Circle(Shape):
 
-    def getBottom(self):
-        return self._position[1] + (self._size[1]/2.0)
+    TAG = CIRCLE
 
-class Circle(Shape):
+    __slots__ = ('_radius',)
 
     def __init__(self, position, radius):
         super(Circle, self).__init__(position)
@@ -73,23 +121,16 @@ class Circle(Shape):
 
     def setRadius(self, new_radius):
         self._radius = new_radius
-
-    def getLeft(self):
-        return self._position[0] - (self._radius)
-
-    def getRight(self):
-        return self._position[0] + (self._radius)
-
-    def getTop(self):
-        return self._position[1] - (self._radius)
-
-    def getBottom(self):
-        return self._position[1] + (self._radius)
+        self._half_width = new_radius
+        self._half_height = new_radius
+        self._updateBounds()
 
 class Entity(object):
     """An entity in the simulation.
     """
 
+    __slots__ = ('_shape', '_speed', '_last_direction')
+
     def __init__(self, shape, speed):
         """Set the entity's initial state.
 
@@ -128,6 +169,15 @@ class Entity(object):
         """
         self._shape.setPosition(new_pos)
 
+    def setCoordinates(self, x, y):
+        """Set the entity's position from separate coordinates
+
+        Arguments:
+        - `x`:
+        - `y`:
+        """
+        self._shape.setCoordinates(x, y)
+
     def getShape(self):
         return self._shape
 
@@ -142,11 +192,11 @@ class Entity(object):
 
     @property
     def x(self):
-        return self.getPosition()[0]
+        return self._shape._x
 
     @property
     def y(self):
-        return self.getPosition()[1]
+        return self._shape._y
 
     @property
     def radius(self):
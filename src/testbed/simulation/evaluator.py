@@ -0,0 +1,128 @@
+###
+# Headless scenario evaluator
+#--
+# Scores a dog AI against scenario lists such as the training_data and
+# test_data inputgen writes, the same way `main` in npc.sml does for the
+# induced function. Each scenario is a tuple of (dog positions, cat AI ids,
+# cat start positions), and every cat start position is played once with every
+# cat AI.
+#
+# The games are run with BatchSimulation, so no pygame or ML toolchain is
+# needed.
+###
+
+from collections import namedtuple
+
+import numpy as np
+
+import simulation.ai as ai
+from simulation.batch import BatchSimulation
+
+# Mirrors result(N, Ticks, Visits) in npc.sml. `ticks` has one entry per run
+# and `visits` has shape (runs, dogs, cells), holding how many times each dog
+# has been in each unit cell of the field. Runs are ordered like the ML lists,
+# which are built by consing, so the last run played comes first.
+Result = namedtuple('Result', ['N', 'ticks', 'visits'])
+
+def cat_ai_for(ai_id):
+    """Get the cat AI for an id in a scenario, as catAI in npc.sml does.
+    """
+    if ai_id == 1:
+        return ai.exit_achiever_batch
+    return ai.potential_field_cat_batch
+
+def _cellIndices(dogs, field_size):
+    """Get the index of the unit cell each dog is in, as increaseCell does.
+    """
+    return (np.floor(dogs[..., 0]) +
+            np.floor(dogs[..., 1])*field_size[0]).astype(np.int64)
+
+def _runGames(dog_ai, cat_ai, cats, dogs, field_size):
+    """Run a group of games to the end and count the dogs' cell visits.
+
+    Returns the ticks played and the cell visits of every game.
+    """
+    num_cells = int(field_size[0]*field_size[1])
+    sim = BatchSimulation(cat_ai, dog_ai, cats, dogs, field_size)
+    games, num_dogs = sim.getState()["dogs"].shape[:2]
+    visits = np.zeros((games, num_dogs, num_cells))
+    flat_visits = visits.reshape(games*num_dogs, num_cells)
+    rows = np.arange(games*num_dogs)
+    state = sim.getState()
+    while not sim.isDone():
+        ticks = state["ticks"]
+        state = sim.simtick()
+        # Only the games that made a move this tick count their visits
+        moved = np.repeat(state["ticks"] > ticks, num_dogs)
+        cells = _cellIndices(state["dogs"], field_size).ravel()
+        np.add.at(flat_visits, (rows[moved], cells[moved]), 1.0)
+    return state["ticks"].astype(np.float64), visits
+
+def evaluate(dog_ai, scenarios, field_size=(16,16)):
+    """Evaluate a dog AI on a list of scenarios.
+
+    Returns a list with one Result per scenario, like calling `main` from
+    npc.sml on each of them.
+
+    Arguments:
+    - `dog_ai`: The AI used for the dogs, scalar or batched.
+    - `scenarios`: A list of (dog positions, cat AI ids, cat positions).
+    - `field_size`: The size of the field.
+    """
+    # Lay out every run of every scenario, then group the runs by cat AI and
+    # number of dogs so that each group is simulated in one batch.
+    groups = {}
+    num_runs = 0
+    for dogs, ais, cats in scenarios:
+        for cat in cats:
+            for ai_id in ais:
+                key = (cat_ai_for(ai_id), len(dogs))
+                group = groups.setdefault(key, ([], [], []))
+                group[0].append(num_runs)
+                group[1].append(cat)
+                group[2].append(dogs)
+                num_runs += 1
+
+    ticks = [None]*num_runs
+    visits = [None]*num_runs
+    for (cat_ai, num_dogs), (indices, cats, dogs) in groups.items():
+        group_ticks, group_visits = _runGames(dog_ai, cat_ai, cats, dogs,
+                                             field_size)
+        for i, run in enumerate(indices):
+            ticks[run] = group_ticks[i]
+            visits[run] = group_visits[i]
+
+    results = []
+    start = 0
+    for dogs, ais, cats in scenarios:
+        end = start + len(cats)*len(ais)
+        results.append(Result(float(end - start),
+                              np.array(ticks[start:end][::-1]),
+                              np.array(visits[start:end][::-1])))
+        start = end
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from simulation.interest import results_interest
+    from simulation.adate import load_ai
+    from simulation.scenarios import load_dataset
+    # Score a dog AI from simulation.ai or an ADATE program on a dataset file
+    # written by inputgen, e.g. python -m simulation.evaluator ../dogs.json f
+    dataset = load_dataset(sys.argv[1])
+    name = sys.argv[2] if len(sys.argv) > 2 else 'f'
+    if name.endswith('.sml'):
+        dog_ai = load_ai(name)
+    else:
+        dog_ai = getattr(ai, name)
+    for name in ('training_data', 'test_data'):
+        start = time.time()
+        results = evaluate(dog_ai, dataset[name])
+        ticks = np.concatenate([r.ticks for r in results])
+        scores = results_interest(results)
+        print("%s: %d scenarios, %d runs, mean ticks %.3f, "
+              "mean interest %.8f (%.2fs)" %
+              (name, len(results), len(ticks), ticks.mean(), scores.mean(),
+               time.time() - start))
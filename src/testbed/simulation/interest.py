@@ -0,0 +1,140 @@
+###
+# Interest metric
+#--
+# A vectorized version of the `interest` function in npc.sml, which scores a
+# set of games by how challenging (T), how varied in length (S) and how
+# spatially diverse in dog movement (H) they are.
+#
+# Ticks are passed as an array of shape (..., runs) and cell visits as an
+# array of shape (..., runs, dogs, cells), where the leading dimensions index
+# independent evaluations, so many evaluations can be scored in one call.
+###
+
+import numpy as np
+
+# The parameters used by interest in npc.sml
+GAMMA = 1.0
+DELTA = 1.0
+EPSILON = 1.0
+P1 = 0.5
+P2 = 1.0
+P3 = 4.0
+T_MAX = 50.0
+T_MIN = 3.0
+
+def _runs(runs, n):
+    """Get N for each evaluation, which defaults to the number of runs.
+    """
+    if n is None:
+        n = runs
+    return np.asarray(n, dtype=np.float64)
+
+def _tickStats(ticks, n):
+    """Compute the mean, maximum and standard deviation of the ticks.
+
+    These are shared between T and S, so they are computed once.
+    """
+    avg = ticks.sum(axis=-1)/n
+    tick_max = np.maximum(ticks.max(axis=-1), 0.0)
+    std = np.sqrt(((ticks - avg[..., np.newaxis])**2).sum(axis=-1)/n)
+    return avg, tick_max, std
+
+def _challenge(avg, tick_max, p1):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (1.0 - avg/tick_max)**p1
+
+def _variation(std, n, p2, t_max, t_min):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (std/((0.5*np.sqrt(n/(n - 1.0)))*(t_max - t_min)))**p2
+
+def challenge(ticks, n=None, p1=P1):
+    """The T metric, high when the dogs kill the cat quickly.
+
+    Arguments:
+    - `ticks`: Ticks played in each run, shape (..., runs).
+    - `n`: The number of runs.
+    - `p1`: The weight the metric is raised to.
+    """
+    ticks = np.asarray(ticks, dtype=np.float64)
+    n = _runs(ticks.shape[-1], n)
+    if ticks.shape[-1] == 0:
+        return np.zeros(ticks.shape[:-1])
+    avg, tick_max, std = _tickStats(ticks, n)
+    return _challenge(avg, tick_max, p1)
+
+def variation(ticks, n=None, p2=P2, t_max=T_MAX, t_min=T_MIN):
+    """The S metric, high when the length of the runs varies a lot.
+
+    Arguments:
+    - `ticks`: Ticks played in each run, shape (..., runs).
+    - `n`: The number of runs.
+    - `p2`: The weight the metric is raised to.
+    - `t_max`: The maximum length of a run.
+    - `t_min`: The minimum length of a run.
+    """
+    ticks = np.asarray(ticks, dtype=np.float64)
+    n = _runs(ticks.shape[-1], n)
+    if ticks.shape[-1] == 0:
+        return np.zeros(ticks.shape[:-1])
+    avg, tick_max, std = _tickStats(ticks, n)
+    return _variation(std, n, p2, t_max, t_min)
+
+def diversity(visits, n=None, p3=P3):
+    """The H metric, high when the dogs spread their visits over the field.
+
+    The normalized entropy of each dog's cell visits is averaged over the
+    dogs of a run, then summed over the runs and divided by N.
+
+    Arguments:
+    - `visits`: Cell visits of each dog, shape (..., runs, dogs, cells).
+    - `n`: The number of runs.
+    - `p3`: The weight the metric is raised to.
+    """
+    visits = np.asarray(visits, dtype=np.float64)
+    n = _runs(visits.shape[-3], n)
+    if visits.shape[-3] == 0:
+        return np.zeros(visits.shape[:-3])
+    visit_sum = visits.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = visits/visit_sum[..., np.newaxis]
+        plogp = np.where(visits > 0.0, p*np.log(p), 0.0).sum(axis=-1)
+        hn = np.where(visit_sum < 2.0, 0.0,
+                      ((-1.0/np.log(visit_sum))*plogp)**p3)
+    return hn.mean(axis=-1).sum(axis=-1)/n
+
+def interest(ticks, visits, n=None, gamma=GAMMA, delta=DELTA, epsilon=EPSILON,
+             p1=P1, p2=P2, p3=P3, t_max=T_MAX, t_min=T_MIN):
+    """Compute the interest of one or many evaluations.
+
+    Returns the weighted average of T, S and H, or 0.0 for evaluations
+    without runs.
+
+    Arguments:
+    - `ticks`: Ticks played in each run, shape (..., runs).
+    - `visits`: Cell visits of each dog, shape (..., runs, dogs, cells).
+    - `n`: The number of runs, if it differs from the size of the arrays.
+    - `gamma`, `delta`, `epsilon`: The weights of T, S and H.
+    - `p1`, `p2`, `p3`: The exponents of T, S and H.
+    - `t_max`, `t_min`: The maximum and minimum length of a run.
+    """
+    ticks = np.asarray(ticks, dtype=np.float64)
+    n = _runs(ticks.shape[-1], n)
+    if ticks.shape[-1] == 0:
+        return np.zeros(ticks.shape[:-1])
+    avg, tick_max, std = _tickStats(ticks, n)
+    value = ((gamma*_challenge(avg, tick_max, p1) +
+              delta*_variation(std, n, p2, t_max, t_min) +
+              epsilon*diversity(visits, n, p3)) /
+             (gamma + delta + epsilon))
+    return np.where(n > 0.0, value, 0.0)
+
+def results_interest(results, **kwargs):
+    """Compute the interest of each of a list of evaluator Results.
+
+    The results must have the same number of runs and dogs, so they can be
+    scored in a single pass. Keyword arguments are passed on to interest.
+    """
+    return interest(np.array([r.ticks for r in results]),
+                    np.array([r.visits for r in results]),
+                    np.array([r.N for r in results]),
+                    **kwargs)
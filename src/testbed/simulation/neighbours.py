@@ -0,0 +1,92 @@
+###
+# Dog neighbours
+#--
+# The evolved dog programs see the world like `aiStep` in npc.sml shows it to
+# them: each dog is told its id, dog_1 to dog_4 by its place in the list of
+# dogs, and only gets the two dogs nearest to it, found by kNearest. The
+# Neighbours of a tick hold that view for every dog, worked out from one
+# matrix of the distances between all the dogs.
+###
+
+import numpy as np
+
+# The dog ids, by the index of the dog, as indexToDogId in npc.sml
+DOG_IDS = ('dog_1', 'dog_2', 'dog_3', 'dog_4')
+
+# How many of the nearest dogs each dog is shown, as in aiStep in npc.sml
+NEAREST_DOGS = 2
+
+
+def dog_id(index):
+    """Get the id of the dog at an index, as indexToDogId does.
+    """
+    return DOG_IDS[min(index, len(DOG_IDS) - 1)]
+
+
+class Neighbours(object):
+    """The dogs nearest to each dog, for one set of dog positions.
+
+    The nearest dogs are ordered by distance as kNearest orders them: a dog
+    never counts as its own neighbour, and dogs at the same distance keep the
+    order of the dog list.
+    """
+
+    def __init__(self, positions, k=NEAREST_DOGS):
+        """Work out the nearest dogs of every dog.
+
+        Arguments:
+        - `positions`: The positions of the dogs, shape (dogs, 2).
+        - `k`: How many of the nearest dogs to find.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        num_dogs = len(positions)
+        # getQuadDistance(Self, Other) is in row Self, column Other
+        diff = positions[np.newaxis, :, :] - positions[:, np.newaxis, :]
+        distances = np.sqrt(diff[..., 0]**2 + diff[..., 1]**2)
+        distances[np.arange(num_dogs), np.arange(num_dogs)] = np.inf
+        self._distances = distances
+
+        k = max(min(k, num_dogs - 1), 0)
+        if k == 0:
+            nearest = np.zeros((num_dogs, 0), dtype=np.int64)
+        elif k == num_dogs - 1:
+            nearest = np.argsort(distances, axis=1, kind='mergesort')[:, :k]
+        else:
+            # Only the k nearest are sorted. A dog tied with the k-th nearest
+            # may be left out by the partition in favour of a later one, so
+            # rows with such ties are sorted in full.
+            part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            selected = np.take_along_axis(distances, part, axis=1)
+            order = np.lexsort((part, selected), axis=-1)
+            nearest = np.take_along_axis(part, order, axis=1)
+            kth = selected.max(axis=1)
+            ties = (distances <= kth[:, np.newaxis]).sum(axis=1) > k
+            for row in np.flatnonzero(ties):
+                nearest[row] = np.argsort(distances[row], kind='mergesort')[:k]
+        self._nearest = nearest.tolist()
+
+    def __len__(self):
+        return len(self._nearest)
+
+    def getDistances(self, ):
+        """Get the matrix of distances between the dogs.
+
+        The distance of a dog to itself is infinite.
+        """
+        return self._distances
+
+    def nearest(self, index):
+        """Get the indices of the nearest dogs of a dog, nearest first.
+
+        Arguments:
+        - `index`: The index of the dog.
+        """
+        return self._nearest[index]
+
+    def dogId(self, index):
+        """Get the id of the dog at an index.
+
+        Arguments:
+        - `index`: The index of the dog.
+        """
+        return dog_id(index)
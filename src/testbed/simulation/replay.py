@@ -0,0 +1,277 @@
+###
+# Move logs
+#--
+# Games are fully determined by the start positions and the moves made, so a
+# game can be stored as its start positions and the moves alone. The moves
+# are packed in 2 bits per entity per tick, as an index into DIRECTIONS, which
+# is an order of magnitude smaller than storing the positions of every tick.
+# The rare ticks where an entity stays put are stored separately.
+#
+# Replayer rebuilds any tick of a logged game by making the logged moves in a
+# Simulation, without calling the AIs.
+###
+
+import struct
+
+import numpy as np
+
+from simulation import Simulation
+from simulation.util import DIRECTIONS
+
+# The header: magic, format version, number of dogs, number of ticks, number
+# of stays and the size of the field
+_HEADER = struct.Struct('<4sHHIIdd')
+_MAGIC = 'DEML'
+_VERSION = 1
+
+_DIRECTION_INDEX = dict((d, i) for i, d in enumerate(DIRECTIONS))
+# The move of an entity that stays put
+STAY = ""
+
+
+def _replay_only(current, cat, dogs, goal, field):
+    """AI for replays, which make the logged moves instead of calling AIs.
+    """
+    raise RuntimeError("Replayed games do not call the AIs")
+
+
+class MoveLog(object):
+    """The start positions and moves of a game.
+    """
+
+    def __init__(self, cat, dogs, field_size=(16,16)):
+        """Create an empty log.
+
+        Arguments:
+        - `cat`: The start position of the cat.
+        - `dogs`: The start positions of the dogs.
+        - `field_size`: The size of the field.
+        """
+        self._cat = tuple(float(c) for c in cat)
+        self._dogs = [tuple(float(c) for c in dog) for dog in dogs]
+        self._field_size = tuple(field_size)
+        self._entities = 1 + len(self._dogs)
+        # The direction index of every move, flattened, and the indices of
+        # the moves where the entity stayed put
+        self._codes = []
+        self._stays = set()
+
+    @classmethod
+    def fromSimulation(cls, sim):
+        """Create an empty log for a game that has not started yet.
+
+        Arguments:
+        - `sim`: The simulation, before its first tick.
+        """
+        state = sim.getState()
+        return cls(state["cat"], state["dogs"], sim.getFieldSize())
+
+    def __len__(self):
+        return len(self._codes)//self._entities
+
+    def getCat(self, ):
+        """Get the start position of the cat.
+        """
+        return self._cat
+
+    def getDogs(self, ):
+        """Get the start positions of the dogs.
+        """
+        return self._dogs
+
+    def getFieldSize(self, ):
+        """Get the size of the field.
+        """
+        return self._field_size
+
+    def append(self, moves):
+        """Log the moves of a tick.
+
+        Arguments:
+        - `moves`: The moves of the cat and the dogs, as from
+          Simulation.getMoves.
+        """
+        if len(moves) != self._entities:
+            raise ValueError("Expected %d moves, got %d" %
+                             (self._entities, len(moves)))
+        for move in moves:
+            code = _DIRECTION_INDEX.get(move)
+            if code is None:
+                self._stays.add(len(self._codes))
+                code = 0
+            self._codes.append(code)
+
+    def getMoves(self, tick):
+        """Get the moves of a tick.
+
+        Arguments:
+        - `tick`: The tick, counting from 0.
+        """
+        if not 0 <= tick < len(self):
+            raise IndexError("No tick %d in a log of %d" % (tick, len(self)))
+        first = tick*self._entities
+        return [STAY if i in self._stays else DIRECTIONS[self._codes[i]]
+                for i in range(first, first + self._entities)]
+
+    def toString(self, ):
+        """Pack the log into a string of bytes.
+        """
+        codes = np.zeros(-(-len(self._codes)//4)*4, dtype=np.uint8)
+        codes[:len(self._codes)] = self._codes
+        packed = (codes[0::4] | (codes[1::4] << 2) |
+                  (codes[2::4] << 4) | (codes[3::4] << 6))
+        positions = np.array([self._cat] + self._dogs, dtype='<f8')
+        stays = np.array(sorted(self._stays), dtype='<u4')
+        return (_HEADER.pack(_MAGIC, _VERSION, len(self._dogs), len(self),
+                             len(stays), self._field_size[0],
+                             self._field_size[1]) +
+                positions.tostring() + packed.tostring() + stays.tostring())
+
+    @classmethod
+    def fromString(cls, data):
+        """Unpack a log packed by toString.
+
+        Arguments:
+        - `data`: The bytes of the log.
+        """
+        log, size = cls._unpack(data, 0)
+        if size != len(data):
+            raise ValueError("Trailing data after the move log")
+        return log
+
+    @classmethod
+    def _unpack(cls, data, offset):
+        """Unpack the log at an offset in data.
+
+        Returns the log and the offset of its end.
+        """
+        if len(data) - offset < _HEADER.size:
+            raise ValueError("Truncated move log")
+        (magic, version, num_dogs, ticks, num_stays,
+         width, height) = _HEADER.unpack_from(data, offset)
+        if magic != _MAGIC:
+            raise ValueError("Not a move log")
+        if version != _VERSION:
+            raise ValueError("Unsupported move log version %d" % version)
+        num_codes = ticks*(1 + num_dogs)
+        offset += _HEADER.size
+        sizes = (16*(1 + num_dogs), -(-num_codes//4), 4*num_stays)
+        if len(data) - offset < sum(sizes):
+            raise ValueError("Truncated move log")
+        positions = np.frombuffer(data, '<f8', 2*(1 + num_dogs), offset)
+        offset += sizes[0]
+        packed = np.frombuffer(data, np.uint8, sizes[1], offset)
+        offset += sizes[1]
+        stays = np.frombuffer(data, '<u4', num_stays, offset)
+        offset += sizes[2]
+
+        positions = positions.reshape(-1, 2).tolist()
+        log = cls(positions[0], positions[1:], (width, height))
+        codes = np.empty((len(packed), 4), dtype=np.uint8)
+        for i in range(4):
+            codes[:, i] = (packed >> (2*i)) & 3
+        log._codes = codes.ravel()[:num_codes].tolist()
+        log._stays = set(stays.tolist())
+        return log, offset
+
+    def write(self, stream):
+        """Write the log to a file, after any logs already in it.
+
+        Arguments:
+        - `stream`: The file, opened for binary writing.
+        """
+        stream.write(self.toString())
+
+    @classmethod
+    def readAll(cls, stream):
+        """Read every log in a file written by write.
+
+        Arguments:
+        - `stream`: The file, opened for binary reading.
+        """
+        data = stream.read()
+        logs = []
+        offset = 0
+        while offset < len(data):
+            log, offset = cls._unpack(data, offset)
+            logs.append(log)
+        return logs
+
+
+def record_game(sim):
+    """Play a game to the end, logging its moves.
+
+    Arguments:
+    - `sim`: The simulation, before its first tick.
+    """
+    log = MoveLog.fromSimulation(sim)
+    state = sim.getState()
+    while not state["gameover"]:
+        state = sim.simtick()
+        moves = sim.getMoves()
+        if moves is not None:
+            log.append(moves)
+    return log
+
+
+class Replayer(object):
+    """Rebuilds the ticks of a logged game.
+
+    Replays make the logged moves in a Simulation, so the positions, the
+    collisions and the outcome are exactly those of the logged game.
+    """
+
+    def __init__(self, log):
+        """Set up the game at its start.
+
+        Arguments:
+        - `log`: The MoveLog of the game.
+        """
+        self._log = log
+        self._sim = Simulation(_replay_only, _replay_only,
+                               field_size=log.getFieldSize(),
+                               cat_position=log.getCat(),
+                               dog_positions=log.getDogs(), seed=0)
+        self._start = self._sim.snapshot()
+        self._tick = 0
+
+    def getSimulation(self, ):
+        """Get the simulation the game is replayed in.
+        """
+        return self._sim
+
+    def getTick(self, ):
+        """Get the tick the replay is at.
+        """
+        return self._tick
+
+    def seek(self, tick):
+        """Replay the game up to a tick, returning its state.
+
+        Seeking backwards starts over from the start of the game.
+
+        Arguments:
+        - `tick`: The number of logged ticks to have played.
+        """
+        if not 0 <= tick <= len(self._log):
+            raise IndexError("No tick %d in a log of %d" %
+                             (tick, len(self._log)))
+        if tick < self._tick:
+            self._sim.restore(self._start)
+            self._tick = 0
+        while self._tick < tick:
+            self._sim.simtick(self._log.getMoves(self._tick))
+            self._tick += 1
+        return self._sim.getState()
+
+    def run(self, ):
+        """Replay the whole game, returning its final state.
+
+        A cat that survived every logged tick wins in one more tick, which
+        makes no moves.
+        """
+        state = self.seek(len(self._log))
+        if not state["gameover"] and self._tick >= Simulation.MAX_TICKS:
+            state = self._sim.simtick([STAY]*(1 + len(self._log.getDogs())))
+            self._tick += 1
+        return state
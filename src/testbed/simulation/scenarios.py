@@ -0,0 +1,381 @@
+###
+# Scenario files
+#--
+# Stores the scenarios inputgen generates, (dog positions, cat AI ids, cat
+# start positions) as in dogs.py, in a binary file: a short header followed by
+# one fixed width record per scenario. The records are padded to the largest
+# scenario in the file and hold how much of each field is used. Training
+# scenarios come first, followed by the test scenarios.
+#
+# The positions inputgen makes are rounded to two decimals, and are stored as
+# int16 counts of 0.01 units, which gives back exactly the same floats. Other
+# positions are stored as doubles.
+#
+# Files are memory mapped when loaded, so even a million scenarios open in
+# milliseconds, and any scenario can be read without reading the others.
+#
+# inputgen streams the test and training scenarios to a file of their own,
+# listed with its other output files in a JSON manifest.
+###
+
+import json
+import os.path
+import struct
+
+import numpy as np
+
+from simulation import Simulation
+from simulation.evaluator import cat_ai_for
+
+# The file name extension of scenario files
+SUFFIX = '.scn'
+
+# The header: magic, format version, flags, number of scenarios, number of
+# them that are training scenarios, and the most dogs, cat AIs and cats in a
+# scenario
+_HEADER = struct.Struct('<4sHHQQIII4x')
+_MAGIC = 'DESC'
+_VERSION = 1
+
+# Header flags
+_QUANTIZED = 1
+
+# The number of quantization steps per unit
+STEPS = 100
+
+
+def record_dtype(num_dogs, num_ais, num_cats, quantized=False):
+    """Get the NumPy dtype of the records of a scenario file.
+
+    Arguments:
+    - `num_dogs`: The most dogs in a scenario.
+    - `num_ais`: The most cat AIs in a scenario.
+    - `num_cats`: The most cat start positions in a scenario.
+    - `quantized`: Whether the positions are stored as int16 steps.
+    """
+    coordinate = '<i2' if quantized else '<f8'
+    return np.dtype([('counts', '<u2', (3,)),
+                     ('pad', '<u2'),
+                     ('ais', '<i4', (num_ais,)),
+                     ('dogs', coordinate, (num_dogs, 2)),
+                     ('cats', coordinate, (num_cats, 2))])
+
+def quantizable(scenarios):
+    """Check whether the positions of scenarios can be stored as int16 steps.
+
+    Arguments:
+    - `scenarios`: The scenarios.
+    """
+    for dogs, ais, cats in scenarios:
+        for positions in (dogs, cats):
+            for position in positions:
+                for value in position:
+                    steps = round(value*STEPS)
+                    if steps/float(STEPS) != value or abs(steps) > 32767:
+                        return False
+    return True
+
+
+class ScenarioSet(object):
+    """A sequence of scenarios held in NumPy arrays.
+
+    Indexing gives a scenario as the tuple inputgen makes, slicing gives
+    another ScenarioSet viewing the same records, so evaluate can be passed a
+    ScenarioSet like a list of scenarios.
+    """
+
+    def __init__(self, records, num_training=None):
+        """Wrap an array of records.
+
+        Arguments:
+        - `records`: The records, as from record_dtype.
+        - `num_training`: How many of the records are training scenarios,
+          all of them if not given.
+        """
+        self.records = records
+        self.quantized = records.dtype['dogs'].base.kind == 'i'
+        if num_training is None:
+            num_training = len(records)
+        self.num_training = min(num_training, len(records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            training = len(xrange(start, min(stop, self.num_training), step))
+            return ScenarioSet(self.records[index], training)
+        record = self.records[index]
+        num_dogs, num_ais, num_cats = record['counts'].tolist()
+        dogs = record['dogs'][:num_dogs]
+        cats = record['cats'][:num_cats]
+        if self.quantized:
+            dogs = dogs/float(STEPS)
+            cats = cats/float(STEPS)
+        return ([tuple(dog) for dog in dogs.tolist()],
+                tuple(record['ais'][:num_ais].tolist()),
+                [tuple(cat) for cat in cats.tolist()])
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    @property
+    def counts(self):
+        """The number of dogs, cat AIs and cats of each scenario."""
+        return self.records['counts']
+
+    @property
+    def dogs(self):
+        """The stored dog positions, padded, shape (scenarios, dogs, 2)."""
+        return self.records['dogs']
+
+    @property
+    def ais(self):
+        """The cat AI ids, padded, shape (scenarios, ais)."""
+        return self.records['ais']
+
+    @property
+    def cats(self):
+        """The stored cat positions, padded, shape (scenarios, cats, 2)."""
+        return self.records['cats']
+
+    def dogPositions(self, ):
+        """Get the dog positions in units, shape (scenarios, dogs, 2).
+        """
+        if self.quantized:
+            return self.dogs/float(STEPS)
+        return self.dogs
+
+    def catPositions(self, ):
+        """Get the cat positions in units, shape (scenarios, cats, 2).
+        """
+        if self.quantized:
+            return self.cats/float(STEPS)
+        return self.cats
+
+    def training(self, ):
+        """Get the training scenarios.
+        """
+        return self[:self.num_training]
+
+    def test(self, ):
+        """Get the test scenarios.
+        """
+        return ScenarioSet(self.records[self.num_training:], 0)
+
+
+class ScenarioWriter(object):
+    """Writes scenarios to a file one at a time.
+
+    The training scenarios are written first, then startTest is called before
+    the test scenarios. The header is only complete once the writer has been
+    closed, or left as a context manager.
+    """
+
+    # How many records to buffer before writing
+    CHUNK = 4096
+
+    def __init__(self, path, num_dogs, num_ais, num_cats, quantize=False):
+        """Create a scenario file, or truncate an existing one.
+
+        Arguments:
+        - `path`: The path of the file.
+        - `num_dogs`: The most dogs in a scenario.
+        - `num_ais`: The most cat AIs in a scenario.
+        - `num_cats`: The most cat start positions in a scenario.
+        - `quantize`: Whether to store the positions as int16 steps of 0.01
+          units, for positions rounded to two decimals.
+        """
+        self.path = path
+        self._sizes = (num_dogs, num_ais, num_cats)
+        self._quantize = quantize
+        self._file = open(path, 'wb')
+        self._buffer = np.zeros(self.CHUNK,
+                                dtype=record_dtype(num_dogs, num_ais,
+                                                   num_cats, quantize))
+        self._buffered = 0
+        self._count = 0
+        self._training = None
+        self._writeHeader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _writeHeader(self, ):
+        training = self._training
+        if training is None:
+            training = self._count
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION,
+                                      _QUANTIZED if self._quantize else 0,
+                                      self._count, training, *self._sizes))
+
+    def write(self, scenario):
+        """Write a scenario.
+
+        Arguments:
+        - `scenario`: The (dog positions, cat AI ids, cat positions).
+        """
+        dogs, ais, cats = scenario
+        counts = (len(dogs), len(ais), len(cats))
+        if any(count > size for count, size in zip(counts, self._sizes)):
+            raise ValueError("Scenario with %d dogs, %d cat AIs and %d cats "
+                             "does not fit the file" % counts)
+        if self._quantize and not quantizable([scenario]):
+            raise ValueError("Scenario has positions that are not whole "
+                             "steps of 0.01 within the range of int16")
+        if self._buffered == len(self._buffer):
+            self.flush()
+        record = self._buffer[self._buffered]
+        record['counts'] = counts
+        record['ais'][:len(ais)] = ais
+        if self._quantize:
+            dogs = np.round(np.asarray(dogs, dtype=np.float64)*STEPS)
+            cats = np.round(np.asarray(cats, dtype=np.float64)*STEPS)
+        record['dogs'][:len(dogs)] = dogs
+        record['cats'][:len(cats)] = cats
+        self._buffered += 1
+        self._count += 1
+
+    def startTest(self, ):
+        """Mark the scenarios written from now on as test scenarios.
+        """
+        self._training = self._count
+
+    def flush(self, ):
+        """Write the buffered scenarios to the file.
+        """
+        self._buffer[:self._buffered].tofile(self._file)
+        self._buffer[:self._buffered] = 0
+        self._buffered = 0
+
+    def close(self, ):
+        """Write the remaining scenarios and the header, and close the file.
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.seek(0)
+        self._writeHeader()
+        self._file.close()
+
+
+def save_scenarios(path, training, test=()):
+    """Write training and test scenarios to a scenario file.
+
+    The positions are quantized if that keeps them exact.
+
+    Arguments:
+    - `path`: The path of the file.
+    - `training`: The training scenarios.
+    - `test`: The test scenarios.
+    """
+    training = list(training)
+    test = list(test)
+    sizes = [max([len(scenario[i]) for scenario in training + test] or [0])
+             for i in range(3)]
+    quantize = quantizable(training + test)
+    with ScenarioWriter(path, *sizes, quantize=quantize) as writer:
+        for scenario in training:
+            writer.write(scenario)
+        writer.startTest()
+        for scenario in test:
+            writer.write(scenario)
+
+def load_scenarios(path):
+    """Memory map a scenario file, returning a ScenarioSet of it.
+
+    Arguments:
+    - `path`: The path of the file.
+    """
+    with open(path, 'rb') as scenarios:
+        header = scenarios.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("%s is not a scenario file" % path)
+    (magic, version, flags, count, training,
+     num_dogs, num_ais, num_cats) = _HEADER.unpack(header)
+    if magic != _MAGIC:
+        raise ValueError("%s is not a scenario file" % path)
+    if version != _VERSION:
+        raise ValueError("%s has unsupported version %d" % (path, version))
+    dtype = record_dtype(num_dogs, num_ais, num_cats,
+                         bool(flags & _QUANTIZED))
+    if count > 0:
+        records = np.memmap(path, dtype=dtype, mode='r',
+                            offset=_HEADER.size, shape=(count,))
+    else:
+        records = np.zeros(0, dtype=dtype)
+    return ScenarioSet(records, training)
+
+def load_manifest(path):
+    """Load the training and test scenarios listed in an inputgen manifest.
+
+    Returns a dictionary with a ScenarioSet under 'training_data' and
+    'test_data'.
+
+    Arguments:
+    - `path`: The path of the manifest.
+    """
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("version") != 1:
+        raise ValueError("%s is not a scenario manifest" % path)
+    directory = os.path.dirname(path)
+    dataset = {}
+    for shard in manifest["shards"]:
+        if shard["format"] != "scn":
+            continue
+        scenarios = load_scenarios(os.path.join(directory, shard["file"]))
+        for section in shard["sections"]:
+            if section["split"] == "test":
+                dataset['test_data'] = scenarios.test()
+            else:
+                dataset['training_data'] = scenarios.training()
+    if len(dataset) != 2:
+        raise ValueError("%s lists no scenario files" % path)
+    return dataset
+
+def load_dataset(path):
+    """Load the training and test scenarios of a dataset file.
+
+    Reads scenario files, inputgen manifests, or dogs.py files as inputgen
+    used to write, into a dictionary with the scenarios under
+    'training_data' and 'test_data'.
+
+    Arguments:
+    - `path`: The path of the file.
+    """
+    if path.endswith(SUFFIX):
+        scenarios = load_scenarios(path)
+        return {'training_data': scenarios.training(),
+                'test_data': scenarios.test()}
+    if path.endswith('.json'):
+        return load_manifest(path)
+    dataset = {}
+    execfile(path, dataset)
+    return dataset
+
+def make_simulation(scenario, run, dog_ai, cat_ais=None, **kwargs):
+    """Set up a Simulation for one run of a scenario.
+
+    The runs of a scenario are numbered as the evaluator plays them, every
+    cat AI for the first cat position, then for the next and so on. Keyword
+    arguments are passed on to Simulation.
+
+    Arguments:
+    - `scenario`: The (dog positions, cat AI ids, cat positions).
+    - `run`: The number of the run.
+    - `dog_ai`: The AI used for the dogs.
+    - `cat_ais`: Function giving the cat AI for an id, by default
+      evaluator.cat_ai_for.
+    """
+    if cat_ais is None:
+        cat_ais = cat_ai_for
+    dogs, ais, cats = scenario
+    cat, ai_index = divmod(run, len(ais))
+    return Simulation(cat_ais(ais[ai_index]), dog_ai,
+                      cat_position=cats[cat], dog_positions=dogs, **kwargs)
@@ -0,0 +1,257 @@
+###
+# Background simulation
+#--
+# Runs games in a thread or process of their own, so that slow AIs do not
+# hold up the rendering. Every tick is published into a double-buffered block
+# of shared memory, which the game reads the newest tick from whenever it
+# draws a frame. The direction of the keyboard is sent back through the same
+# block, for games with a keyboard controlled cat.
+#
+# The two buffers are guarded by sequence numbers that are odd while a buffer
+# is being written, so a reader never sees half a tick and nobody waits on a
+# lock.
+###
+
+import multiprocessing
+import threading
+import time
+
+import simulation.ai as ai
+from simulation.util import DIRECTIONS
+
+# The layout of a buffer, after which come the positions of the dogs
+_SEQUENCE = 0
+_GAME = 1
+_TICK = 2
+_TIME = 3
+_CAT = 4
+_GOAL = 6
+_FIELD = 8
+_GAMEOVER = 10
+_WIN = 11
+_STATS = 12
+_DOGS = 15
+
+
+class SharedState(object):
+    """Double-buffered game state in shared memory.
+
+    One writer publishes the states of its games, and any number of readers
+    get the newest one. The block is allocated before a process is forked, so
+    it is shared with the child.
+    """
+
+    def __init__(self, num_dogs):
+        """Allocate the block.
+
+        Arguments:
+        - `num_dogs`: The number of dogs in the games.
+        """
+        self._num_dogs = num_dogs
+        self._size = _DOGS + 2*num_dogs
+        self._buffers = [multiprocessing.RawArray('d', self._size)
+                         for i in range(2)]
+        self._front = multiprocessing.RawValue('i', -1)
+        self._direction = multiprocessing.RawValue('i', -1)
+        self._stop = multiprocessing.RawValue('b', 0)
+
+    def publish(self, state, game, tick, stats=(0, 0, 0.0)):
+        """Publish the state of a game after a tick.
+
+        Arguments:
+        - `state`: The state from Simulation.getState, with the field size
+          under "field".
+        - `game`: The number of the game.
+        - `tick`: The number of ticks played in the game.
+        - `stats`: The number of games, the number of wins and the interest
+          of the games played so far.
+        """
+        values = [0.0]*self._size
+        values[_GAME] = game
+        values[_TICK] = tick
+        values[_TIME] = time.time()
+        values[_CAT:_CAT+2] = state["cat"]
+        values[_GOAL:_GOAL+2] = state["goal"]
+        values[_FIELD:_FIELD+2] = state["field"]
+        values[_GAMEOVER] = state["gameover"]
+        values[_WIN] = state["win"]
+        values[_STATS:_STATS+3] = stats
+        for i, (x, y) in enumerate(state["dogs"]):
+            values[_DOGS+2*i] = x
+            values[_DOGS+2*i+1] = y
+
+        back = 1 - self._front.value if self._front.value >= 0 else 0
+        buf = self._buffers[back]
+        sequence = buf[_SEQUENCE]
+        values[_SEQUENCE] = sequence + 1
+        buf[_SEQUENCE] = sequence + 1
+        buf[:] = values
+        buf[_SEQUENCE] = sequence + 2
+        self._front.value = back
+
+    def read(self, ):
+        """Get the newest published state, None if there is none yet.
+
+        Besides the keys of Simulation.getState, the state has the game
+        number, tick, time of publishing, field size and statistics.
+        """
+        while True:
+            front = self._front.value
+            if front < 0:
+                return None
+            buf = self._buffers[front]
+            sequence = buf[_SEQUENCE]
+            if sequence % 2:
+                continue
+            values = buf[:]
+            if buf[_SEQUENCE] == sequence:
+                break
+        dogs = values[_DOGS:]
+        return {
+            "game": int(values[_GAME]),
+            "tick": int(values[_TICK]),
+            "time": values[_TIME],
+            "cat": tuple(values[_CAT:_CAT+2]),
+            "dogs": zip(dogs[0::2], dogs[1::2]),
+            "goal": tuple(values[_GOAL:_GOAL+2]),
+            "field": tuple(values[_FIELD:_FIELD+2]),
+            "gameover": bool(values[_GAMEOVER]),
+            "win": bool(values[_WIN]),
+            "stats": (int(values[_STATS]), int(values[_STATS+1]),
+                      values[_STATS+2]),
+        }
+
+    def setDirection(self, direction):
+        """Send the direction the keyboard controlled cat should move in.
+
+        Arguments:
+        - `direction`: One of DIRECTIONS, anything else to stay put.
+        """
+        if direction in DIRECTIONS:
+            self._direction.value = DIRECTIONS.index(direction)
+        else:
+            self._direction.value = -1
+
+    def getDirection(self, ):
+        """Get the direction sent with setDirection.
+        """
+        index = self._direction.value
+        return DIRECTIONS[index] if index >= 0 else ""
+
+    def stop(self, ):
+        """Ask the writer to stop.
+        """
+        self._stop.value = 1
+
+    def isStopped(self, ):
+        """Check whether the writer has been asked to stop.
+        """
+        return bool(self._stop.value)
+
+
+class SimulationRunner(object):
+    """Plays games one after another in a background thread or process.
+
+    Each game is ticked at a fixed interval, or as fast as the AIs allow if
+    they take longer, and every tick is published to a SharedState.
+    """
+
+    def __init__(self, new_game, num_dogs, interval, logger=None,
+                 process=True):
+        """Set up the runner, without starting it.
+
+        Arguments:
+        - `new_game`: Function returning the Simulation of the next game.
+        - `num_dogs`: The number of dogs in the games.
+        - `interval`: The time between ticks, in seconds.
+        - `logger`: A game.datalogger.GameDataLogger to log the games to,
+          whose statistics are published with the states.
+        - `process`: Whether to run in a process, rather than a thread.
+        """
+        self.shared = SharedState(num_dogs)
+        self._new_game = new_game
+        self._interval = interval
+        self._logger = logger
+        if process:
+            self._worker = multiprocessing.Process(target=self._run)
+        else:
+            self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+
+    def getInterval(self, ):
+        """Get the time between ticks, in seconds.
+        """
+        return self._interval
+
+    def start(self, ):
+        """Start playing games in the background.
+        """
+        self._worker.start()
+
+    def stop(self, ):
+        """Stop playing and wait for the background worker to finish.
+        """
+        self.shared.stop()
+        self._worker.join()
+
+    def getState(self, wait=True):
+        """Get the newest state.
+
+        Arguments:
+        - `wait`: Whether to wait for the first state to be published,
+          rather than returning None.
+        """
+        state = self.shared.read()
+        while state is None and wait:
+            time.sleep(0.001)
+            state = self.shared.read()
+        return state
+
+    def setDirection(self, direction):
+        """Send the direction the keyboard controlled cat should move in.
+
+        Arguments:
+        - `direction`: One of DIRECTIONS, anything else to stay put.
+        """
+        self.shared.setDirection(direction)
+
+    def _wait(self, deadline):
+        """Sleep until the deadline, returning the time the tick is due at.
+        """
+        delay = deadline - time.time()
+        if delay > 0:
+            time.sleep(delay)
+            return deadline
+        # Running late, so tick at the pace of the AIs
+        return time.time()
+
+    def _run(self, ):
+        shared = self.shared
+        logger = self._logger
+        stats = (0, 0, 0.0)
+        game = 0
+        deadline = time.time()
+        while not shared.isStopped():
+            sim = self._new_game()
+            field = sim.getFieldSize()
+            if logger is not None:
+                logger.gameStarted(field)
+            state = sim.getState()
+            state["field"] = field
+            tick = 0
+            shared.publish(state, game, tick, stats)
+            while not state["gameover"] and not shared.isStopped():
+                deadline = self._wait(deadline + self._interval)
+                ai._cat_move = shared.getDirection()
+                state = sim.simtick()
+                state["field"] = field
+                tick += 1
+                if logger is not None:
+                    logger.gameTicked(state)
+                    if state["gameover"]:
+                        logger.gameEnded(state["win"])
+                        stats = logger.getStats(1.0, 1.0, 1.0)
+                shared.publish(state, game, tick, stats)
+            # Show the end of the game for a tick before the next one
+            deadline = self._wait(deadline + self._interval)
+            game += 1
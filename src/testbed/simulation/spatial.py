@@ -0,0 +1,93 @@
+from math import floor
+
+# Extra room around query boxes, so that rounding in the narrow phase test can
+# never make it accept an entity the query left out.
+_MARGIN = 1e-6
+
+
+class SpatialHash(object):
+    """A uniform grid spatial hash of entities.
+
+    Each entity is kept in the cell holding its center. Queries look at every
+    cell a box, grown by the largest half size of the hashed entities, covers,
+    so they return every entity whose bounds may overlap the box. It is a
+    broad phase only: the candidates still have to be tested for collision.
+    """
+
+    def __init__(self, cell_size):
+        """Create an empty hash.
+
+        Arguments:
+        - `cell_size`: The width and height of the grid cells.
+        """
+        self._cell_size = float(cell_size)
+        self._cells = {}
+        self._keys = {}
+        self._half_width = 0.0
+        self._half_height = 0.0
+
+    def _key(self, x, y):
+        return (int(floor(x/self._cell_size)), int(floor(y/self._cell_size)))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def insert(self, entity):
+        """Add an entity to the hash.
+
+        Arguments:
+        - `entity`: The entity to add.
+        """
+        shape = entity.getShape()
+        self._half_width = max(self._half_width,
+                               (shape.getRight() - shape.getLeft())*0.5)
+        self._half_height = max(self._half_height,
+                                (shape.getBottom() - shape.getTop())*0.5)
+        key = self._key(entity.x, entity.y)
+        self._keys[entity] = key
+        self._cells.setdefault(key, []).append(entity)
+
+    def remove(self, entity):
+        """Remove an entity from the hash.
+
+        Arguments:
+        - `entity`: The entity to remove.
+        """
+        key = self._keys.pop(entity)
+        cell = self._cells[key]
+        cell.remove(entity)
+        if not cell:
+            del self._cells[key]
+
+    def update(self, entity):
+        """Move an entity to the cell of its current position.
+
+        Must be called whenever a hashed entity has moved.
+
+        Arguments:
+        - `entity`: The entity that moved.
+        """
+        key = self._key(entity.x, entity.y)
+        if key != self._keys[entity]:
+            self.remove(entity)
+            self._keys[entity] = key
+            self._cells.setdefault(key, []).append(entity)
+
+    def query(self, left, top, right, bottom):
+        """Get the entities whose bounds may overlap a box.
+
+        Arguments:
+        - `left`, `top`, `right`, `bottom`: The bounds of the box.
+        """
+        grow_x = self._half_width + _MARGIN
+        grow_y = self._half_height + _MARGIN
+        min_i, min_j = self._key(left - grow_x, top - grow_y)
+        max_i, max_j = self._key(right + grow_x, bottom + grow_y)
+        found = []
+        cells = self._cells
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = cells.get((i, j))
+                if cell:
+                    found.extend(cell)
+        return found
@@ -0,0 +1,131 @@
+###
+# Simulation statistics
+#--
+# Wall time and call counts of the phases of Simulation.simtick, and of every
+# call to the AIs, gathered by Simulation.enableStats. One SimulationStats can
+# be shared by any number of simulations to find the hot spots over many
+# games, and is dumped as JSON for comparing runs.
+###
+
+import json
+from timeit import default_timer
+
+# The phases of a tick, in the order they run
+PHASES = ('tick', 'ai', 'update', 'collisions')
+
+
+def ai_name(ai):
+    """Get the name of an AI callable, for reporting.
+    """
+    return getattr(ai, '__name__', type(ai).__name__)
+
+
+class SimulationStats(object):
+    """Accumulated wall time and call counts, by phase and by AI.
+    """
+
+    # The clock the times are taken with
+    clock = staticmethod(default_timer)
+
+    def __init__(self, ):
+        """Start with nothing recorded.
+        """
+        self.ticks = 0
+        self.phases = dict((phase, [0, 0.0]) for phase in PHASES)
+        self.ais = {}
+
+    def addPhase(self, phase, seconds):
+        """Record a run of a phase. Every run of the tick phase is a tick.
+
+        Arguments:
+        - `phase`: One of PHASES.
+        - `seconds`: The time it took.
+        """
+        entry = self.phases[phase]
+        entry[0] += 1
+        entry[1] += seconds
+        if phase == 'tick':
+            self.ticks += 1
+
+    def timedPhase(self, phase, function):
+        """Wrap a function so that every call of it is recorded as a phase.
+
+        Arguments:
+        - `phase`: One of PHASES.
+        - `function`: The function doing the work of the phase.
+        """
+        clock = self.clock
+        def timed_phase(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            self.addPhase(phase, clock() - start)
+            return result
+        return timed_phase
+
+    def timed(self, role, ai):
+        """Wrap an AI so that every call of it is recorded.
+
+        The wrapper keeps the markers of the AI, such as ai.batched.
+
+        Arguments:
+        - `role`: What the AI controls, e.g. 'cat' or 'dog'.
+        - `ai`: The AI.
+        """
+        entry = self.ais.setdefault('%s:%s' % (role, ai_name(ai)), [0, 0.0])
+        clock = self.clock
+        def timed_ai(*args, **kwargs):
+            start = clock()
+            move = ai(*args, **kwargs)
+            entry[0] += 1
+            entry[1] += clock() - start
+            return move
+        timed_ai.__name__ = ai_name(ai)
+        for marker in ('batched', 'neighbours'):
+            if hasattr(ai, marker):
+                setattr(timed_ai, marker, getattr(ai, marker))
+        return timed_ai
+
+    def merge(self, other):
+        """Add the statistics of another SimulationStats to these.
+
+        Arguments:
+        - `other`: The other statistics.
+        """
+        self.ticks += other.ticks
+        for table, other_table in ((self.phases, other.phases),
+                                   (self.ais, other.ais)):
+            for key, (calls, seconds) in other_table.items():
+                entry = table.setdefault(key, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+
+    def toDict(self, ):
+        """Get the statistics as a dictionary of plain values.
+        """
+        def entries(table):
+            return dict((key, {"calls": calls, "seconds": seconds})
+                        for key, (calls, seconds) in table.items())
+        return {"ticks": self.ticks,
+                "phases": entries(self.phases),
+                "ais": entries(self.ais)}
+
+    def dump(self, stream):
+        """Write the statistics to a file as JSON.
+
+        Arguments:
+        - `stream`: The file, opened for writing.
+        """
+        json.dump(self.toDict(), stream, indent=2, sort_keys=True)
+
+    def report(self, ):
+        """Get a table of the statistics, slowest first.
+        """
+        lines = ["%-30s %10s %12s %10s" % ("", "calls", "seconds", "us/call")]
+        for title, table in (("phases", self.phases), ("ais", self.ais)):
+            lines.append(title)
+            rows = sorted(table.items(), key=lambda item: -item[1][1])
+            for key, (calls, seconds) in rows:
+                per_call = 1e6*seconds/calls if calls else 0.0
+                lines.append("  %-28s %10d %12.6f %10.2f" %
+                             (key, calls, seconds, per_call))
+        return "\n".join(lines)
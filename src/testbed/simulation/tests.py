@@ -1,7 +1,37 @@
 import unittest
+import random
+import os
+import tempfile
+import cPickle
+import threading
+import json
+import shutil
+import imp
+from StringIO import StringIO
+from math import sqrt, log
+import numpy as np
 from datetime import datetime
-from simulation.chars import Entity
+from simulation.chars import Entity, Rect, Circle
 from simulation import Simulation
+from simulation.batch import BatchSimulation
+import simulation.evaluator as evaluator
+import simulation.interest as interest
+import simulation.ai as ai
+from simulation.util import *
+from simulation.spatial import SpatialHash
+from simulation.potential import CostGrid
+import simulation.adate as adate
+from simulation.neighbours import Neighbours, DOG_IDS
+from simulation.trajectory import TrajectoryRecorder, TrajectoryReader
+from simulation.replay import MoveLog, Replayer, record_game
+from simulation.shared import SharedState, SimulationRunner
+from simulation.stats import SimulationStats
+import simulation.benchmark as benchmark
+import simulation.scenarios as scenarios
+try:
+    import pygame
+except ImportError:
+    pygame = None
 
 class TestEntity(unittest.TestCase):
 
@@ -310,3 +340,1673 @@ class TestSimulation(unittest.TestCase):
         self.assertTrue(self.sim._collideCircleWithRect(corner, rect))
         self.assertTrue(self.sim._collideCircleWithRect(edgecase, rect))
         self.assertFalse(self.sim._collideCircleWithRect(outside, rect))
+
+
+class TestBatchSimulation(unittest.TestCase):
+    """Tests that BatchSimulation plays out games exactly like Simulation
+    """
+
+    GAMES = 20
+
+    def _makeGames(self, cat_ai, dog_ai):
+        random.seed(1234)
+        sims = [Simulation(cat_ai, dog_ai, num_dogs=4)
+                for i in range(self.GAMES)]
+        states = [sim.getState() for sim in sims]
+        return sims, ([s["cat"] for s in states], [s["dogs"] for s in states])
+
+    def _assertLockstep(self, cat_ai, dog_ai, batch_cat_ai, batch_dog_ai):
+        sims, (cats, dogs) = self._makeGames(cat_ai, dog_ai)
+        batch = BatchSimulation(batch_cat_ai, batch_dog_ai, cats, dogs)
+        for tick in range(Simulation.MAX_TICKS + 2):
+            batch_state = batch.simtick()
+            for i, sim in enumerate(sims):
+                state = sim.simtick()
+                self.assertEqual(state["cat"], tuple(batch_state["cats"][i]))
+                self.assertEqual(state["dogs"],
+                                 [tuple(d) for d in batch_state["dogs"][i]])
+                self.assertEqual(state["gameover"],
+                                 batch_state["gameover"][i])
+                self.assertEqual(state["win"], batch_state["win"][i])
+        self.assertTrue(batch.isDone())
+
+    def testBatchedAIs(self, ):
+        """Batched AIs give the same games as their scalar versions
+        """
+        self._assertLockstep(ai.exit_achiever, ai.follower_ai,
+                             ai.exit_achiever_batch, ai.follower_ai_batch)
+        self._assertLockstep(ai.potential_field_cat, ai.follower_ai,
+                             ai.potential_field_cat_batch,
+                             ai.follower_ai_batch)
+        self._assertLockstep(ai.exit_achiever, ai.f,
+                             ai.exit_achiever_batch, ai.f_batch)
+        dog_ai = adate.compile_ai(TestAdate.PROGRAM)
+        self._assertLockstep(ai.exit_achiever, dog_ai,
+                             ai.exit_achiever_batch, dog_ai)
+
+    def testScalarAIs(self, ):
+        """Scalar AIs are called per entity and give the same games
+        """
+        self._assertLockstep(ai.potential_field_cat, ai.f,
+                             ai.potential_field_cat, ai.f)
+
+    def testGameTicks(self, ):
+        """Games count the ticks they were played for
+        """
+        sims, (cats, dogs) = self._makeGames(ai.exit_achiever, ai.follower_ai)
+        batch = BatchSimulation(ai.exit_achiever_batch, ai.follower_ai_batch,
+                                cats, dogs)
+        state = batch.run()
+        self.assertTrue(state["gameover"].all())
+        self.assertTrue((state["ticks"] >= 1).all())
+        self.assertTrue((state["ticks"] <= Simulation.MAX_TICKS).all())
+
+
+class TestEvaluator(unittest.TestCase):
+    """Tests for the headless scenario evaluator
+    """
+
+    SCENARIOS = [
+        ([(0.77, 3.9), (2.13, 4.62), (2.48, 4.13), (14.78, 6.56)],
+         (1, 2),
+         [(8.71, 15.25), (3.91, 15.25), (11.22, 15.25)]),
+        ([(5.0, 5.0), (7.5, 2.2), (12.1, 6.0), (9.3, 4.4)],
+         (1,),
+         [(2.53, 15.25), (11.14, 15.25)]),
+    ]
+
+    def _playScalar(self, dogs, ai_id, cat):
+        """Play one run with Simulation, counting ticks and visits by hand.
+        """
+        cat_ai = {1: ai.exit_achiever}.get(ai_id, ai.potential_field_cat)
+        sim = Simulation(cat_ai, ai.follower_ai,
+                         cat_position=cat, dog_positions=dogs)
+        visits = [[0.0]*256 for dog in dogs]
+        ticks = 0
+        state = sim.getState()
+        while True:
+            state = sim.simtick()
+            if state["gameover"] and ticks == Simulation.MAX_TICKS:
+                break
+            ticks += 1
+            for cells, (x, y) in zip(visits, state["dogs"]):
+                cells[int(x) + int(y)*16] += 1.0
+            if state["gameover"]:
+                break
+        return ticks, visits
+
+    def testMatchesSimulation(self, ):
+        """Results hold the same ticks and visits as Simulation runs
+        """
+        results = evaluator.evaluate(ai.follower_ai, self.SCENARIOS)
+        self.assertEqual(len(results), len(self.SCENARIOS))
+        for result, (dogs, ais, cats) in zip(results, self.SCENARIOS):
+            self.assertEqual(result.N, len(ais)*len(cats))
+            expected = [self._playScalar(dogs, ai_id, cat)
+                        for cat in cats for ai_id in ais]
+            # Runs are listed in reverse, as in the ML result
+            expected.reverse()
+            self.assertEqual(list(result.ticks), [t for t, v in expected])
+            self.assertEqual(result.visits.tolist(), [v for t, v in expected])
+
+    def testBatchedDogAI(self, ):
+        """Batched and scalar dog AIs give the same results
+        """
+        scalar = evaluator.evaluate(ai.follower_ai, self.SCENARIOS)
+        batched = evaluator.evaluate(ai.follower_ai_batch, self.SCENARIOS)
+        for r1, r2 in zip(scalar, batched):
+            self.assertEqual(r1.N, r2.N)
+            self.assertTrue((r1.ticks == r2.ticks).all())
+            self.assertTrue((r1.visits == r2.visits).all())
+
+
+class TestInterest(unittest.TestCase):
+    """Tests that the vectorized interest matches the one in npc.sml
+    """
+
+    def _smlInterest(self, ticks, visits):
+        """A direct translation of interest from npc.sml.
+        """
+        N = float(len(ticks))
+        if N <= 0.0:
+            return 0.0
+        tick_sum = sum(ticks)
+        T = (1.0 - ((tick_sum/N)/max([0.0] + list(ticks))))**0.5
+        avg = tick_sum/N
+        std = sqrt(sum((t - avg)**2 for t in ticks)/N)
+        S = (std/((0.5*sqrt(N/(N - 1.0)))*(50.0 - 3.0)))**1.0
+        H = 0.0
+        for cell_list in visits:
+            hn_sum = 0.0
+            for cells in cell_list:
+                visit_sum = sum(cells)
+                if visit_sum < 2.0:
+                    continue
+                acc = 0.0
+                for cell in cells:
+                    if cell != 0.0:
+                        acc += (cell/visit_sum)*log(cell/visit_sum)
+                hn_sum += ((-1.0/log(visit_sum))*acc)**4.0
+            H += hn_sum/len(cell_list)
+        H = H/N
+        return (T + S + H)/3.0
+
+    def _randomEvaluation(self, runs=12, dogs=4, cells=256):
+        ticks = [float(random.randint(1, 50)) for i in range(runs)]
+        visits = [[[0.0]*cells for d in range(dogs)] for r in range(runs)]
+        for r in range(runs):
+            for d in range(dogs):
+                for t in range(int(ticks[r])):
+                    visits[r][d][random.randrange(cells/8)] += 1.0
+        return ticks, visits
+
+    def testMatchesSML(self, ):
+        """Interest matches the ML version for many evaluations at once
+        """
+        random.seed(42)
+        evaluations = [self._randomEvaluation() for i in range(10)]
+        ticks = np.array([t for t, v in evaluations])
+        visits = np.array([v for t, v in evaluations])
+        scores = interest.interest(ticks, visits)
+        self.assertEqual(scores.shape, (10,))
+        for score, (t, v) in zip(scores, evaluations):
+            self.assertAlmostEqual(score, self._smlInterest(t, v), places=12)
+
+    def testEvaluatorResults(self, ):
+        """Evaluator results can be scored directly
+        """
+        results = evaluator.evaluate(ai.follower_ai_batch,
+                                     TestEvaluator.SCENARIOS[:1]*3)
+        scores = interest.results_interest(results)
+        expected = self._smlInterest(results[0].ticks.tolist(),
+                                     results[0].visits.tolist())
+        for score in scores:
+            self.assertAlmostEqual(score, expected, places=12)
+
+    def testNoRuns(self, ):
+        """Evaluations without runs are not interesting
+        """
+        self.assertEqual(interest.interest(np.zeros((3, 0)),
+                                           np.zeros((3, 0, 4, 256))).tolist(),
+                         [0.0, 0.0, 0.0])
+        for metric in (interest.challenge, interest.variation):
+            self.assertEqual(metric(np.zeros((3, 0))).tolist(),
+                             [0.0, 0.0, 0.0])
+            self.assertEqual(metric([]).tolist(), 0.0)
+        self.assertEqual(interest.diversity(np.zeros((3, 0, 4, 256))).tolist(),
+                         [0.0, 0.0, 0.0])
+
+
+# The data logger is loaded by path, as importing the game package needs
+# pygame
+datalogger = imp.load_source(
+    'datalogger', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, 'game', 'datalogger.py'))
+
+
+def stay_ai(*args, **kwargs):
+    """An AI that never moves, so that games run out of time.
+    """
+    return ""
+
+
+class TestDataLogger(unittest.TestCase):
+    """Tests that the incremental game statistics match simulation.interest
+    """
+
+    def _play(self, logger, sim):
+        """Play a game through the logger, returning its ticks and visits as
+        simulation.interest counts them.
+        """
+        field = sim.getFieldSize()
+        logger.gameStarted(field)
+        state = sim.getState()
+        visits = [[0.0]*(field[0]*field[1]) for dog in state["dogs"]]
+        ticks = 0
+        while not state["gameover"]:
+            state = sim.simtick()
+            logger.gameTicked(state)
+            # The tick that ends a game by running out of time is not counted
+            if ticks < Simulation.MAX_TICKS:
+                ticks += 1
+                for cells, (x, y) in zip(visits, state["dogs"]):
+                    cells[int(x) + int(y)*field[0]] += 1.0
+        logger.gameEnded(state["win"])
+        return ticks, visits, state["win"]
+
+    def testMatchesInterest(self, ):
+        """The statistics of seeded games match simulation.interest
+        """
+        logger = datalogger.GameDataLogger()
+        cats = [ai.random_ai, ai.exit_achiever, ai.potential_field_cat]
+        games = []
+        for g in range(30):
+            sim = Simulation(cats[g % len(cats)], ai.follower_ai,
+                             num_dogs=4, seed=g)
+            games.append(self._play(logger, sim))
+            ticks = [t for t, v, w in games]
+            visits = [v for t, v, w in games]
+            N, wins, score = logger.getStats(1.0, 1.0, 1.0)
+            self.assertEqual(N, len(games))
+            self.assertEqual(wins, len([w for t, v, w in games if w]))
+            self.assertAlmostEqual(score,
+                                   interest.interest(ticks, visits),
+                                   places=12)
+
+    def testTimeout(self, ):
+        """Games that run out of time count MAX_TICKS ticks
+        """
+        logger = datalogger.GameDataLogger()
+        games = []
+        for g in range(2):
+            sim = Simulation(stay_ai, stay_ai, num_dogs=4, seed=g)
+            games.append(self._play(logger, sim))
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4, seed=3)
+        games.append(self._play(logger, sim))
+        ticks = [t for t, v, w in games]
+        self.assertEqual(ticks[:2], [Simulation.MAX_TICKS]*2)
+        self.assertAlmostEqual(logger.getStats(1.0, 1.0, 1.0)[2],
+                               interest.interest(ticks,
+                                                 [v for t, v, w in games]),
+                               places=12)
+
+    def testNoGames(self, ):
+        """Without any games, the interest is 0
+        """
+        logger = datalogger.GameDataLogger()
+        self.assertEqual(logger.getStats(1.0, 1.0, 1.0), (0, 0, 0.0))
+        logger.gameStarted((16, 16))
+        self.assertEqual(logger.getStats(1.0, 1.0, 1.0), (0, 0, 0.0))
+
+
+class TestShapes(unittest.TestCase):
+    """Tests for the cached bounds of shapes
+    """
+
+    def _assertBounds(self, shape, left, right, top, bottom):
+        self.assertEqual((shape.getLeft(), shape.getRight(),
+                          shape.getTop(), shape.getBottom()),
+                         (left, right, top, bottom))
+
+    def testRectBounds(self, ):
+        rect = Rect((4.0, 6.0), (2.0, 3.0))
+        self._assertBounds(rect, 3.0, 5.0, 4.5, 7.5)
+        rect.move('left', 1.5)
+        self._assertBounds(rect, 1.5, 3.5, 4.5, 7.5)
+        rect.move('down', 1.0)
+        self._assertBounds(rect, 1.5, 3.5, 5.5, 8.5)
+        rect.setSize((4.0, 1.0))
+        self._assertBounds(rect, 0.5, 4.5, 6.5, 7.5)
+        rect.setPosition((0.0, 0.0))
+        self._assertBounds(rect, -2.0, 2.0, -0.5, 0.5)
+
+    def testCircleBounds(self, ):
+        circle = Circle((4.0, 6.0), 0.75)
+        self._assertBounds(circle, 3.25, 4.75, 5.25, 6.75)
+        circle.move('up', 2.0)
+        self._assertBounds(circle, 3.25, 4.75, 3.25, 4.75)
+        circle.setRadius(1.0)
+        self._assertBounds(circle, 3.0, 5.0, 3.0, 5.0)
+
+    def testEntityCoordinates(self, ):
+        entity = Entity(Circle((4.0, 6.0), 0.75), 2.0)
+        entity.move('right')
+        self.assertEqual((entity.x, entity.y), (6.0, 6.0))
+        self.assertEqual(entity.getPosition(), (6.0, 6.0))
+        self.assertTrue(isinstance(entity.getPosition(), tuple))
+        entity.move('')
+        self.assertEqual((entity.x, entity.y), (6.0, 6.0))
+
+    def testSlots(self, ):
+        """Entities and shapes do not carry a per instance dict
+        """
+        entity = Entity(Rect((1.0, 1.0), (1.5, 1.5)), 1.5)
+        self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertFalse(hasattr(entity.getShape(), '__dict__'))
+
+
+class TestSeeding(unittest.TestCase):
+    """Tests that seeded simulations are reproducible and independent
+    """
+
+    def _play(self, sims):
+        """Tick the simulations in turn until all are over.
+        """
+        histories = [[] for sim in sims]
+        while not all(sim.getState()["gameover"] for sim in sims):
+            for sim, history in zip(sims, histories):
+                state = sim.getState()
+                if not state["gameover"]:
+                    history.append((state["cat"], state["dogs"]))
+                    sim.simtick()
+        return histories
+
+    def testSameSeedSameGame(self, ):
+        sim1 = Simulation(ai.random_ai, ai.random_ai, num_dogs=4, seed=7)
+        sim2 = Simulation(ai.random_ai, ai.random_ai, num_dogs=4, seed=7)
+        history1, history2 = self._play([sim1, sim2])
+        self.assertEqual(history1, history2)
+
+    def testIndependentStreams(self, ):
+        """Simulations run side by side do not affect each other
+        """
+        alone, = self._play([Simulation(ai.random_ai, ai.random_ai,
+                                        num_dogs=4, seed=11)])
+        random.seed(0)
+        together, other = self._play([
+            Simulation(ai.random_ai, ai.random_ai, num_dogs=4, seed=11),
+            Simulation(ai.random_ai, ai.random_ai, num_dogs=4, seed=12)])
+        self.assertEqual(alone, together)
+        self.assertNotEqual(together, other)
+
+    def testSeedFromRandomModule(self, ):
+        """Without a seed, seeding the random module still reproduces games
+        """
+        random.seed(3)
+        seed1 = Simulation(ai.random_ai, ai.random_ai).getSeed()
+        random.seed(3)
+        seed2 = Simulation(ai.random_ai, ai.random_ai).getSeed()
+        self.assertEqual(seed1, seed2)
+
+    def testRandomMoves(self, ):
+        """Random AIs draw valid moves in bulk and keep going when out
+        """
+        rng = random.Random(5)
+        random_ai = ai.random_ai.bind(rng, 3)
+        moves = [random_ai(None, None, None, None, None) for i in range(100)]
+        self.assertTrue(set(moves) <= set(DIRECTIONS))
+        self.assertEqual(len(set(moves)), 4)
+
+    def testBatchSeed(self, ):
+        """Batch simulations with the same seed play the same games
+        """
+        cats = [(8.0, 15.25)]*5
+        dogs = [[(3.0, 3.0), (12.0, 5.0)]]*5
+        states = [BatchSimulation(ai.random_ai, ai.random_ai, cats, dogs,
+                                  seed=9).run() for i in range(2)]
+        self.assertTrue((states[0]["cats"] == states[1]["cats"]).all())
+        self.assertTrue((states[0]["ticks"] == states[1]["ticks"]).all())
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for snapshotting and restoring simulations
+    """
+
+    def setUp(self, ):
+        self.sim = Simulation(ai.potential_field_cat, ai.follower_ai,
+                              num_dogs=4, seed=21)
+
+    def _playOut(self, ):
+        states = []
+        while not self.sim.getState()["gameover"]:
+            state = self.sim.simtick()
+            states.append((state["cat"], state["dogs"], state["win"]))
+        return states
+
+    def testRestoreReplays(self, ):
+        """A restored simulation plays out the same way again
+        """
+        self.sim.simtick()
+        snap = self.sim.snapshot()
+        first = self._playOut()
+        self.sim.restore(snap)
+        self.assertFalse(self.sim.getState()["gameover"])
+        self.assertEqual(self.sim._ticks, 1)
+        second = self._playOut()
+        self.assertEqual(first, second)
+
+    def testInPlace(self, ):
+        """Restoring does not replace the entities
+        """
+        entities = [id(e) for e in [self.sim._cat] + self.sim._dogs]
+        shapes = [id(e.getShape()) for e in [self.sim._cat] + self.sim._dogs]
+        snap = self.sim.snapshot()
+        self._playOut()
+        self.sim.restore(snap)
+        self.assertEqual(entities,
+                         [id(e) for e in [self.sim._cat] + self.sim._dogs])
+        self.assertEqual(shapes, [id(e.getShape())
+                                  for e in [self.sim._cat] + self.sim._dogs])
+        self.assertEqual(self.sim.snapshot(), snap)
+
+    def testLayout(self, ):
+        """Snapshots are flat arrays of positions, ticks and flags
+        """
+        snap = self.sim.snapshot()
+        self.assertEqual(len(snap), 2*5 + 3)
+        state = self.sim.getState()
+        self.assertEqual(tuple(snap[:2]), state["cat"])
+        self.assertEqual(list(snap[-3:]), [0.0, 0.0, 0.0])
+
+    def testWrongSize(self, ):
+        other = Simulation(ai.random_ai, ai.random_ai, num_dogs=2)
+        self.assertRaises(ValueError, self.sim.restore, other.snapshot())
+
+
+class TestSpatialHash(unittest.TestCase):
+    """Tests that the spatial hash gives the same collisions as brute force
+    """
+
+    def testQueryFindsAllCollisions(self, ):
+        """Every dog colliding with the cat is among the query results
+        """
+        rng = random.Random(4)
+        dogs = [Entity(Rect((rng.uniform(0, 20), rng.uniform(0, 20)),
+                            (1.5, 1.5)), 1.5) for i in range(400)]
+        spatial_hash = SpatialHash(2.0)
+        for dog in dogs:
+            spatial_hash.insert(dog)
+        cat = Entity(Circle((0, 0), 0.75), 2.0)
+        for i in range(300):
+            cat.setPosition((rng.uniform(0, 20), rng.uniform(0, 20)))
+            shape = cat.getShape()
+            found = spatial_hash.query(shape.getLeft(), shape.getTop(),
+                                       shape.getRight(), shape.getBottom())
+            self.assertEqual(len(found), len(set(found)))
+            colliding = [dog for dog in dogs if collide(cat, dog)]
+            self.assertTrue(set(colliding) <= set(found))
+            self.assertTrue(len(found) < len(dogs))
+
+    def testUpdateAndRemove(self, ):
+        spatial_hash = SpatialHash(1.0)
+        dog = Entity(Rect((0.5, 0.5), (1.5, 1.5)), 1.5)
+        spatial_hash.insert(dog)
+        dog.setPosition((10.5, 10.5))
+        self.assertEqual(spatial_hash.query(10, 10, 11, 11), [])
+        spatial_hash.update(dog)
+        self.assertEqual(spatial_hash.query(10, 10, 11, 11), [dog])
+        self.assertEqual(spatial_hash.query(0, 0, 1, 1), [])
+        spatial_hash.remove(dog)
+        self.assertEqual(len(spatial_hash), 0)
+        self.assertEqual(spatial_hash.query(10, 10, 11, 11), [])
+
+    def testSimulationMatchesBruteForce(self, ):
+        """Large games play out the same with and without the hash
+        """
+        for seed in range(5):
+            sims = [Simulation(ai.exit_achiever, ai.follower_ai,
+                               field_size=(48, 48), num_dogs=300, seed=seed,
+                               spatial_hash=cell)
+                    for cell in (None, 2.0)]
+            while not sims[0].getState()["gameover"]:
+                self.assertEqual(sims[0]._checkCollisions(),
+                                 sims[1]._checkCollisions())
+                states = [sim.simtick() for sim in sims]
+                self.assertEqual(states[0]["dogs"], states[1]["dogs"])
+                self.assertEqual(states[0]["gameover"], states[1]["gameover"])
+                self.assertEqual(states[0]["win"], states[1]["win"])
+
+
+class TestCollisionPredicates(unittest.TestCase):
+    """Tests for the float collision predicates and shape dispatch
+    """
+
+    def _legacyF(self, current, cat, dogs, goal, field):
+        """ai.f as it was written with shape objects.
+        """
+        if collideShapes(Circle(getDistance(current, goal),
+                                getQuadDistance(goal, cat)),
+                         current.getShape()):
+            return 'right'
+        elif collideShapes(goal.getShape(), Rect(getDistance(goal, cat), field)):
+            return 'up'
+        else:
+            return 'left'
+
+    def testRectRect(self, ):
+        self.assertTrue(rect_rect(5, 5, 10, 10, 5, 5, 10, 10))
+        self.assertTrue(rect_rect(5, 5, 10, 10, 12, 12, 4, 4))
+        self.assertTrue(rect_rect(5, 5, 10, 10, 5, 5, 2, 2))
+        self.assertFalse(rect_rect(5, 5, 10, 10, 15, 15, 5, 5))
+
+    def testCircleRect(self, ):
+        self.assertTrue(circle_rect(5, 5, 10, 5, 5, 10, 10))
+        self.assertTrue(circle_rect(5, 5, 2, 5, 5, 10, 10))
+        self.assertTrue(circle_rect(0, 0, 1, 5, 5, 10, 10))
+        self.assertTrue(circle_rect(5, 1, 2, 5, 5, 10, 10))
+        self.assertFalse(circle_rect(12, 12, 1, 5, 5, 10, 10))
+
+    def testCircleCircle(self, ):
+        self.assertTrue(circle_circle(0, 0, 1, 1.5, 0, 1))
+        self.assertTrue(circle_circle(0, 0, 1, 2, 0, 1))
+        self.assertFalse(circle_circle(0, 0, 1, 3, 0, 1))
+
+    def testShapeDispatch(self, ):
+        """collide picks the routine by the shapes' type tags
+        """
+        rect = Entity(Rect((5, 5), (10, 10)), 0)
+        near = Entity(Circle((0, 0), 1), 0)
+        far = Entity(Circle((12, 12), 1), 0)
+        self.assertTrue(collide(rect, near))
+        self.assertTrue(collide(near, rect))
+        self.assertFalse(collide(far, rect))
+        self.assertFalse(collide(rect, far))
+        self.assertFalse(collide(near, far))
+        self.assertTrue(collide(near, near))
+        self.assertTrue(collide(rect, rect))
+
+    def testF(self, ):
+        """The reworked f decides exactly like the shape based one
+        """
+        rng = random.Random(8)
+        for i in range(200):
+            sim = Simulation(ai.exit_achiever, ai.f, num_dogs=4,
+                             seed=rng.random())
+            while not sim.getState()["gameover"]:
+                for dog in sim._dogs:
+                    args = (dog, sim._cat, sim._dogs, sim._goal,
+                            sim._field_size)
+                    self.assertEqual(ai.f(*args), self._legacyF(*args))
+                args = (sim._cat, sim._cat, sim._dogs, sim._goal,
+                        sim._field_size)
+                self.assertEqual(ai.f(*args), self._legacyF(*args))
+                sim.simtick()
+
+
+class TestCostGrid(unittest.TestCase):
+    """Tests for the potential field cost grid and the grid mode cat
+    """
+
+    def setUp(self):
+        self.sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=5,
+                              seed=10)
+        self.grid = CostGrid(self.sim.getFieldSize(), 2)
+        self.grid.update(self.sim._dogs, self.sim._goal)
+
+    def testGridPoints(self, ):
+        """The grid holds the exact costs at its points
+        """
+        for i in range(33):
+            for j in range(33):
+                x, y = i/2.0, j/2.0
+                exact = ai.pfb_cost(x, y, self.sim._dogs, self.sim._goal)
+                self.assertAlmostEqual(self.grid.cost(x, y), exact,
+                                       delta=exact*1e-12)
+
+    def testInterpolation(self, ):
+        """Costs between grid points are interpolated from the points
+        """
+        expected = (self.grid.cost(2.0, 3.0) + self.grid.cost(2.5, 3.0))/2.0
+        self.assertAlmostEqual(self.grid.cost(2.25, 3.0), expected)
+        self.assertEqual(self.grid.cost(-1.0, 3.0), self.grid.cost(0.0, 3.0))
+
+    def testRebuild(self, ):
+        """The grid is only rebuilt when a dog moves
+        """
+        self.assertEqual(self.grid.builds, 1)
+        self.grid.update(self.sim._dogs, self.sim._goal)
+        self.assertEqual(self.grid.builds, 1)
+        self.sim._dogs[2].move('left')
+        self.grid.update(self.sim._dogs, self.sim._goal)
+        self.assertEqual(self.grid.builds, 2)
+
+    def testBind(self, ):
+        """Bound grid mode cats have their own grids
+        """
+        rng = random.Random(1)
+        self.assertTrue(ai.bind_ai(ai.potential_field_cat, rng, 1) is
+                        ai.potential_field_cat)
+        cat_ai = ai.bind_ai(ai.potential_field_cat_grid, rng, 1)
+        other = ai.bind_ai(ai.potential_field_cat_grid, rng, 1)
+        field = self.sim.getFieldSize()
+        self.assertFalse(cat_ai.getGrid(field) is other.getGrid(field))
+
+    def testGridMode(self, ):
+        """The grid mode cat nearly always picks the exact choice
+        """
+        rng = random.Random(11)
+        agree = total = 0
+        for i in range(30):
+            sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=5,
+                             seed=rng.random())
+            cat_ai = ai.bind_ai(ai.potential_field_cat_grid, rng, 1)
+            while not sim.getState()["gameover"]:
+                args = (sim._cat, sim._cat, sim._dogs, sim._goal,
+                        sim.getFieldSize())
+                agree += ai.potential_field_cat(*args) == cat_ai(*args)
+                total += 1
+                sim.simtick()
+        self.assertTrue(agree >= 0.95*total)
+
+
+class TestPotentialField(unittest.TestCase):
+    """Tests that the vectorized potential field cat decides like the loop
+    """
+
+    def _legacyPotentialField(self, current, cat, dogs, goal, field):
+        """potential_field_cat as it was written, walking each ray.
+        """
+        def diravgcost(begin, end, step):
+            radius = cat.radius
+            end = (max(radius, min(end[0], field[0]-radius)),
+                   max(radius, min(end[1], field[1]-radius)))
+            if begin == end:
+                return ai.pfb_cost(begin[0], begin[1], dogs, goal)
+            dirvector = (end[0]-begin[0], end[1]-begin[1])
+            normlength = sqrt(dirvector[0]**2+dirvector[1]**2)
+            motionvector = (dirvector[0]/(normlength * (1.0/step)),
+                            dirvector[1]/(normlength * (1.0/step)))
+            x, y = begin
+            steps = 0
+            costsum = 0.0
+            while True:
+                costsum += ai.pfb_cost(x, y, dogs, goal)
+                steps += 1
+                x += motionvector[0]
+                y += motionvector[1]
+                if sqrt((x-begin[0])**2 + (y-begin[1])**2)/normlength > 1.001:
+                    return costsum/steps
+
+        speed = current.getSpeed()
+        mindir = ""
+        mincost = 1000000.
+        for direction, (vx, vy) in (("right", (speed, 0.0)),
+                                    ("left", (-speed, 0.0)),
+                                    ("up", (0.0, -speed)),
+                                    ("down", (0.0, speed))):
+            c = diravgcost((cat.x, cat.y), (cat.x+vx, cat.y+vy), 0.25)
+            if c < mincost:
+                mindir = direction
+                mincost = c
+        return mindir
+
+    def _assertSameChoice(self, sim):
+        args = (sim._cat, sim._cat, sim._dogs, sim._goal, sim.getFieldSize())
+        self.assertEqual(ai.potential_field_cat(*args),
+                         self._legacyPotentialField(*args))
+
+    def testGames(self, ):
+        """The choices are the same throughout random games
+        """
+        rng = random.Random(12)
+        for i in range(100):
+            sim = Simulation(ai.random_ai, ai.follower_ai,
+                             num_dogs=rng.randint(0, 8), seed=rng.random())
+            while not sim.getState()["gameover"]:
+                self._assertSameChoice(sim)
+                sim.simtick()
+
+    def testDogsOnRays(self, ):
+        """The choices are the same with dogs right on the sample points
+        """
+        rng = random.Random(13)
+        for i in range(200):
+            sim = Simulation(ai.random_ai, ai.follower_ai, num_dogs=3,
+                             seed=rng.random())
+            cat = sim._cat
+            for dog in sim._dogs:
+                dog.setPosition((cat.x + rng.choice((-0.25, 0.25, 0.0))*
+                                 rng.randint(0, 8), cat.y))
+            self._assertSameChoice(sim)
+
+    def testBatch(self, ):
+        """The batched cat decides for every game as the scalar one does
+        """
+        rng = random.Random(14)
+        sims = [Simulation(ai.random_ai, ai.follower_ai, num_dogs=4,
+                           seed=rng.random()) for i in range(50)]
+        cats = np.array([sim.getState()["cat"] for sim in sims])
+        dogs = np.array([sim.getState()["dogs"] for sim in sims])
+        goal = np.array(sims[0].getState()["goal"])
+        moves = ai.potential_field_cat_batch(cats, cats, dogs, goal, (16, 16))
+        for sim, move in zip(sims, moves):
+            args = (sim._cat, sim._cat, sim._dogs, sim._goal, (16, 16))
+            self.assertEqual(DIRECTIONS[move], ai.potential_field_cat(*args))
+
+
+class TestBatchedProtocol(unittest.TestCase):
+    """Tests that Simulation plays the same games with batched AIs
+    """
+
+    PAIRS = ((ai.exit_achiever, ai.exit_achiever_batch),
+             (ai.follower_ai, ai.follower_ai_batch),
+             (ai.f, ai.f_batch))
+
+    def _assertSameGames(self, cat_ai, dog_ai, batch_cat_ai, batch_dog_ai):
+        rng = random.Random(15)
+        for i in range(20):
+            seed = rng.random()
+            sim = Simulation(cat_ai, dog_ai, num_dogs=4, seed=seed)
+            batch = Simulation(batch_cat_ai, batch_dog_ai, num_dogs=4,
+                               seed=seed)
+            state = sim.getState()
+            while not state["gameover"]:
+                state = sim.simtick()
+                batch_state = batch.simtick()
+                for key in ("cat", "dogs", "gameover", "win"):
+                    self.assertEqual(state[key], batch_state[key])
+
+    def testDogs(self, ):
+        """Batched dog AIs decide like their scalar versions
+        """
+        for scalar, batch in self.PAIRS:
+            self._assertSameGames(ai.exit_achiever, scalar,
+                                  ai.exit_achiever, batch)
+
+    def testCats(self, ):
+        """Batched cat AIs decide like their scalar versions
+        """
+        for scalar, batch in self.PAIRS + ((ai.potential_field_cat,
+                                            ai.potential_field_cat_batch),):
+            self._assertSameGames(scalar, ai.follower_ai,
+                                  batch, ai.follower_ai)
+
+    def testEntityConstants(self, ):
+        """The batched AIs know the sizes of the entities
+        """
+        self.assertEqual(ai._CAT_SPEED, Simulation.CAT_SPEED)
+        self.assertEqual(ai._CAT_RADIUS, Simulation.CAT_RADIUS)
+        self.assertEqual(ai._DOG_SIZE, Simulation.DOG_SIZE)
+        self.assertEqual(ai._GOAL_SIZE, Simulation.GOAL_SIZE)
+
+
+class TestAdate(unittest.TestCase):
+    """Tests for the compiler of ADATE programs
+    """
+
+    # The program ai.f was translated from
+    PROGRAM = """
+    fun f( Self, DogId, Cat, Dogs, Goal, Field ) =
+      case
+        collide(
+          circle(getDistance( Self, Goal ),
+                 radius(getQuadDistance(Goal, Cat))),
+          Self
+        )
+       of true => right
+        | false => (
+          case
+            collide( Goal,
+                     rect( getDistance( Goal, Cat ), Field ) )
+           of false => up
+            | true => left
+          )
+    """
+
+    def _mlF(self, current, cat, dogs, goal, field):
+        """PROGRAM with the getDistance of npc.sml, by hand.
+        """
+        (sx, sy), (cx, cy), (gx, gy) = (current.getPosition(),
+                                        cat.getPosition(), goal.getPosition())
+        radius = sqrt((cx-gx)**2 + (cy-gy)**2)
+        (w, h) = current.size
+        dist_x = abs((gx-sx) - sx)
+        dist_y = abs((gy-sy) - sy)
+        if (dist_x <= w/2.0 + radius and dist_y <= h/2.0 + radius and
+            (dist_x < w/2.0 or dist_y < h/2.0 or
+             (dist_x - w/2.0)**2 + (dist_y - h/2.0)**2 <= radius**2)):
+            return 'right'
+        if rect_rect(gx, gy, goal.size[0], goal.size[1],
+                     cx-gx, cy-gy, field[0], field[1]):
+            return 'left'
+        return 'up'
+
+    def testProgram(self, ):
+        """A compiled program decides as npc.sml would
+        """
+        dog_ai = adate.compile_ai(self.PROGRAM)
+        rng = random.Random(16)
+        for i in range(50):
+            sim = Simulation(ai.exit_achiever, dog_ai, num_dogs=4,
+                             seed=rng.random())
+            while not sim.getState()["gameover"]:
+                for dog in sim._dogs:
+                    args = (dog, sim._cat, sim._dogs, sim._goal,
+                            sim.getFieldSize())
+                    self.assertEqual(dog_ai(*args), self._mlF(*args))
+                sim.simtick()
+
+    def testCache(self, ):
+        """Programs are compiled once, whatever their layout
+        """
+        program = adate.compile_program(self.PROGRAM)
+        relaid = "(* f *) " + " ".join(self.PROGRAM.split())
+        self.assertTrue(adate.compile_program(relaid) is program)
+        self.assertTrue(adate.compile_ai(self.PROGRAM) is
+                        adate.compile_ai(relaid))
+
+    def testConstantFolding(self, ):
+        """Constant subexpressions and cases are worked out when compiling
+        """
+        program = adate.compile_program("""
+        fun f(Self, DogId, Cat, Dogs, Goal, Field) =
+          case realLess(realAdd(tor(rconst(0.0, 0.5, 2.0)), 3.0),
+                        getQuadDistance(Self, Cat))
+           of true => (case realLess(1.0, 2.0) of true => up | false => down)
+            | false => left""")
+        self.assertTrue("5.0" in program.source)
+        self.assertFalse("rconst" in program.source)
+        self.assertFalse("down" in program.source)
+
+    def testCommonSubexpressions(self, ):
+        """Calls already made on the way to a branch are reused
+        """
+        program = adate.compile_program("""
+        fun f(Self, DogId, Cat, Dogs, Goal, Field) =
+          case realLess(getQuadDistance(Self, Cat), 3.0)
+           of true => (case realLess(getQuadDistance(Self, Cat),
+                                     getQuadDistance(Self, Goal))
+                        of true => up
+                         | false => down)
+            | false => (case realLess(getQuadDistance(Self, Goal), 1.0)
+                         of true => left
+                          | false => right)""")
+        self.assertEqual(program.source.count("_getQuadDistance(Self"), 3)
+        dog = (RECT, (1.0, 1.0), (1.5, 1.5))
+        cat = (CIRCLE, (2.0, 1.0), 0.75)
+        goal = (RECT, (8.0, 1.0), (5, 2))
+        self.assertEqual(program(dog, 'dog_1', cat, (), goal, (16.0, 16.0)),
+                         'up')
+
+    def testPatterns(self, ):
+        """Dog ids and the nearest dogs are passed as in npc.sml
+        """
+        dog_ai = adate.compile_ai("""
+        fun f(Self, DogId, Cat, Dogs, Goal, Field) =
+          case Dogs
+           of entity_nil => down
+            | entity_cons(First, Rest) =>
+              case Rest
+               of entity_nil => down
+                | entity_cons(rect(point(X, Y), S), entity_nil) =>
+                  case DogId
+                   of dog_1 => left
+                    | dog_2 => right
+                    | _ => up""")
+        sim = Simulation(ai.exit_achiever, dog_ai,
+                         dog_positions=[(2, 2), (4, 2), (6, 2), (8, 2), (10, 2)])
+        moves = sim._aiStep()[1:]
+        self.assertEqual(moves, ['left', 'right', 'up', 'up', 'up'])
+        sim = Simulation(ai.exit_achiever, dog_ai, dog_positions=[(2, 2)])
+        self.assertEqual(sim._aiStep()[1:], ['down'])
+
+    def testRealSemantics(self, ):
+        """Division by zero and square roots of negatives do not raise
+        """
+        program = adate.compile_program("""
+        fun f(Self, DogId, Cat, Dogs, Goal, Field) =
+          case realLess(realDivide(tor(rconst(0.0, 0.0, 1.0)),
+                                   realSubtract(getQuadDistance(Self, Cat),
+                                                getQuadDistance(Self, Cat))),
+                        sqrt(realSubtract(0.0, getQuadDistance(Self, Goal))))
+           of true => up
+            | false => down""")
+        dog = (RECT, (1.0, 1.0), (1.5, 1.5))
+        self.assertEqual(program(dog, 'dog_1', dog, (), dog, (16.0, 16.0)),
+                         'down')
+
+    def testErrors(self, ):
+        """Programs outside the supported subset are rejected
+        """
+        for body in ("foo(Self)", "realAdd(Self)", "Unbound",
+                     "let val X = 1.0 in up end",
+                     "case Self of (* unterminated"):
+            self.assertRaises(ValueError, adate.compile_program,
+                              "fun f(Self, DogId, Cat, Dogs, Goal, Field) = " +
+                              body)
+
+
+class TestNeighbours(unittest.TestCase):
+    """Tests that the neighbours of the dogs match kNearest in npc.sml
+    """
+
+    def _kNearest(self, positions, k, index):
+        """kNearest from npc.sml, inserting the dogs one at a time.
+        """
+        def distance(other):
+            (x, y), (ox, oy) = positions[index], positions[other]
+            return sqrt((ox - x)**2 + (oy - y)**2)
+        nearest = []
+        for other in range(len(positions)):
+            if other == index:
+                continue
+            i = 0
+            while i < len(nearest) and not distance(other) < distance(nearest[i]):
+                i += 1
+            nearest.insert(i, other)
+            del nearest[k:]
+        return nearest
+
+    def testNearest(self, ):
+        """The nearest dogs are found and ordered as kNearest does
+        """
+        rng = random.Random(17)
+        for i in range(300):
+            num_dogs = rng.randint(0, 12)
+            k = rng.randint(0, 5)
+            if i % 2:
+                # Dogs on a grid have many ties in distance
+                positions = [(rng.randint(0, 4), rng.randint(0, 4))
+                             for d in range(num_dogs)]
+            else:
+                positions = [(rng.uniform(0, 16), rng.uniform(0, 16))
+                             for d in range(num_dogs)]
+            neighbours = Neighbours(positions, k)
+            self.assertEqual(len(neighbours), num_dogs)
+            for d in range(num_dogs):
+                self.assertEqual(neighbours.nearest(d),
+                                 self._kNearest(positions, k, d))
+
+    def testDogIds(self, ):
+        """Dogs past the fourth all get the last id
+        """
+        neighbours = Neighbours([(i, 0) for i in range(6)])
+        self.assertEqual([neighbours.dogId(i) for i in range(6)],
+                         list(DOG_IDS) + ['dog_4', 'dog_4'])
+
+    def testPerTick(self, ):
+        """Simulations work out the neighbours once per tick
+        """
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, seed=18)
+        snap = sim.snapshot()
+        neighbours = sim.getNeighbours()
+        self.assertTrue(sim.getNeighbours() is neighbours)
+        sim.simtick()
+        self.assertFalse(sim.getNeighbours() is neighbours)
+        neighbours = sim.getNeighbours()
+        sim.restore(snap)
+        self.assertFalse(sim.getNeighbours() is neighbours)
+
+    def testView(self, ):
+        """AIs marked with_neighbours get the id and nearest dogs
+        """
+        seen = []
+        @ai.with_neighbours
+        def dog_ai(current, cat, dogs, goal, field, dog_id, nearest):
+            seen.append((dogs.index(current), dog_id,
+                         [dogs.index(dog) for dog in nearest]))
+            return 'up'
+        sim = Simulation(ai.exit_achiever, dog_ai,
+                         dog_positions=[(1, 1), (2, 1), (4, 1), (8, 1), (9, 1)])
+        sim.simtick()
+        self.assertEqual(seen, [(0, 'dog_1', [1, 2]), (1, 'dog_2', [0, 2]),
+                                (2, 'dog_3', [1, 0]), (3, 'dog_4', [4, 2]),
+                                (4, 'dog_4', [3, 2])])
+
+
+class TestTrajectory(unittest.TestCase):
+    """Tests for the binary trajectory files
+    """
+
+    def setUp(self, ):
+        handle, self.path = tempfile.mkstemp(suffix='.traj')
+        os.close(handle)
+
+    def tearDown(self, ):
+        os.remove(self.path)
+
+    def _recordGames(self, quantize, games=3):
+        states = []
+        with TrajectoryRecorder(self.path, 4, quantize) as recorder:
+            for g in range(games):
+                sim = Simulation(ai.exit_achiever, ai.follower_ai,
+                                 num_dogs=4, seed=g)
+                recorder.startGame()
+                state = sim.getState()
+                recorder.record(state)
+                states.append([state])
+                while not state["gameover"]:
+                    state = sim.simtick()
+                    recorder.record(state)
+                    states[-1].append(state)
+        return states
+
+    def testRoundTrip(self, ):
+        """Unquantized positions are stored exactly
+        """
+        states = self._recordGames(False)
+        reader = TrajectoryReader(self.path)
+        self.assertEqual(len(reader), sum(len(g) for g in states))
+        self.assertFalse(reader.quantized)
+        for g, game in enumerate(states):
+            records = reader.game(g)
+            self.assertEqual(list(records['tick']), range(len(game)))
+            for record, state in zip(records, game):
+                self.assertEqual(tuple(record['cat']), state["cat"])
+                self.assertEqual([tuple(d) for d in record['dogs']],
+                                 state["dogs"])
+
+    def testQuantized(self, ):
+        """Quantized positions are within half a step of the real ones
+        """
+        states = self._recordGames(True)
+        reader = TrajectoryReader(self.path)
+        self.assertTrue(reader.quantized)
+        self.assertEqual(reader.cats.dtype, np.int16)
+        flat = [state for game in states for state in game]
+        cats = np.array([state["cat"] for state in flat])
+        dogs = np.array([state["dogs"] for state in flat])
+        self.assertTrue((abs(reader.catPositions() - cats) <= 0.005).all())
+        self.assertTrue((abs(reader.dogPositions() - dogs) <= 0.005).all())
+
+    def testFlags(self, ):
+        """The gameover and win flags are stored per record
+        """
+        states = self._recordGames(True)
+        flat = [state for game in states for state in game]
+        reader = TrajectoryReader(self.path)
+        self.assertEqual(list(reader.gameover),
+                         [state["gameover"] for state in flat])
+        self.assertEqual(list(reader.win), [state["win"] for state in flat])
+        self.assertEqual(reader.gameover.sum(), len(states))
+
+    def testBatch(self, ):
+        """Batches record the games that are still being played
+        """
+        sims = [Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4,
+                           seed=g)
+                for g in range(5)]
+        states = [sim.getState() for sim in sims]
+        batch = BatchSimulation(ai.exit_achiever_batch, ai.follower_ai_batch,
+                                [s["cat"] for s in states],
+                                [s["dogs"] for s in states])
+        with TrajectoryRecorder(self.path, 4) as recorder:
+            first = recorder.startGames(len(sims))
+            state = batch.getState()
+            recorder.recordBatch(state, first)
+            while not batch.isDone():
+                playing = ~state["gameover"]
+                state = batch.simtick()
+                recorder.recordBatch(state, first, playing)
+        reader = TrajectoryReader(self.path)
+        for g, sim in enumerate(sims):
+            records = reader.game(g)
+            self.assertEqual(records['tick'][-1], state["ticks"][g])
+            self.assertTrue(records['flags'][-1] & 1)
+            self.assertEqual(records['cat'][-1].tolist(),
+                             state["cats"][g].tolist())
+
+    def testBadFile(self, ):
+        """Files that are not trajectories are rejected
+        """
+        with open(self.path, 'wb') as garbage:
+            garbage.write('not a trajectory file at all')
+        self.assertRaises(ValueError, TrajectoryReader, self.path)
+        with TrajectoryRecorder(self.path, 2):
+            pass
+        self.assertEqual(len(TrajectoryReader(self.path)), 0)
+
+    def testQuantizeRange(self, ):
+        """Positions too far out for int16 are refused, not wrapped around
+        """
+        self.assertRaises(ValueError, TrajectoryRecorder, self.path, 4, True,
+                          (400, 400))
+        TrajectoryRecorder(self.path, 4, True, (300, 300)).close()
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4,
+                         field_size=(400, 400), seed=1)
+        with TrajectoryRecorder(self.path, 4, True) as recorder:
+            recorder.startGame()
+            self.assertRaises(ValueError, recorder.record, sim.getState())
+        self.assertEqual(len(TrajectoryReader(self.path)), 0)
+        with TrajectoryRecorder(self.path, 4, False, (400, 400)) as recorder:
+            recorder.startGame()
+            recorder.record(sim.getState())
+        self.assertEqual(TrajectoryReader(self.path).cats[0].tolist(),
+                         list(sim.getState()["cat"]))
+
+    def testCompact(self, ):
+        """Quantized records are much smaller than pickled states
+        """
+        states = self._recordGames(True)
+        flat = [state for game in states for state in game]
+        pickled = len(cPickle.dumps(flat, 2))
+        self.assertTrue(os.path.getsize(self.path)*4 < pickled)
+
+
+class TestMoveLog(unittest.TestCase):
+    """Tests for logging and replaying the moves of games
+    """
+
+    def _playGame(self, seed, cat_ai=ai.exit_achiever):
+        sim = Simulation(cat_ai, ai.follower_ai, num_dogs=4, seed=seed)
+        states = [sim.getState()]
+        log = MoveLog.fromSimulation(sim)
+        while not states[-1]["gameover"]:
+            states.append(sim.simtick())
+            if sim.getMoves() is not None:
+                log.append(sim.getMoves())
+        return log, states
+
+    def _assertSameState(self, state, other):
+        for key in ("cat", "dogs", "gameover", "win"):
+            self.assertEqual(state[key], other[key])
+
+    def testReplay(self, ):
+        """Replays rebuild every tick of a game exactly
+        """
+        for seed in range(10):
+            log, states = self._playGame(seed, ai.RandomAI())
+            replayer = Replayer(MoveLog.fromString(log.toString()))
+            for tick in range(len(log) + 1):
+                self._assertSameState(replayer.seek(tick), states[tick])
+            self._assertSameState(replayer.run(), states[-1])
+            self._assertSameState(replayer.seek(1), states[1])
+
+    def testStays(self, ):
+        """Entities that do not move are replayed staying put
+        """
+        log = MoveLog((8, 15), [(2, 2), (5, 5)])
+        log.append(['up', '', 'left'])
+        log.append([None, 'down', 'sideways'])
+        log = MoveLog.fromString(log.toString())
+        self.assertEqual(log.getMoves(0), ['up', '', 'left'])
+        self.assertEqual(log.getMoves(1), ['', 'down', ''])
+        state = Replayer(log).seek(2)
+        self.assertEqual(state["cat"], (8, 13))
+        self.assertEqual(state["dogs"], [(2, 3.5), (3.5, 5)])
+
+    def testRecordGame(self, ):
+        """record_game logs the whole game, down to its outcome
+        """
+        for seed in range(10):
+            log, states = self._playGame(seed)
+            sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4,
+                             seed=seed)
+            recorded = record_game(sim)
+            self.assertEqual(recorded.toString(), log.toString())
+            self._assertSameState(Replayer(recorded).run(), sim.getState())
+
+    def testArchive(self, ):
+        """Many logs can be written to and read back from one file
+        """
+        logs = [self._playGame(seed)[0] for seed in range(5)]
+        stream = StringIO()
+        for log in logs:
+            log.write(stream)
+        stream.seek(0)
+        read = MoveLog.readAll(stream)
+        self.assertEqual([log.toString() for log in read],
+                         [log.toString() for log in logs])
+        self.assertRaises(ValueError, MoveLog.fromString,
+                          logs[0].toString()[:-1])
+        self.assertRaises(ValueError, MoveLog.fromString, 'DETR' + '\0'*40)
+
+    def testCompact(self, ):
+        """Move logs are much smaller than logs of the positions
+        """
+        games = [self._playGame(seed, ai.potential_field_cat)
+                 for seed in range(10)]
+        handle, path = tempfile.mkstemp(suffix='.traj')
+        os.close(handle)
+        try:
+            with TrajectoryRecorder(path, 4) as recorder:
+                for log, states in games:
+                    recorder.startGame()
+                    for state in states:
+                        recorder.record(state)
+            size = sum(len(log.toString()) for log, states in games)
+            self.assertTrue(size*8 < os.path.getsize(path))
+        finally:
+            os.remove(path)
+
+
+class TestSharedState(unittest.TestCase):
+    """Tests for running games in the background
+    """
+
+    def _state(self, sim):
+        state = sim.getState()
+        state["field"] = sim.getFieldSize()
+        return state
+
+    def testPublish(self, ):
+        """Published states are read back whole, newest first
+        """
+        shared = SharedState(4)
+        self.assertEqual(shared.read(), None)
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4, seed=3)
+        for tick in range(3):
+            shared.publish(self._state(sim), 7, tick, (2, 1, 0.5))
+            state = shared.read()
+            self.assertEqual(state["tick"], tick)
+            self.assertEqual(state["game"], 7)
+            self.assertEqual(state["stats"], (2, 1, 0.5))
+            for key in ("cat", "dogs", "goal", "gameover", "win"):
+                self.assertEqual(state[key], sim.getState()[key])
+            self.assertEqual(state["field"], (16, 16))
+            sim.simtick()
+
+    def testDirection(self, ):
+        """The keyboard direction is sent to the writer
+        """
+        shared = SharedState(0)
+        self.assertEqual(shared.getDirection(), "")
+        shared.setDirection("left")
+        self.assertEqual(shared.getDirection(), "left")
+        shared.setDirection("")
+        self.assertEqual(shared.getDirection(), "")
+
+    def _runGames(self, process):
+        seeds = iter(range(100))
+        def new_game():
+            return Simulation(ai.control_ai, ai.follower_ai, num_dogs=4,
+                              seed=next(seeds))
+        runner = SimulationRunner(new_game, 4, 0.001, process=process)
+        runner.setDirection("up")
+        runner.start()
+        try:
+            state = runner.getState()
+            while state["game"] < 2:
+                state = runner.getState()
+        finally:
+            runner.stop()
+        return state
+
+    def testThread(self, ):
+        """Games are played one after another in a thread
+        """
+        self.assertTrue(self._runGames(False)["game"] >= 2)
+        ai._cat_move = ""
+
+    def testProcess(self, ):
+        """Games are played one after another in a process
+        """
+        self.assertTrue(self._runGames(True)["game"] >= 2)
+
+    def testSlowAI(self, ):
+        """Reading states is not held up by AIs taking their time
+        """
+        entered = threading.Event()
+        release = threading.Event()
+        def slow_ai(current, cat, dogs, goal, field):
+            entered.set()
+            release.wait(10.0)
+            return 'up'
+        runner = SimulationRunner(
+            lambda: Simulation(slow_ai, ai.follower_ai, num_dogs=4), 4,
+            1/60.0, process=False)
+        runner.start()
+        try:
+            first = runner.getState()
+            self.assertTrue(entered.wait(10.0))
+            # The AI is blocked in the middle of a tick, and every read
+            # still returns the last published state
+            states = [runner.getState(wait=False) for frame in range(100)]
+            self.assertFalse(release.is_set())
+            self.assertEqual([(state["game"], state["tick"])
+                              for state in states],
+                             [(first["game"], first["tick"])]*100)
+        finally:
+            release.set()
+            runner.stop()
+
+class TestStats(unittest.TestCase):
+    """Tests for the timing of the phases of simtick
+    """
+
+    def _play(self, sim):
+        states = [sim.getState()]
+        while not states[-1]["gameover"]:
+            states.append(sim.simtick())
+        return [(s["cat"], s["dogs"], s["win"]) for s in states]
+
+    def testCounts(self, ):
+        """Every tick, phase and AI call is counted
+        """
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, num_dogs=4, seed=5)
+        stats = sim.enableStats()
+        self._play(sim)
+        ticks = stats.ticks
+        self.assertTrue(ticks > 0)
+        self.assertEqual(stats.phases['tick'][0], ticks)
+        self.assertEqual(stats.phases['ai'][0], stats.phases['update'][0])
+        moved = stats.phases['ai'][0]
+        self.assertTrue(moved in (ticks, ticks - 1))
+        self.assertEqual(stats.ais['cat:exit_achiever'][0], moved)
+        self.assertEqual(stats.ais['dog:follower_ai'][0], 4*moved)
+        self.assertTrue(stats.phases['tick'][1] >= stats.phases['ai'][1])
+
+    def testSameGames(self, ):
+        """Timed simulations play the same games, with any kind of AI
+        """
+        dog_ais = [ai.follower_ai, ai.f_batch,
+                   adate.compile_ai(TestAdate.PROGRAM)]
+        for dog_ai in dog_ais:
+            for seed in range(5):
+                plain = Simulation(ai.RandomAI(), dog_ai, num_dogs=4,
+                                   seed=seed)
+                timed = Simulation(ai.RandomAI(), dog_ai, num_dogs=4,
+                                   seed=seed)
+                timed.enableStats()
+                self.assertEqual(self._play(timed), self._play(plain))
+
+    def testDisable(self, ):
+        """Disabled simulations are not timed at all
+        """
+        sim = Simulation(ai.exit_achiever, ai.follower_ai, seed=5)
+        self.assertFalse('_tick' in vars(sim))
+        stats = sim.enableStats()
+        sim.enableStats(stats)
+        self.assertTrue(sim.getStats() is stats)
+        sim.disableStats()
+        self.assertFalse('_tick' in vars(sim))
+        self.assertEqual(sim.getStats(), None)
+        sim.simtick()
+        self.assertEqual(stats.ticks, 0)
+        self.assertEqual(stats.ais['dog:follower_ai'][0], 0)
+
+    def testShared(self, ):
+        """Statistics add up over many games and dump as JSON
+        """
+        stats = SimulationStats()
+        total = SimulationStats()
+        for seed in range(3):
+            sim = Simulation(ai.exit_achiever, ai.follower_ai, seed=seed)
+            sim.enableStats(stats)
+            single = Simulation(ai.exit_achiever, ai.follower_ai, seed=seed)
+            single.enableStats()
+            self._play(sim)
+            self._play(single)
+            total.merge(single.getStats())
+        self.assertEqual(len(stats.ais), 2)
+        self.assertEqual(total.ticks, stats.ticks)
+        self.assertEqual(total.ais['dog:follower_ai'][0],
+                         stats.ais['dog:follower_ai'][0])
+        data = json.loads(json.dumps(stats.toDict()))
+        self.assertEqual(data["ticks"], stats.ticks)
+        self.assertEqual(data["ais"]["dog:follower_ai"]["calls"],
+                         stats.ais['dog:follower_ai'][0])
+        stream = StringIO()
+        stats.dump(stream)
+        self.assertEqual(json.loads(stream.getvalue()), data)
+        self.assertTrue('cat:exit_achiever' in stats.report())
+
+
+class TestBenchmark(unittest.TestCase):
+    """Tests for the benchmark suite
+    """
+
+    def testTime(self, ):
+        """Benchmarks are timed per operation
+        """
+        calls = []
+        def setup():
+            return (lambda: calls.append(1)), 10
+        seconds = benchmark.time_benchmark(setup, repeat=2, min_time=0.0)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(seconds >= 0.0)
+        self.assertEqual(benchmark.time_benchmark(lambda: None), None)
+
+    def testRun(self, ):
+        """Selected benchmarks are run into a baseline
+        """
+        baseline = benchmark.run_benchmarks(['util/rect_rect'], repeat=1,
+                                            min_time=0.0)
+        self.assertEqual(baseline["results"].keys(), ['util/rect_rect'])
+        self.assertEqual(json.loads(json.dumps(baseline)), baseline)
+
+    def testCompare(self, ):
+        """Benchmarks slower than the threshold are flagged
+        """
+        baseline = {"results": {"a": 1.0, "b": 2.0, "c": 1.0}}
+        current = {"results": {"a": 1.05, "b": 3.0, "d": 1.0}}
+        rows = benchmark.compare(baseline, current, 0.1)
+        self.assertEqual([(row[0], row[4]) for row in rows],
+                         [("a", False), ("b", True)])
+        self.assertAlmostEqual(rows[1][3], 1.5)
+
+
+class TestScenarios(unittest.TestCase):
+    """Tests for the binary scenario files
+    """
+
+    def setUp(self, ):
+        handle, self.path = tempfile.mkstemp(suffix=scenarios.SUFFIX)
+        os.close(handle)
+
+    def tearDown(self, ):
+        os.remove(self.path)
+
+    def testRoundTrip(self, ):
+        """Scenarios of differing sizes are loaded as they were saved
+        """
+        training = TestEvaluator.SCENARIOS
+        test = [([(1.0, 2.0)], (3,), [(4.0, 15.25)])]
+        scenarios.save_scenarios(self.path, training, test)
+        loaded = scenarios.load_scenarios(self.path)
+        self.assertTrue(loaded.quantized)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(list(loaded), training + test)
+        self.assertEqual(list(loaded.training()), training)
+        self.assertEqual(list(loaded.test()), test)
+        dataset = scenarios.load_dataset(self.path)
+        self.assertEqual(list(dataset['training_data']), training)
+        self.assertEqual(list(dataset['test_data']), test)
+
+    def testUnquantized(self, ):
+        """Positions that are not rounded to two decimals are kept exact
+        """
+        training = [([(0.1234567, 2.0)], (1,), [(1.0/3.0, 15.25)])]
+        scenarios.save_scenarios(self.path, training)
+        loaded = scenarios.load_scenarios(self.path)
+        self.assertFalse(loaded.quantized)
+        self.assertEqual(list(loaded), training)
+        self.assertEqual(len(loaded.test()), 0)
+
+    def testRandomAccess(self, ):
+        """Scenarios are read by index and slice without the others
+        """
+        rand = random.Random(1)
+        data = [([(round(rand.uniform(0, 16), 2), 2.5)]*4, (1, 2, 3),
+                 [(round(rand.uniform(0, 16), 2), 15.25)]*5)
+                for i in range(5000)]
+        scenarios.save_scenarios(self.path, data[:3000], data[3000:])
+        loaded = scenarios.load_scenarios(self.path)
+        self.assertEqual(loaded[4321], data[4321])
+        self.assertEqual(loaded[-1], data[-1])
+        part = loaded[2990:3010:2]
+        self.assertEqual(list(part), data[2990:3010:2])
+        self.assertEqual(len(part.training()), 5)
+        self.assertEqual(loaded.dogPositions().shape, (5000, 4, 2))
+        self.assertEqual(loaded.catPositions()[7, 0, 0], data[7][2][0][0])
+
+    def testWriterLimits(self, ):
+        """Scenarios larger than the file are refused
+        """
+        writer = scenarios.ScenarioWriter(self.path, 1, 1, 1)
+        self.assertRaises(ValueError, writer.write,
+                          ([(1.0, 1.0), (2.0, 2.0)], (1,), [(1.0, 1.0)]))
+        writer.close()
+        self.assertEqual(len(scenarios.load_scenarios(self.path)), 0)
+
+    def testQuantizeLimits(self, ):
+        """Positions that cannot be quantized exactly are refused
+        """
+        fits = ([(1.25, 2.5)], (1,), [(4.0, 15.25)])
+        with scenarios.ScenarioWriter(self.path, 1, 1, 1,
+                                      quantize=True) as writer:
+            for position in ((1.234, 2.5), (400.0, 2.5), (-400.0, 2.5)):
+                self.assertRaises(ValueError, writer.write,
+                                  ([position], (1,), [(4.0, 15.25)]))
+                self.assertRaises(ValueError, writer.write,
+                                  ([(1.0, 1.0)], (1,), [position]))
+            writer.write(fits)
+        self.assertEqual(list(scenarios.load_scenarios(self.path)), [fits])
+
+    def testBadFile(self, ):
+        """Files that are not scenario files are refused
+        """
+        with open(self.path, 'wb') as bad:
+            bad.write('training_data = []\n' * 4)
+        self.assertRaises(ValueError, scenarios.load_scenarios, self.path)
+
+    def testEvaluate(self, ):
+        """Evaluating a loaded file gives the results of evaluating the list
+        """
+        scenarios.save_scenarios(self.path, TestEvaluator.SCENARIOS)
+        loaded = scenarios.load_scenarios(self.path)
+        expected = evaluator.evaluate(ai.follower_ai_batch,
+                                      TestEvaluator.SCENARIOS)
+        results = evaluator.evaluate(ai.follower_ai_batch, loaded)
+        for r1, r2 in zip(expected, results):
+            self.assertEqual(r1.N, r2.N)
+            self.assertTrue((r1.ticks == r2.ticks).all())
+            self.assertTrue((r1.visits == r2.visits).all())
+
+    def testMakeSimulation(self, ):
+        """Runs of a scenario are set up in the order the evaluator plays them
+        """
+        dogs, ais, cats = TestEvaluator.SCENARIOS[0]
+        chosen = []
+        def cat_ais(ai_id):
+            chosen.append(ai_id)
+            return ai.exit_achiever
+        positions = []
+        for run in range(len(ais)*len(cats)):
+            sim = scenarios.make_simulation(TestEvaluator.SCENARIOS[0], run,
+                                            ai.follower_ai, cat_ais)
+            state = sim.getState()
+            self.assertEqual(state["dogs"], dogs)
+            positions.append(state["cat"])
+        self.assertEqual(chosen, [ai_id for cat in cats for ai_id in ais])
+        self.assertEqual(positions, [cat for cat in cats for ai_id in ais])
+
+
+class TestShardedOutput(unittest.TestCase):
+    """Tests for the sharded output of inputgen
+    """
+
+    def setUp(self, ):
+        self.inputgen = benchmark._inputgen()
+        if self.inputgen is None:
+            self.skipTest("inputgen is not next to the test bed")
+        self.directory = tempfile.mkdtemp()
+        self.stem = os.path.join(self.directory, 'dogs')
+
+    def tearDown(self, ):
+        shutil.rmtree(self.directory)
+
+    def _write(self, num, amount_test, max_bytes):
+        random.seed(3)
+        manifest = self.inputgen.write_dataset(
+            self.stem, self.inputgen.iter_data(num, runs=5), amount_test,
+            max_bytes, py=True)
+        random.seed(3)
+        data = list(self.inputgen.iter_data(num, runs=5))
+        return manifest, data[amount_test:], data[:amount_test]
+
+    def testManifest(self, ):
+        """The manifest loads the scenarios that were generated
+        """
+        manifest, training, test = self._write(30, 10, 4000)
+        self.assertEqual(manifest["scenarios"],
+                         {"training": 20, "test": 10})
+        dataset = scenarios.load_dataset(self.stem + '.json')
+        self.assertEqual(list(dataset['training_data']), training)
+        self.assertEqual(list(dataset['test_data']), test)
+
+    def testShards(self, ):
+        """Every shard is bounded and can be loaded by itself
+        """
+        manifest, training, test = self._write(30, 10, 4000)
+        loaded = {"training": [], "test": []}
+        sml = 0
+        for shard in manifest["shards"]:
+            path = os.path.join(self.directory, shard["file"])
+            if shard["format"] == "scn":
+                continue
+            self.assertEqual(os.path.getsize(path), shard["bytes"])
+            self.assertTrue(shard["bytes"] <= 4000)
+            if shard["format"] == "sml":
+                sml += 1
+                continue
+            values = {}
+            execfile(path, values)
+            for section in shard["sections"]:
+                self.assertEqual(len(values[section["name"]]),
+                                 section["scenarios"])
+                loaded[section["split"]].extend(values[section["name"]])
+        self.assertTrue(sml > 1)
+        self.assertEqual(loaded, {"training": training, "test": test})
+
+    def testUnsharded(self, ):
+        """Without a size, the SML file matches make_sml and empty splits
+        are still written
+        """
+        manifest, training, test = self._write(5, 0, 0)
+        make_sml = self.inputgen.make_sml
+        with open(self.stem + '.sml') as sml:
+            self.assertEqual(sml.read(),
+                             make_sml(test, "val Test_inputs = ") + "\n\n" +
+                             make_sml(training, "val Inputs = ") + "\n\n")
+        dataset = scenarios.load_dataset(self.stem + '.json')
+        self.assertEqual(list(dataset['training_data']), training)
+        self.assertEqual(len(dataset['test_data']), 0)
+
+    def _writeParallel(self, stem, workers):
+        inputgen = self.inputgen
+        data = inputgen.iter_parallel(600, 7, workers, ("sml", "py"),
+                                      runs=5)
+        amount_test = inputgen.test_count(600, 0.33)
+        return inputgen.write_dataset(stem, data, amount_test, 20000,
+                                      py=True, rendered=True, seed=7)
+
+    def testParallel(self, ):
+        """Parallel generation gives the same files for any number of workers
+        """
+        manifest = self._writeParallel(self.stem, 1)
+        other = os.path.join(self.directory, 'parallel')
+        parallel = self._writeParallel(other, 3)
+        self.assertEqual(json.dumps(parallel).replace('parallel', 'dogs'),
+                         json.dumps(manifest))
+        self.assertEqual(manifest["seed"], 7)
+        self.assertEqual(manifest["scenarios"], {"training": 402, "test": 198})
+        for shard in manifest["shards"]:
+            with open(os.path.join(self.directory, shard["file"]), 'rb') as f1:
+                name = shard["file"].replace('dogs', 'parallel', 1)
+                with open(os.path.join(self.directory, name), 'rb') as f2:
+                    self.assertEqual(f1.read(), f2.read())
+        # The test scenarios are the first ones made, as with gen_data
+        generated = [scenario for scenario, texts in
+                     self.inputgen.iter_parallel(600, 7, runs=5)]
+        dataset = scenarios.load_dataset(self.stem + '.json')
+        self.assertEqual(list(dataset['test_data']), generated[:198])
+        self.assertEqual(list(dataset['training_data']), generated[198:])
+
+
+class TestGame(unittest.TestCase):
+    """Tests for the game loop, without a display
+    """
+
+    def _headlessGame(self, max_games):
+        """Set up a headless Game, without the display __init__ opens.
+        """
+        from game import Game
+        import game.datalogger
+        g = Game.__new__(Game)
+        g.dog_ai = ai.follower_ai
+        g.cat_ais = [ai.exit_achiever, ai.potential_field_cat]
+        g.current_ai = 0
+        g.turbo = g.headless = True
+        g.max_games = max_games
+        g.logger = game.datalogger.GameDataLogger()
+        g.runner = None
+        g.run = True
+        g.simulationInit()
+        return g
+
+    @unittest.skipIf(pygame is None, "pygame is not installed")
+    def testMaxGames(self, ):
+        """The game stops after max_games games
+        """
+        g = self._headlessGame(3)
+        for i in range(1000):
+            if not g.run:
+                break
+            g.updateTurbo()
+        self.assertFalse(g.run)
+        self.assertEqual(g.logger.games, 3)
+
+    @unittest.skipIf(pygame is None, "pygame is not installed")
+    def testEndGame(self, ):
+        """Ending a game starts the next one until max_games is reached
+        """
+        g = self._headlessGame(2)
+        g.simstate = {"win": True}
+        g.endGame()
+        self.assertTrue(g.run)
+        self.assertEqual((g.wins, g.losses), (1, 0))
+        g.endGame()
+        self.assertFalse(g.run)
+        g.endGame()
+        self.assertFalse(g.run)
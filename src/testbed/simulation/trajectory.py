@@ -0,0 +1,282 @@
+###
+# Trajectory files
+#--
+# Stores the positions of the cat and dogs in every tick of many games, in a
+# compact binary file: a short header followed by fixed width records, one per
+# game per tick. Positions are kept as doubles, or quantized to int16 in steps
+# of 0.01 units, which is exact for the two decimal positions inputgen writes
+# and plenty for analysis. Quantized positions must be within 327.67 units of
+# the origin.
+#
+# TrajectoryReader maps the file into memory and exposes the records as NumPy
+# arrays, so even millions of ticks open instantly and are only read from disk
+# as they are used.
+###
+
+import struct
+
+import numpy as np
+
+# The header: magic, format version, flags, number of dogs and the size of a
+# quantization step
+_HEADER = struct.Struct('<4sHHId4x')
+_MAGIC = 'DETR'
+_VERSION = 1
+
+# Header flags
+_QUANTIZED = 1
+
+# Record flags
+GAMEOVER = 1
+WIN = 2
+
+# The size of a quantization step, in units
+STEP = 0.01
+
+# The most steps an int16 coordinate holds
+MAX_STEPS = 32767
+
+
+def record_dtype(num_dogs, quantized):
+    """Get the NumPy dtype of the records of a trajectory file.
+
+    Arguments:
+    - `num_dogs`: The number of dogs in the games.
+    - `quantized`: Whether the positions are quantized to int16.
+    """
+    coordinate = '<i2' if quantized else '<f8'
+    return np.dtype([('game', '<u4'),
+                     ('tick', '<u2'),
+                     ('flags', 'u1'),
+                     ('pad', 'u1'),
+                     ('cat', coordinate, (2,)),
+                     ('dogs', coordinate, (num_dogs, 2))])
+
+
+class TrajectoryRecorder(object):
+    """Appends the states of games to a trajectory file.
+
+    Games are numbered in the order they are started. Records are buffered
+    and written in chunks, so the recorder must be closed, or used as a
+    context manager, for the last records to reach the file.
+    """
+
+    # How many records to buffer before writing
+    CHUNK = 4096
+
+    def __init__(self, path, num_dogs, quantize=False, field_size=None):
+        """Create a trajectory file, or truncate an existing one.
+
+        Arguments:
+        - `path`: The path of the file.
+        - `num_dogs`: The number of dogs in the games.
+        - `quantize`: Whether to quantize the positions to int16 steps of
+          0.01 units instead of storing doubles.
+        - `field_size`: The size of the field of the games, to check that it
+          can be quantized.
+        """
+        if (quantize and field_size is not None and
+                max(field_size) > MAX_STEPS*STEP):
+            raise ValueError("A field of %sx%s is too large to quantize" %
+                             tuple(field_size))
+        self._num_dogs = num_dogs
+        self._quantize = quantize
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION,
+                                      _QUANTIZED if quantize else 0,
+                                      num_dogs, STEP))
+        self._buffer = np.zeros(self.CHUNK, dtype=record_dtype(num_dogs,
+                                                               quantize))
+        self._buffered = 0
+        self._games = 0
+        self._game = -1
+        self._tick = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _coordinates(self, positions):
+        if self._quantize:
+            steps = np.round(np.asarray(positions, dtype=np.float64)/STEP)
+            if (np.abs(steps) > MAX_STEPS).any():
+                raise ValueError("Positions beyond %s units cannot be "
+                                 "quantized" % (MAX_STEPS*STEP))
+            return steps
+        return positions
+
+    def _reserve(self, count):
+        """Make room for `count` records, returning where they start.
+        """
+        if self._buffered + count > len(self._buffer):
+            self.flush()
+            if count > len(self._buffer):
+                self._buffer = np.zeros(count, dtype=self._buffer.dtype)
+        start = self._buffered
+        self._buffered += count
+        return start
+
+    def startGame(self, ):
+        """Start recording a new game, returning its number.
+        """
+        self._game = self.startGames(1)
+        self._tick = 0
+        return self._game
+
+    def startGames(self, count):
+        """Reserve numbers for a batch of games, returning the first.
+
+        Arguments:
+        - `count`: The number of games.
+        """
+        first = self._games
+        self._games += count
+        return first
+
+    def record(self, state):
+        """Record the next tick of the current game.
+
+        Arguments:
+        - `state`: The state from Simulation.getState.
+        """
+        if self._game < 0:
+            raise ValueError("No game has been started")
+        cat = self._coordinates(state["cat"])
+        dogs = self._coordinates(state["dogs"])
+        record = self._buffer[self._reserve(1)]
+        record['game'] = self._game
+        record['tick'] = self._tick
+        record['flags'] = ((GAMEOVER if state["gameover"] else 0) |
+                           (WIN if state["win"] else 0))
+        record['cat'] = cat
+        record['dogs'] = dogs
+        self._tick += 1
+
+    def recordBatch(self, state, first_game, games=None):
+        """Record a tick of a batch of games.
+
+        Arguments:
+        - `state`: The state from BatchSimulation.getState.
+        - `first_game`: The number of the first game of the batch.
+        - `games`: Mask of the games to record, all of them if not given.
+        """
+        indices = np.arange(len(state["cats"]))
+        if games is not None:
+            indices = indices[games]
+        cats = self._coordinates(state["cats"][indices])
+        dogs = self._coordinates(state["dogs"][indices])
+        start = self._reserve(len(indices))
+        records = self._buffer[start:start + len(indices)]
+        records['game'] = first_game + indices
+        records['tick'] = state["ticks"][indices]
+        records['flags'] = (np.where(state["gameover"][indices], GAMEOVER, 0) |
+                            np.where(state["win"][indices], WIN, 0))
+        records['cat'] = cats
+        records['dogs'] = dogs
+
+    def flush(self, ):
+        """Write the buffered records to the file.
+        """
+        self._buffer[:self._buffered].tofile(self._file)
+        self._buffered = 0
+        self._file.flush()
+
+    def close(self, ):
+        """Write the remaining records and close the file.
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class TrajectoryReader(object):
+    """Memory maps a trajectory file and exposes its records.
+
+    The record fields are views of the file, nothing is parsed or copied
+    until it is used.
+    """
+
+    def __init__(self, path):
+        """Open a trajectory file.
+
+        Arguments:
+        - `path`: The path of the file.
+        """
+        with open(path, 'rb') as trajectory:
+            header = trajectory.read(_HEADER.size)
+            trajectory.seek(0, 2)
+            size = trajectory.tell()
+        if len(header) < _HEADER.size:
+            raise ValueError("%s is not a trajectory file" % path)
+        magic, version, flags, num_dogs, step = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError("%s is not a trajectory file" % path)
+        if version != _VERSION:
+            raise ValueError("%s has unsupported version %d" % (path, version))
+        self.num_dogs = num_dogs
+        self.quantized = bool(flags & _QUANTIZED)
+        self.step = step
+        dtype = record_dtype(num_dogs, self.quantized)
+        count = (size - _HEADER.size)//dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode='r',
+                                     offset=_HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def games(self):
+        """The game number of each record."""
+        return self.records['game']
+
+    @property
+    def ticks(self):
+        """The tick of each record within its game."""
+        return self.records['tick']
+
+    @property
+    def gameover(self):
+        """Whether the game was over in each record."""
+        return (self.records['flags'] & GAMEOVER) != 0
+
+    @property
+    def win(self):
+        """Whether the game was won in each record."""
+        return (self.records['flags'] & WIN) != 0
+
+    @property
+    def cats(self):
+        """The stored cat positions, shape (records, 2)."""
+        return self.records['cat']
+
+    @property
+    def dogs(self):
+        """The stored dog positions, shape (records, dogs, 2)."""
+        return self.records['dogs']
+
+    def catPositions(self, ):
+        """Get the cat positions in units, shape (records, 2).
+        """
+        if self.quantized:
+            return self.cats*self.step
+        return self.cats
+
+    def dogPositions(self, ):
+        """Get the dog positions in units, shape (records, dogs, 2).
+        """
+        if self.quantized:
+            return self.dogs*self.step
+        return self.dogs
+
+    def game(self, number):
+        """Get the records of a game, in the order they were recorded.
+
+        Arguments:
+        - `number`: The number of the game.
+        """
+        return self.records[self.games == number]
@@ -1,41 +1,29 @@
 from math import *
+from simulation.chars import RECT, CIRCLE
 
-def collideRectWithRect(rect1, rect2):
-    """Check for collision between two rectangles
+# The directions an entity can move in, in the same order as the ML direction
+# datatype. Batched code refers to a direction by its index in this tuple.
+DIRECTIONS = ('left', 'right', 'up', 'down')
 
-    The rectangles are passed in as tuples with the following format:
-    (centerx, centery, width, height)
+###
+# Collision predicates on raw floats. These do no allocation or attribute
+# lookups, so they are cheap enough for the per-dog, per-tick paths of the AIs.
+###
 
-    Arguments:
-    - `rect1`: Rectangle 1
-    - `rect2`: Rectangle 2
+def rect_rect(x1, y1, w1, h1, x2, y2, w2, h2):
+    """Check for collision between two rectangles given by center and size.
     """
-    if (rect1.getBottom() < rect2.getTop() or
-        rect1.getTop() > rect2.getBottom() or
-        rect1.getRight() < rect2.getLeft() or
-        rect1.getLeft() > rect2.getRight()):
-        return False
-    else:
-        return True
+    return not (y1 + (h1/2.0) < y2 - (h2/2.0) or
+                y1 - (h1/2.0) > y2 + (h2/2.0) or
+                x1 + (w1/2.0) < x2 - (w2/2.0) or
+                x1 - (w1/2.0) > x2 + (w2/2.0))
 
-def collideCircleWithRect(circle, rect):
-    """Check for collision between a circle and a rectongle.
+def circle_rect(cx, cy, radius, rx, ry, rw, rh):
+    """Check for collision between a circle and a rectangle.
 
-    The rectangle has the following format:
-    (centerx, centery, width, height)
-
-    The circle has the following format:
-    (centerx, centery, radius)
-
-    Arguments:
-    - `circle`: The circle to check
-    - `rect`: The rectangle to check
+    The circle is given by center and radius, the rectangle by center and
+    size.
     """
-    (cx, cy) = circle.getPosition()
-    radius = circle.getRadius()
-    (rx, ry) = rect.getPosition()
-    (rw, rh) = rect.getSize()
-
     distance_x = abs(cx - rx)
     distance_y = abs(cy - ry)
     collide_width = rw/2.
@@ -56,24 +44,62 @@ def collideCircleWithRect(circle, rect):
 
     return (square_corner_dist <= radius**2)
 
+def circle_circle(x1, y1, r1, x2, y2, r2):
+    """Check for collision between two circles given by center and radius.
+    """
+    return (x1-x2)**2 + (y1-y2)**2 <= (r1+r2)**2
+
+
+###
+# Collision between shapes
+###
+
+def collideRectWithRect(rect1, rect2):
+    """Check for collision between two rectangles
+
+    Arguments:
+    - `rect1`: Rectangle 1
+    - `rect2`: Rectangle 2
+    """
+    if (rect1.getBottom() < rect2.getTop() or
+        rect1.getTop() > rect2.getBottom() or
+        rect1.getRight() < rect2.getLeft() or
+        rect1.getLeft() > rect2.getRight()):
+        return False
+    else:
+        return True
+
+def collideCircleWithRect(circle, rect):
+    """Check for collision between a circle and a rectangle.
+
+    Arguments:
+    - `circle`: The circle to check
+    - `rect`: The rectangle to check
+    """
+    (rw, rh) = rect.getSize()
+    return circle_rect(circle.x, circle.y, circle.getRadius(),
+                       rect.x, rect.y, rw, rh)
+
 def collideCircleWithCircle(circle1, circle2):
-    sum_radius = circle1.getRadius() + circle2.getRadius()
-    (x1, y1) = circle1.getPosition()
-    (x2, y2) = circle2.getPosition()
-    return (sum_radius <= sqrt((x1-x2)**2 + (y1-y2)**2))
+    return circle_circle(circle1.x, circle1.y, circle1.getRadius(),
+                         circle2.x, circle2.y, circle2.getRadius())
+
+def _collideRectWithCircle(rect, circle):
+    return collideCircleWithRect(circle, rect)
+
+# Collision routines by the type tags of the two shapes
+_COLLIDERS = {
+    (RECT, RECT): collideRectWithRect,
+    (RECT, CIRCLE): _collideRectWithCircle,
+    (CIRCLE, RECT): collideCircleWithRect,
+    (CIRCLE, CIRCLE): collideCircleWithCircle,
+}
 
 def collideShapes(shape1, shape2):
-    if hasattr(shape1,'getSize'):
-        if hasattr(shape2, 'getSize'):
-            return collideRectWithRect(shape1, shape2)
-        elif hasattr(shape2, 'getRadius'):
-            return collideCircleWithRect(shape2, shape1)
-    elif hasattr(shape1, 'getRadius'):
-        if hasattr(shape2, 'getSize'):
-            return collideCircleWithRect(shape1, shape2)
-        elif hasattr(shape2, 'getRadius'):
-            return collidieCircleWithCircle(shape1, shape2)
-    return false
+    collider = _COLLIDERS.get((shape1.TAG, shape2.TAG))
+    if collider is None:
+        return False
+    return collider(shape1, shape2)
 
 def collide(entity1, entity2):
     return collideShapes(entity1.getShape(), entity2.getShape())